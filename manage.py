@@ -8,6 +8,8 @@ from __future__ import (
     absolute_import, division, print_function, with_statement,
     unicode_literals)
 
+import sys
+
 from os import path as p
 from subprocess import call, check_call, CalledProcessError
 from manager import Manager
@@ -80,6 +82,12 @@ def test(where=None, stop=False, tox=False):
     opts = '-xv' if stop else '-v'
     opts += 'w %s' % where if where else ''
 
+    if sys.version_info < (3, 5):
+        # `ongeza.aio` uses `async def`, so its doctests can't be collected.
+        # The option replaces nose's default ignored files, so they're kept.
+        ignored = [r'^\.', r'^_', r'^setup\.py$', r'^aio\.py$']
+        opts += ''.join(' --ignore-files=%s' % regex for regex in ignored)
+
     try:
         if tox:
             check_call('tox')
@@ -90,6 +98,15 @@ def test(where=None, stop=False, tox=False):
         exit(e.returncode)
 
 
+@manager.arg('scale', 's', help='The preset scenarios to run', default='small')
+@manager.arg('output', 'o', help='The results file', default='benchmark.json')
+@manager.command
+def bench(scale='small', output='benchmark.json'):
+    """Time each phase of a bump against generated repos"""
+    script = p.join(BASEDIR, 'tests', 'benchmark.py')
+    exit(call(['python', script, '-s', scale, '-o', output]))
+
+
 @manager.command
 def register():
     """Register package with PyPI"""
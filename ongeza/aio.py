@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.aio
+~~~~~~~~~~
+
+asyncio versions of `Git` and `Project` (Python 3.5+). Independent git
+queries run concurrently as asyncio subprocesses, so many projects can be
+queried and bumped from a single event loop without threads. Query results
+are stored in the snapshot of the wrapped (synchronous) instance, which then
+does the rest of the work without spawning the queries again.
+
+Examples:
+    basic usage::
+
+        >>> import asyncio
+        >>> project = AsyncProject()
+        >>> loop = asyncio.new_event_loop()
+        >>> version = loop.run_until_complete(project.current_version())
+        >>> version == Project().current_version
+        True
+        >>> loop.close()
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import asyncio
+
+from os import path as p
+from asyncio.subprocess import PIPE, DEVNULL
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from .project import Project
+from .git_utils import Git, sort_tags, parse_status, STATUS_ARGS
+from .trace_utils import trace_command
+
+FIELDS = ('current_tag', 'tags', 'files', 'status')
+
+
+class AsyncGit(object):
+    """
+    asyncio version of :class:`ongeza.git_utils.Git`. Attributes that aren't
+    defined here are those of the synchronous instance.
+
+    Attributes:
+        sync (Git): The synchronous instance whose snapshot holds the query
+            results.
+
+    Args:
+        dir_ (str): The git project directory (default: None).
+
+        kwargs (dict): Keyword arguments for the synchronous instance.
+
+    Examples:
+        >>> import asyncio
+        >>> loop = asyncio.new_event_loop()
+        >>> tags = loop.run_until_complete(AsyncGit().tags())
+        >>> tags == Git().tags
+        True
+        >>> loop.close()
+    """
+    sync_class = Git
+
+    def __init__(self, dir_=None, **kwargs):
+        self.sync = self.sync_class(dir_, **kwargs)
+
+    def __getattr__(self, name):
+        if name == 'sync':
+            raise AttributeError(name)
+
+        return getattr(self.sync, name)
+
+    async def run(self, *args):
+        """Runs a git command as an asyncio subprocess
+
+        Args:
+            args (str): The git arguments
+
+        Returns:
+            str: The command output ('' on failure)
+        """
+        sync = self.sync
+
+        if sync.dir and not p.isdir(sync.dir):
+            return ''
+
+        with sync.lock:
+            sync.sh_count += 1
+
+        with trace_command(' '.join(('git',) + args), sync.dir) as info:
+            process = await asyncio.create_subprocess_exec(
+                'git', *args, cwd=sync.dir, stdout=PIPE, stderr=DEVNULL)
+
+            output = (await process.communicate())[0]
+            info.update(status=process.returncode, size=len(output))
+
+        return '' if process.returncode else output.decode('utf-8')
+
+    async def call(self, func, *args):
+        """Runs a synchronous method in the event loop's default executor,
+        so that the git commands it may run don't block the loop
+
+        Args:
+            func (func): The method
+            args: The method's arguments
+
+        Returns:
+            the method's result
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def fetch(self, field, func):
+        """Looks up a snapshot field, filling it in if necessary
+
+        Args:
+            field (str): The field name
+            func (func): A coroutine function which computes the field's value
+
+        Returns:
+            the field's value
+        """
+        found, value, generation = self.sync.state.peek(field)
+
+        if not found:
+            value = await func()
+            self.sync.state.put(field, value, generation)
+
+        return value
+
+    async def prefetch(self, *fields):
+        """Fills in several snapshot fields concurrently
+
+        Args:
+            fields (str): The field names (default: FIELDS)
+        """
+        queries = (getattr(self, field)() for field in fields or FIELDS)
+        await asyncio.gather(*queries)
+
+    async def current_tag(self):
+        """The current git tag (see `Git.current_tag`)
+
+        Returns:
+            str: the tag
+        """
+        return await self.fetch('current_tag', self.find_current_tag)
+
+    async def find_current_tag(self):
+        sync = self.sync
+        match = sync.tag_match
+        tag = sync.refs.current_tag(match) if sync.refs else None
+
+        if not tag:
+            args = ['describe', '--tags', '--abbrev=0']
+            args += ['--match', match] if match else []
+            tag = (await self.run(*args)).strip()
+
+        return tag
+
+    async def tags(self):
+        """The git tags, sorted by version number (see `Git.tags`)
+
+        Returns:
+            List[str]: the tags
+        """
+        return await self.fetch('tags', self.find_tags)
+
+    async def find_tags(self):
+        if self.sync.refs:
+            tags = self.sync.refs.tags()
+        else:
+            tags = (await self.run('tag')).strip().split('\n')
+
+        return sort_tags(tag for tag in tags if tag)
+
+    async def files(self):
+        """The names of all files (see `Git.files`)
+
+        Returns:
+            List[str]: the file names
+        """
+        return await self.fetch('files', self.find_files)
+
+    async def find_files(self):
+        args = ('ls-tree', '--full-tree', '--name-only', '-r', '-z', 'HEAD')
+        output = await self.run(*args)
+        return [name for name in output.split('\0') if name]
+
+    async def status(self):
+        """The status codes of the changed files (see `Git.status`)
+
+        Returns:
+            dict: two letter status codes keyed by file name
+        """
+        return await self.fetch('status', self.find_status)
+
+    async def find_status(self):
+        output = await self.run(*STATUS_ARGS[1:])
+        return parse_status(output.split('\0'))
+
+
+class AsyncProject(AsyncGit):
+    """
+    asyncio version of :class:`ongeza.Project`. Files are scanned and
+    rewritten synchronously (they're read through memory maps, and usually
+    few in number), but the git queries a bump depends on run concurrently.
+
+    Args:
+        dir_ (str): The project directory (default: None).
+
+        kwargs (dict): Keyword arguments for the synchronous instance, e.g.,
+            `tag_fmt` or `via_index`.
+
+    Examples:
+        >>> import asyncio
+        >>> import semver
+        >>> project = AsyncProject()
+        >>> loop = asyncio.new_event_loop()
+        >>> version = loop.run_until_complete(project.ongeza('m'))
+        >>> semver.parse(version)['major'] > semver.parse(project.version)[
+        ...     'major']
+        True
+        >>> loop.close()
+    """
+    sync_class = Project
+
+    async def current_version(self):
+        """The current version parsed from the most recent git tag (see
+        `Project.current_version`)
+
+        Returns:
+            str: the version
+        """
+        await self.current_tag()
+        return self.sync.current_version
+
+    async def versions(self):
+        """All valid versions parsed from the git tags (see
+        `Project.versions`)
+
+        Returns:
+            iterator: valid versions
+        """
+        await self.tags()
+        return self.sync.versions
+
+    async def ongeza(self, type_):
+        """Bumps the project to a new version (see `Project.ongeza`)
+
+        Args:
+            type_ (str): bump type
+
+        Returns:
+            str: new version
+        """
+        await self.current_tag()
+
+        # checking the new version's tag (and inferring the bump type) may
+        # run git
+        return await self.call(self.sync.ongeza, type_)
+
+    async def set_versions(self, new_version, wave=1):
+        """Rewrites the version number in all versioned files (see
+        `Project.set_versions`)
+
+        Args:
+            new_version (str): The new version number
+            wave (int): The set of files to search (default: 1)
+        """
+        # wave 0 only lists the files if its remembered locations are stale
+        fields = ['files'] if wave else []
+        fields += ['status'] if self.sync.via_index else []
+        await self.prefetch('current_tag', *fields)
+        await self.call(self.sync.set_versions, new_version, wave)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.changelog
+~~~~~~~~~~~~~~~~
+
+Generates the changelog section of a release from the commits since the
+previous tag. The commits are streamed from `git log`, and the section is
+written as they arrive, so memory use doesn't depend on the number of
+commits (or the size of the changelog).
+
+Examples:
+    basic usage::
+
+        >>> commits = [('a1', 'Fix the parser', '')]
+        >>> lines = gen_section('1.0.1', commits, '2016-01-01')
+        >>> print(''.join(lines), end='')
+        Version 1.0.1
+        -------------
+        <BLANKLINE>
+        Released on 2016-01-01
+        <BLANKLINE>
+            * Fix the parser
+        <BLANKLINE>
+        <BLANKLINE>
+
+Attributes:
+    HEADING_FMT (str): The section heading format (it is underlined with
+        dashes)
+    RELEASED_FMT (str): The format of the release date line
+    ENTRY_FMT (str): The format of each commit's entry
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import sys
+
+from io import open
+from datetime import date
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from .file_utils import atomic_open, copy_bytes, ENCODING
+
+HEADING_FMT = 'Version {version}'
+RELEASED_FMT = 'Released on {date}'
+
+ENTRY_FMT = '    * {subject}\n'
+
+
+def gen_section(version, commits, released=None):
+    """Generates the lines of a release's changelog section
+
+    Args:
+        version (str): The release version
+        commits (Iter[Tuple[str, str, str]]): The id, subject, and body of
+            each commit of the release (see `Git.gen_log`)
+        released (str): The release date (default: today)
+
+    Yields:
+        str: each line (including its line ending)
+    """
+    released = released or date.today().isoformat()
+    heading = HEADING_FMT.format(version=version)
+    yield '%s\n%s\n\n' % (heading, '-' * len(heading))
+    yield '%s\n\n' % RELEASED_FMT.format(date=released)
+
+    for _, subject, _ in commits:
+        yield ENTRY_FMT.format(subject=subject)
+
+    # sections are separated by two blank lines
+    yield '\n\n'
+
+
+def prepend(filepath, lines):
+    """Writes lines to the top of a file. The lines are written as they are
+    generated, and the previous contents are then copied a chunk at a time.
+    The file is replaced atomically (and created if it doesn't exist).
+
+    Args:
+        filepath (str): The file
+        lines (Iter[str]): The lines to write
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'CHANGES.rst')
+        >>> prepend(filepath, ['b\\n'])
+        >>> prepend(filepath, ['a\\n'])
+        >>> open(filepath).read() == 'a\\nb\\n'
+        True
+    """
+    with atomic_open(filepath) as f:
+        for line in lines:
+            f.write(line.encode(ENCODING))
+
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as src:
+                copy_bytes(src, f)
+
+
+def write_changelog(project, version, filepath=None, out=None):
+    """Writes the changelog section of a project's release, i.e., the
+    commits since the current tag
+
+    Args:
+        project (Project): The project
+        version (str): The release version
+        filepath (str): The changelog file to prepend the section to
+            (default: None, i.e., write to `out`)
+        out (obj): The text stream to write the section to if `filepath`
+            isn't given (default: None, i.e., stdout)
+
+    Returns:
+        int: the number of commits
+    """
+    count = [0]
+
+    def gen_commits():
+        for commit in project.gen_log(project.current_tag or None):
+            count[0] += 1
+            yield commit
+
+    lines = gen_section(version, gen_commits())
+
+    if filepath:
+        prepend(filepath, lines)
+    else:
+        out = out or sys.stdout
+
+        for line in lines:
+            out.write(line)
+            out.flush()
+
+    return count[0]
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.commit_utils
+~~~~~~~~~~~~~~~~~~~
+
+helpers for inferring the bump type from conventional commit messages, e.g.,
+'feat: add a parser' or 'fix(cli)!: drop an option'.
+
+Examples:
+    basic usage::
+
+        >>> commits = [('b2', 'fix: y', ''), ('a1', 'feat: x', '')]
+        >>> infer_type(commits)
+        'n'
+
+Attributes:
+    TYPES (dict): The bump type of each conventional commit type
+    SUBJECT_RE (obj): Compiled regex matching a conventional commit subject
+    BREAKING_RE (obj): Compiled regex matching a breaking change footer
+    RANKS (dict): The rank of each bump type
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import re
+import json
+
+from io import open
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from .file_utils import write_atomic, ENCODING
+
+TYPES = {'feat': 'n', 'fix': 'p', 'perf': 'p'}
+SUBJECT_RE = re.compile(r'(?P<type>\w+)(\([^)]*\))?(?P<breaking>!)?:')
+BREAKING_RE = re.compile(r'^BREAKING[ -]CHANGE:', re.MULTILINE)
+RANKS = {None: 0, 'p': 1, 'n': 2, 'm': 3}
+
+
+def classify(subject, body=''):
+    """The bump type a commit calls for
+
+    Args:
+        subject (str): The commit subject
+        body (str): The commit body (default: '')
+
+    Returns:
+        str: 'm', 'n', or 'p' (or None if the commit doesn't call for a
+            release)
+
+    Examples:
+        >>> classify('feat(api)!: x'), classify('fix: x', 'BREAKING CHANGE: y')
+        ('m', 'm')
+        >>> classify('feat: x'), classify('perf: x'), classify('docs: x')
+        ('n', 'p', None)
+        >>> classify('Merge branch x') is None
+        True
+    """
+    match = SUBJECT_RE.match(subject)
+
+    if match and match.group('breaking') or BREAKING_RE.search(body):
+        return 'm'
+    elif match:
+        return TYPES.get(match.group('type').lower())
+
+
+def infer_type(commits, verdict=None):
+    """The highest bump type a sequence of commits calls for. The commits are
+    consumed only until a major change is found.
+
+    Args:
+        commits (Iter[Tuple[str, str, str]]): The id, subject, and body of
+            each commit (see `Git.gen_log`)
+        verdict (str): The bump type of earlier commits (default: None)
+
+    Returns:
+        str: 'm', 'n', or 'p' (or None if no commit calls for a release)
+
+    Examples:
+        >>> commits = iter([('c3', 'feat!: x', ''), ('b2', 'fix: y', '')])
+        >>> infer_type(commits), next(commits)[0]
+        ('m', 'b2')
+        >>> infer_type([], 'p')
+        'p'
+    """
+    commits = iter([] if verdict == 'm' else commits)
+
+    for _, subject, body in commits:
+        found = classify(subject, body)
+        verdict = found if RANKS[found] > RANKS[verdict] else verdict
+
+        if verdict == 'm':
+            break
+
+    return verdict
+
+
+def load_analysis(filepath):
+    """Loads the cached analysis of the commits since a tag
+
+    Args:
+        filepath (str): The analysis file path
+
+    Returns:
+        dict: the `tag`, the last analyzed commit (`head`), and the `verdict`
+            (empty if the file is missing or invalid)
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'analysis.json')
+        >>> save_analysis(filepath, 'v1.0.0', 'a1', 'n')
+        >>> load_analysis(filepath)['verdict'] == 'n'
+        True
+        >>> load_analysis('/nonexistent') == {}
+        True
+    """
+    try:
+        with open(filepath, encoding=ENCODING) as f:
+            analysis = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    keys = {'tag', 'head', 'verdict'}
+    is_valid = isinstance(analysis, dict) and keys.issubset(analysis)
+    return analysis if is_valid and analysis['verdict'] in RANKS else {}
+
+
+def save_analysis(filepath, tag, head, verdict):
+    """Caches the analysis of the commits since a tag
+
+    Args:
+        filepath (str): The analysis file path
+        tag (str): The tag
+        head (str): The last analyzed commit
+        verdict (str): The bump type
+    """
+    dirname = os.path.dirname(filepath)
+    analysis = {'tag': tag, 'head': head, 'verdict': verdict}
+
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        write_atomic(filepath, json.dumps(analysis))
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.daemon
+~~~~~~~~~~~~~
+
+A long-running server (`ongeza serve`) which keeps a warm `Project` per
+repository and answers version queries and bumps over a local Unix socket,
+along with the thin client `bin/ongeza` uses to forward commands to it.
+
+Each request is a single line of JSON holding the parsed ongeza options,
+and each response a single line of JSON holding the exit code and the
+messages to print. Requests for the same repository (whatever their
+options) are serialized. Before each request, the repository's refs are
+checked for changes (natively, without spawning git), and the cached state
+is dropped if they changed.
+
+Examples:
+    basic usage::
+
+        >>> forward(['-t', 'p'], '/nonexistent.sock') is None
+        True
+
+Attributes:
+    SOCKET_PATH (str): The default socket path
+    LOCAL_OPTIONS (List[str]): Options which are never forwarded
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import sys
+import json
+
+from os import path as p
+from threading import Lock
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+SOCKET_PATH = os.getenv('ONGEZA_SOCKET') or p.join(
+    os.getenv('XDG_RUNTIME_DIR') or '/tmp',
+    'ongeza-%i.sock' % getattr(os, 'getuid', lambda: 0)())
+
+LOCAL_OPTIONS = [
+    'version', 'monorepo', 'stash', 'index', 'changelog', 'trace',
+    'trace_file', 'profile']
+
+# `socket`, `socketserver`, and the rest of ongeza are imported on first
+# use, since `forward` runs before every command
+
+
+def request(socket_path, content):
+    """Sends a request to the daemon
+
+    Args:
+        socket_path (str): The daemon's socket path
+        content (dict): The request
+
+    Returns:
+        dict: the response
+
+    Raises:
+        socket.error: If the daemon can't be reached
+    """
+    import socket
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(content).encode('utf-8') + b'\n')
+
+        with client.makefile('rb') as f:
+            line = f.readline()
+    finally:
+        client.close()
+
+    return json.loads(line.decode('utf-8'))
+
+
+def forward(argv, socket_path=None):
+    """Forwards a command to the daemon if it's running
+
+    Args:
+        argv (List[str]): The ongeza command line options
+        socket_path (str): The daemon's socket path (default: SOCKET_PATH)
+
+    Returns:
+        int: the command's exit code (or None if the command wasn't
+            forwarded, i.e., the daemon isn't running or the command uses a
+            `LOCAL_OPTIONS` option)
+    """
+    socket_path = socket_path or SOCKET_PATH
+
+    if argv[:1] == ['serve'] or not p.exists(socket_path):
+        return None
+
+    import socket
+    from . import main
+
+    args = main.get_parser().parse_args(argv)
+
+    if any(getattr(args, name) for name in LOCAL_OPTIONS):
+        return None
+
+    args.dir = p.abspath(args.dir or os.getcwd())
+
+    try:
+        response = request(socket_path, {'args': vars(args)})
+    except socket.error:
+        # not listening, e.g., a stale socket
+        return None
+
+    for level, message in response['messages']:
+        out = sys.stderr if level in {'error', 'warning'} else sys.stdout
+        print(message, file=out)
+
+    return response['code']
+
+
+class MessageLog(object):
+    """
+    A stand-in for a project's logger which records the messages of one
+    request.
+
+    Args:
+        verbose (bool): Record debug messages (default: False)
+
+    Examples:
+        >>> log = MessageLog()
+        >>> log.info('Bumped to %s.', '1.0.1')
+        >>> log.messages == [('info', 'Bumped to 1.0.1.')]
+        True
+    """
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.messages = []
+
+    def log(self, level, message, *args):
+        message = '%s' % message
+        self.messages.append((level, message % args if args else message))
+
+    def debug(self, message, *args):
+        if self.verbose:
+            self.log('debug', message, *args)
+
+    def info(self, message, *args):
+        self.log('info', message, *args)
+
+    def warning(self, message, *args):
+        self.log('warning', message, *args)
+
+    def error(self, message, *args):
+        self.log('error', message, *args)
+
+
+class Repo(object):
+    """
+    A repository's warm project and the lock serializing its requests.
+
+    Args:
+        project (Project): The project
+        lock (Lock): The lock shared by every project of the repository's
+            directory (default: None, i.e., a new lock)
+    """
+    def __init__(self, project, lock=None):
+        self.project = project
+        self.lock = lock or Lock()
+        self.key = None
+
+    def watch(self):
+        """The state of the refs, i.e., the tags fingerprint and HEAD (or
+        None if the refs can't be read natively)"""
+        refs = self.project.refs
+        return (refs.fingerprint(), refs.head()) if refs else None
+
+    def prepare(self):
+        """Readies the project for a request. Everything is forgotten if the
+        refs changed (the version index is revalidated on its own), but the
+        working tree status is always reread.
+
+        Returns:
+            Project: the project
+        """
+        from .git_utils import WORKTREE_FIELDS
+
+        project = self.project
+        key = self.watch()
+
+        if key is None or key != self.key:
+            project.refresh()
+            project.version = None
+        else:
+            project.refresh(*WORKTREE_FIELDS)
+
+        project.bumped, project.bumped_files = False, []
+        return project
+
+    def settle(self):
+        """Records the state of the refs after a request"""
+        if self.project.bumped:
+            self.project.version = None
+
+        self.key = self.watch()
+
+
+def respond(repos, content, locks=None):
+    """Answers a request
+
+    Args:
+        repos (dict): The warm repositories keyed by directory and options
+            (updated in place)
+        content (dict): The request
+        locks (dict): The locks keyed by directory (updated in place). The
+            projects of a directory share its lock, since they all write to
+            the same working tree and refs (default: None, i.e., a lock per
+            project).
+
+    Returns:
+        dict: the response
+    """
+    from argparse import Namespace
+    from . import main
+    from .git_utils import logger
+
+    if 'args' not in content:
+        # a ping
+        return {'code': 0, 'messages': []}
+
+    args = Namespace(**content['args'])
+    options = [
+        'dir', 'file', 'tag_format', 'max_scan_size', 'scan_workers',
+        'persistent']
+    key = tuple(getattr(args, option) for option in options)
+    log = MessageLog(args.verbose)
+    locks = {} if locks is None else locks
+    code = 0
+
+    repo = repos.get(key)
+
+    if repo is None:
+        # `setdefault` is atomic, so racing requests share one repo (and
+        # one lock)
+        lock = locks.setdefault(args.dir, Lock())
+        repo = repos.setdefault(key, Repo(main.make_project(args), lock))
+
+    with repo.lock:
+        project = repo.prepare()
+        project.logger = log
+
+        try:
+            if not main.prelim_check(project, args):
+                main.bump(project, args)
+        except Exception as err:
+            log.error(err)
+            code = 1
+        finally:
+            project.logger = logger
+            repo.settle()
+
+    return {'code': code, 'messages': log.messages}
+
+
+def make_server(socket_path=None):
+    """Creates the daemon's server
+
+    Args:
+        socket_path (str): The socket path (default: SOCKET_PATH)
+
+    Returns:
+        obj: the server (call `serve_forever` to start serving)
+    """
+    try:
+        from socketserver import (
+            ThreadingMixIn, UnixStreamServer, StreamRequestHandler)
+    except ImportError:
+        from SocketServer import (
+            ThreadingMixIn, UnixStreamServer, StreamRequestHandler)
+
+    class Handler(StreamRequestHandler):
+        def handle(self):
+            content = json.loads(self.rfile.readline().decode('utf-8'))
+            server = self.server
+            response = respond(server.repos, content, server.locks)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    class Server(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, socket_path):
+            self.repos, self.locks = {}, {}
+            UnixStreamServer.__init__(self, socket_path, Handler)
+
+    return Server(socket_path or SOCKET_PATH)
+
+
+def serve(socket_path=None):
+    """Serves requests until interrupted
+
+    Args:
+        socket_path (str): The socket path (default: SOCKET_PATH)
+    """
+    import socket
+
+    socket_path = socket_path or SOCKET_PATH
+
+    if p.exists(socket_path):
+        try:
+            request(socket_path, {})
+        except (socket.error, ValueError):
+            # a stale socket (or something other than a daemon)
+            os.remove(socket_path)
+        else:
+            raise RuntimeError('Already serving on %s' % socket_path)
+
+    import signal
+
+    umask = os.umask(0o077)
+
+    try:
+        server = make_server(socket_path)
+    finally:
+        os.umask(umask)
+
+    # removes the socket when terminated
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def run(argv=None):
+    """Runs `ongeza serve`
+
+    Args:
+        argv (List[str]): The command line options (default: sys.argv[2:])
+
+    Returns:
+        int: the exit code
+    """
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description=(
+            'Serve version queries and bumps from warm caches over a Unix '
+            'socket. `ongeza` forwards commands to the daemon while it is '
+            'running.'),
+        prog='ongeza serve')
+
+    parser.add_argument(
+        dest='socket', nargs='?', default=SOCKET_PATH,
+        help='the socket path (default: %s)' % SOCKET_PATH)
+
+    args = parser.parse_args(sys.argv[2:] if argv is None else argv)
+
+    try:
+        serve(args.socket)
+    except RuntimeError as err:
+        print(err, file=sys.stderr)
+        return 1
+
+    return 0
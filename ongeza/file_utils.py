@@ -0,0 +1,643 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.file_utils
+~~~~~~~~~~~~~~~~~
+
+helpers for locating and rewriting version strings in files.
+
+Examples:
+    basic usage::
+
+        >>> lines = ['name = "ongeza"', 'version = "1.0.1"']
+        >>> find_version_line(lines)
+        1
+
+Attributes:
+    ENCODING (str): The file encoding
+    VERSION_RE (obj): Compiled regex matching an x.y.z version (with the same
+        semantics as the `sed` expression it replaces)
+    MAX_SCAN_SIZE (int): The default maximum number of bytes of each file to
+        search for a version number
+    CHUNK_SIZE (int): The number of bytes to copy at a time
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import re
+import json
+
+from io import open
+from mmap import mmap, ACCESS_READ
+from fnmatch import translate
+from contextlib import contextmanager, closing
+from builtins import *  # noqa pylint: disable=unused-import
+
+try:
+    from os import replace
+except ImportError:
+    from os import rename as replace
+
+ENCODING = 'utf-8'
+VERSION_RE = re.compile(r'[0-9]*\.[0-9]*\.[0-9]*')
+VERSION_BYTES_RE = re.compile(VERSION_RE.pattern.encode('ascii'))
+MAX_SCAN_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class FileMatcher(object):
+    """
+    Matches file names against several numbered sets (waves) of glob
+    patterns with a single compiled regex.
+
+    Args:
+        waves (dict): glob patterns keyed by wave number
+
+    Examples:
+        >>> matcher = FileMatcher({1: ['setup.py'], 2: ['*.py', '*.json']})
+        >>> matcher.match('setup.py'), matcher.match('README')
+        ([1, 2], [])
+    """
+    def __init__(self, waves):
+        self.waves = sorted(waves)
+        self.patterns = waves
+        self._regex = None
+
+    @property
+    def regex(self):
+        """The combined regex (compiled on first use)"""
+        if self._regex is None:
+            groups = (
+                '(?=(?P<w%i>%s))?' % (w, '|'.join(map(translate, patterns)))
+                for w, patterns in sorted(self.patterns.items()))
+
+            self._regex = re.compile(''.join(groups))
+
+        return self._regex
+
+    def match(self, name):
+        """The waves whose patterns match a file name
+
+        Args:
+            name (str): The file name
+
+        Returns:
+            List[int]: the matching waves
+        """
+        match = self.regex.match(name)
+        return [w for w in self.waves if match.group('w%i' % w) is not None]
+
+    def bucket(self, names, key=None):
+        """Groups file names by wave in a single pass. A file name matching
+        several waves appears in each of them.
+
+        Args:
+            names (Iter[str]): The file names
+            key (func): Function that transforms a file name into the name
+                to match (default: None)
+
+        Returns:
+            dict: matching file names keyed by wave
+
+        Examples:
+            >>> matcher = FileMatcher({1: ['setup.py'], 2: ['*.py']})
+            >>> buckets = matcher.bucket(['setup.py', 'a.py', 'README'])
+            >>> buckets == {1: ['setup.py'], 2: ['setup.py', 'a.py']}
+            True
+        """
+        buckets = dict((wave, []) for wave in self.waves)
+
+        for name in names:
+            for wave in self.match(key(name) if key else name):
+                buckets[wave].append(name)
+
+        return buckets
+
+
+def find_version_line(lines):
+    """Finds the first line containing the word 'version' and a version
+    number.
+
+    Args:
+        lines (Seq[str]): The lines to search
+
+    Returns:
+        int: The index of the matching line (or None)
+
+    Examples:
+        >>> find_version_line(['version: 1.0', 'version = 1.0.1'])
+        1
+        >>> find_version_line(['1.0.1']) is None
+        True
+    """
+    for num, line in enumerate(lines):
+        if 'version' in line and VERSION_RE.search(line):
+            return num
+
+
+def replace_version(lines, new_version, version=None):
+    """Replaces the version number in a sequence of lines.
+
+    If `version` is given, every occurrence of it on a line containing the
+    word 'version' is replaced. Otherwise, every version number on the first
+    line containing the word 'version' and a version number is replaced.
+
+    Args:
+        lines (List[str]): The lines to update (modified in place)
+        new_version (str): The new version number
+        version (str): The current version number (default: None)
+
+    Returns:
+        bool: True if any line was changed
+
+    Examples:
+        >>> lines = ['version = "1.0.1"', 'release = "1.0.1"']
+        >>> replace_version(lines, '1.1.0', '1.0.1')
+        True
+        >>> lines == ['version = "1.1.0"', 'release = "1.0.1"']
+        True
+        >>> replace_version(lines, '2.0.0')
+        True
+        >>> lines[0] == 'version = "2.0.0"'
+        True
+        >>> replace_version(lines, '2.0.0', '9.9.9')
+        False
+    """
+    changed = False
+
+    if version:
+        current_re = re.compile(re.escape(version))
+
+        for num, line in enumerate(lines):
+            if 'version' in line and version in line:
+                lines[num] = current_re.sub(new_version, line)
+                changed = changed or lines[num] != line
+    else:
+        num = find_version_line(lines)
+
+        if num is not None:
+            line = lines[num]
+            lines[num] = VERSION_RE.sub(new_version, line)
+            changed = lines[num] != line
+
+    return changed
+
+
+@contextmanager
+def atomic_open(filepath, mode='wb', **kwargs):
+    """Opens a temporary file which atomically replaces a file (preserving
+    its mode) once closed. The file is left untouched if an error occurs.
+
+    Args:
+        filepath (str): The file to replace
+        mode (str): The file mode (default: 'wb')
+        kwargs (dict): Keyword arguments passed to `NamedTemporaryFile`
+
+    Yields:
+        obj: the temporary file
+    """
+    from shutil import copymode
+    from tempfile import NamedTemporaryFile
+
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    f = NamedTemporaryFile(dir=dirname, delete=False, mode=mode, **kwargs)
+
+    try:
+        with f:
+            yield f
+
+        if os.path.exists(filepath):
+            copymode(filepath, f.name)
+
+        replace(f.name, filepath)
+    except BaseException:
+        os.remove(f.name)
+        raise
+
+
+def write_atomic(filepath, text):
+    """Atomically replaces the contents of a file, preserving its mode.
+
+    Args:
+        filepath (str): The file to write
+        text (str): The new contents
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'file.txt')
+        >>> _ = open(filepath, 'w').write('old')
+        >>> write_atomic(filepath, 'new')
+        >>> open(filepath).read() == 'new'
+        True
+    """
+    with atomic_open(filepath, 'w', encoding=ENCODING, newline='') as f:
+        f.write(text)
+
+
+def copy_bytes(src, dst, size=None, chunk_size=CHUNK_SIZE):
+    """Copies bytes from one file object to another a chunk at a time.
+
+    Args:
+        src (obj): The file object to read from
+        dst (obj): The file object to write to
+        size (int): The number of bytes to copy (default: None, i.e., until
+            the end of `src`)
+        chunk_size (int): The number of bytes to copy at a time
+
+    Examples:
+        >>> from io import BytesIO
+        >>> src, dst = BytesIO(b'abcdef'), BytesIO()
+        >>> copy_bytes(src, dst, 4, 3)
+        >>> copy_bytes(src, dst)
+        >>> dst.getvalue() == b'abcdef'
+        True
+    """
+    while size is None or size > 0:
+        chunk = src.read(chunk_size if size is None else min(chunk_size, size))
+
+        if not chunk:
+            break
+
+        dst.write(chunk)
+        size = None if size is None else size - len(chunk)
+
+
+def qualifies(data, start, end, version=None):
+    """Checks whether a line of a buffer holds a version number, i.e., it
+    contains the word 'version' and either `version` or any version number.
+
+    Args:
+        data (bytes): The buffer
+        start (int): The offset of the line
+        end (int): The offset of the end of the line
+        version (str): The current version number (default: None)
+
+    Returns:
+        bool: True if the line holds a version number
+
+    Examples:
+        >>> qualifies(b'version: 1.0.1', 0, 14), qualifies(b'1.0.1', 0, 5)
+        (True, False)
+    """
+    if data.find(b'version', start, end) == -1:
+        return False
+    elif version:
+        return data.find(version.encode(ENCODING), start, end) != -1
+    else:
+        return bool(VERSION_BYTES_RE.search(data, start, end))
+
+
+def scan_version(data, version=None, max_size=MAX_SCAN_SIZE):
+    """Finds the lines to rewrite in a buffer without decoding it. The same
+    lines as `replace_version` are found, but unlike it, the search jumps
+    directly between candidate lines and stops at the first qualifying line
+    if `version` isn't given.
+
+    Args:
+        data (bytes): The buffer to search, e.g., a memory mapped file
+        version (str): The current version number (default: None)
+        max_size (int): The maximum number of bytes to search (default:
+            MAX_SCAN_SIZE). A line starting before the limit is still found
+            in full.
+
+    Returns:
+        List[Tuple[int, int]]: the (start, end) byte offsets of each line
+
+    Examples:
+        >>> data = b'name: x\\nversion: 1.0.1\\nversion: 1.0.1\\n'
+        >>> scan_version(data), scan_version(data, '1.0.1')
+        ([(8, 22)], [(8, 22), (23, 37)])
+        >>> scan_version(data, max_size=8)
+        []
+    """
+    size = len(data)
+    limit = min(size, max_size) if max_size else size
+    needle = version.encode(ENCODING) if version else b'version'
+    spans = []
+    pos = data.find(needle, 0, limit)
+
+    while pos != -1:
+        start = data.rfind(b'\n', 0, pos) + 1
+        end = data.find(b'\n', pos)
+        end = size if end == -1 else end
+
+        if qualifies(data, start, end, version):
+            spans.append((start, end))
+
+            if not version:
+                break
+
+        pos = data.find(needle, end, limit)
+
+    return spans
+
+
+def check_lines(data, offsets, version=None):
+    """Finds the lines starting at the given offsets of a buffer, provided
+    each of them still holds a version number (see `qualifies`).
+
+    Args:
+        data (bytes): The buffer to search
+        offsets (Iter[int]): The byte offsets of the lines
+        version (str): The current version number (default: None)
+
+    Returns:
+        List[Tuple[int, int]]: the (start, end) byte offsets of each line (or
+            None if any line doesn't hold a version number)
+
+    Examples:
+        >>> data = b'name: x\\nversion: 1.0.1\\n'
+        >>> check_lines(data, [8])
+        [(8, 22)]
+        >>> check_lines(data, [0]) is check_lines(data, [9]) is None
+        True
+    """
+    size = len(data)
+    spans = []
+
+    for start in offsets:
+        if not 0 <= start < size:
+            return None
+        elif start and data[start - 1:start] != b'\n':
+            return None
+
+        end = data.find(b'\n', start)
+        end = size if end == -1 else end
+
+        if not qualifies(data, start, end, version):
+            return None
+
+        spans.append((start, end))
+
+    return spans
+
+
+def gen_edits(data, spans, new_version, version=None):
+    """Generates the rewritten lines of a buffer. See `replace_version` for
+    details.
+
+    Args:
+        data (bytes): The buffer
+        spans (Iter[Tuple[int, int]]): The (start, end) byte offsets of the
+            lines to rewrite, e.g., from `scan_version`
+        new_version (str): The new version number
+        version (str): The current version number (default: None)
+
+    Yields:
+        Tuple[int, int, bytes]: the (start, end) byte offsets of the line and
+            its new contents
+
+    Examples:
+        >>> data = b'version: 1.0.1\\n'
+        >>> edits = gen_edits(data, scan_version(data), '1.0.10')
+        >>> list(edits) == [(0, 14, b'version: 1.0.10')]
+        True
+    """
+    for start, end in spans:
+        lines = [data[start:end].decode(ENCODING)]
+
+        if replace_version(lines, new_version, version):
+            yield start, end, lines[0].encode(ENCODING)
+
+
+def find_edits(filepath, new_version, version=None, **kwargs):
+    """Finds the edits that rewrite the version number of a file. The file is
+    memory mapped and searched without reading it into memory.
+
+    Args:
+        filepath (str): The file to search
+        new_version (str): The new version number
+        version (str): The current version number (default: None). See
+            `replace_version` for details.
+
+    Kwargs:
+        max_size (int): The maximum number of bytes to search (default:
+            MAX_SCAN_SIZE)
+        offsets (List[int]): Only rewrite the lines starting at these byte
+            offsets, e.g., from a previous `apply_edits`. No edits are found
+            unless each of these lines can be rewritten (default: None).
+        locate (func): Finds the lines to rewrite, e.g., a format specific
+            locator's `scan` (default: `scan_version`)
+
+    Returns:
+        List[Tuple[int, int, bytes]]: the edits (see `gen_edits`)
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'setup.py')
+        >>> _ = open(filepath, 'w').write("setup(version='1.0.1')\\n")
+        >>> edits = find_edits(filepath, '1.0.2')
+        >>> edits == [(0, 22, b"setup(version='1.0.2')")]
+        True
+        >>> find_edits(filepath, '1.0.2', offsets=[0, 5])
+        []
+    """
+    max_size = kwargs.get('max_size', MAX_SCAN_SIZE)
+    offsets = kwargs.get('offsets')
+    locate = kwargs.get('locate', scan_version)
+
+    try:
+        with open(filepath, 'rb') as f:
+            # mmap raises a ValueError for empty files
+            with closing(mmap(f.fileno(), 0, access=ACCESS_READ)) as data:
+                if offsets is None:
+                    spans = locate(data, version, max_size)
+                else:
+                    spans = check_lines(data, offsets, version) or []
+
+                edits = list(gen_edits(data, spans, new_version, version))
+    except (IOError, OSError, ValueError):
+        return []
+
+    return [] if offsets and len(edits) < len(offsets) else edits
+
+
+def bounded_map(func, items, workers=None, processes=False):
+    """Like `map`, but spreads the calls over a pool of workers. At most
+    twice as many calls as workers are in flight at a time, and the results
+    are yielded in the order of the items (whichever call finishes first).
+    If the caller stops early, the calls which haven't started are
+    cancelled.
+
+    Args:
+        func (func): The function to call. With `processes`, it (and the
+            items) must be picklable, e.g., a module level function or a
+            `functools.partial` of one.
+        items (Iter): The arguments of each call
+        workers (int): The number of workers (default: None, i.e., call
+            `func` in the current thread)
+        processes (bool): Use a process pool instead of a thread pool
+            (default: False)
+
+    Yields:
+        the result of each call
+
+    Examples:
+        >>> list(bounded_map(abs, [-2, 1, -3], 2))
+        [2, 1, 3]
+        >>> results = bounded_map(abs, iter([-2, 1, -3]), 4, True)
+        >>> next(results)
+        2
+        >>> results.close()
+    """
+    if not workers or workers < 2:
+        for item in items:
+            yield func(item)
+
+        return
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    Executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    pending = deque()
+
+    with Executor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def apply_edits(filepath, edits):
+    """Applies edits to a file. The file is atomically replaced by a copy
+    made a chunk at a time, so it is never left partially edited.
+
+    Args:
+        filepath (str): The file to update
+        edits (List[Tuple[int, int, bytes]]): The edits (see `find_edits`)
+
+    Returns:
+        List[int]: the byte offsets of the edited lines in the updated file
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'setup.cfg')
+        >>> _ = open(filepath, 'w').write('version = 1.0.9\\nversion = 1.0.9')
+        >>> apply_edits(filepath, find_edits(filepath, '1.0.10', '1.0.9'))
+        [0, 17]
+        >>> open(filepath).read() == 'version = 1.0.10\\nversion = 1.0.10'
+        True
+    """
+    offsets, delta = [], 0
+
+    for start, end, new in edits:
+        offsets.append(start + delta)
+        delta += len(new) - (end - start)
+
+    if edits:
+        with atomic_open(filepath) as dst, open(filepath, 'rb') as src:
+            pos = 0
+
+            for start, end, new in edits:
+                copy_bytes(src, dst, start - pos)
+                dst.write(new)
+                src.seek(end)
+                pos = end
+
+            copy_bytes(src, dst)
+
+    return offsets
+
+
+def rewrite_version(
+        filepath, new_version, version=None, max_size=MAX_SCAN_SIZE):
+    """Rewrites the version number of a file, searching and writing only as
+    much of it as needed. See `find_edits` and `apply_edits` for details.
+
+    Args:
+        filepath (str): The file to update
+        new_version (str): The new version number
+        version (str): The current version number (default: None). See
+            `replace_version` for details.
+        max_size (int): The maximum number of bytes to search (default:
+            MAX_SCAN_SIZE)
+
+    Returns:
+        bool: True if the file was changed
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'setup.py')
+        >>> _ = open(filepath, 'w').write("setup(version='1.0.1')\\n")
+        >>> rewrite_version(filepath, '1.0.2')
+        True
+        >>> open(filepath).read() == "setup(version='1.0.2')\\n"
+        True
+        >>> rewrite_version(filepath, '1.0.10', '1.0.2')
+        True
+        >>> open(filepath).read() == "setup(version='1.0.10')\\n"
+        True
+        >>> rewrite_version(filepath, '1.0.3', '9.9.9')
+        False
+    """
+    edits = find_edits(filepath, new_version, version, max_size=max_size)
+    return bool(apply_edits(filepath, edits))
+
+
+def load_locations(filepath):
+    """Loads the remembered version locations
+
+    Args:
+        filepath (str): The locations file path
+
+    Returns:
+        dict: the `locations`, i.e., lists of line offsets keyed by file name,
+            and the commit they were found in (`head`). Empty if the file is
+            missing or invalid.
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = os.path.join(mkdtemp(), 'ongeza', 'locations.json')
+        >>> save_locations(filepath, {'setup.py': [10]}, 'a1')
+        >>> cached = load_locations(filepath)
+        >>> cached['locations'] == {'setup.py': [10]}, cached['head'] == 'a1'
+        (True, True)
+        >>> load_locations('/nonexistent') == {}
+        True
+    """
+    try:
+        with open(filepath, encoding=ENCODING) as f:
+            cached = json.load(f)
+            items = cached['locations'].items()
+    except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+    def is_valid(offsets):
+        is_list = isinstance(offsets, list)
+        return is_list and all(isinstance(o, int) for o in offsets)
+
+    locations = dict(item for item in items if is_valid(item[1]))
+    return {'locations': locations, 'head': cached.get('head')}
+
+
+def save_locations(filepath, locations, head=None):
+    """Remembers where the version numbers were found
+
+    Args:
+        filepath (str): The locations file path
+        locations (dict): lists of line offsets keyed by file name
+        head (str): The commit the files were read from (default: None)
+    """
+    dirname = os.path.dirname(filepath)
+    cached = {'locations': locations, 'head': head}
+
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        write_atomic(filepath, json.dumps(cached))
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.fleet
+~~~~~~~~~~~~
+
+Query or bump many repositories in one invocation. Each repository is
+processed by a worker pool and reported as a single line of JSON.
+
+Examples:
+    basic usage::
+
+        >>> from io import StringIO
+        >>> out = StringIO()
+        >>> run_fleet(['.'], [], jobs=1, out=out)
+        0
+        >>> result = json.loads(out.getvalue())
+        >>> result['status'] == 'ok', bool(result['version'])
+        (True, True)
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import sys
+import json
+
+from io import open
+from os import path as p
+from timeit import default_timer as timer
+from multiprocessing import Pool
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from . import main
+from .git_utils import logger
+
+_parser = None
+
+
+def get_parser():
+    """The command line parser. It is built on first use (and then reused)
+    rather than at import time.
+
+    Returns:
+        obj: the parser
+    """
+    global _parser
+
+    if not _parser:
+        _parser = make_parser()
+
+    return _parser
+
+
+def make_parser():
+    """Builds the command line parser
+
+    Returns:
+        obj: the parser
+    """
+    from argparse import RawTextHelpFormatter, ArgumentParser
+
+    parser = ArgumentParser(
+        description=(
+            "description: run ongeza over many repositories at once.\n"
+            "Options after `--` are passed to ongeza for each repository, "
+            "e.g.,\n\n  ongeza-fleet -M repos.txt -r results.jsonl -- -tp -T"
+            "\n\nOne line of JSON is printed per repository."),
+        prog='ongeza-fleet',
+        usage='%(prog)s [options] [<dir> ...] [-- <ongeza options>]',
+        formatter_class=RawTextHelpFormatter)
+
+    parser.add_argument(
+        dest='dirs', nargs='*', metavar='dir',
+        help='the repository directories')
+
+    parser.add_argument(
+        '-M', '--manifest', action='store', metavar='FILE',
+        help='a file listing one repository directory per line')
+
+    parser.add_argument(
+        '-j', '--jobs', action='store', type=int, metavar='NUM',
+        help='the number of worker processes (default: number of CPUs)')
+
+    parser.add_argument(
+        '-r', '--resume', action='store', metavar='FILE',
+        help=(
+            'a JSON lines results file. Repositories that already succeeded '
+            'are skipped,\nand new results are appended.'))
+
+    return parser
+
+
+def read_manifest(filepath):
+    """Reads a manifest of repository directories, ignoring blank lines and
+    comments. Relative paths are relative to the manifest.
+
+    Args:
+        filepath (str): The manifest file path
+
+    Returns:
+        List[str]: the directories
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = p.join(mkdtemp(), 'repos.txt')
+        >>> _ = open(filepath, 'w').write('/a\\n\\n# skip\\n/b\\n')
+        >>> read_manifest(filepath) == ['/a', '/b']
+        True
+    """
+    base = p.dirname(p.abspath(filepath))
+
+    with open(filepath, encoding='utf-8') as f:
+        lines = (line.strip() for line in f)
+        dirs = [line for line in lines if line and not line.startswith('#')]
+
+    return [p.normpath(p.join(base, d)) for d in dirs]
+
+
+def read_finished(filepath):
+    """Reads the repositories that already succeeded from a results file
+
+    Args:
+        filepath (str): The results file path
+
+    Returns:
+        Set[str]: the repository directories
+
+    Examples:
+        >>> read_finished('/nonexistent') == set()
+        True
+    """
+    finished = set()
+
+    try:
+        with open(filepath, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # the last line may be truncated by a crash
+                    continue
+
+                if result.get('status') == 'ok':
+                    finished.add(result['dir'])
+    except (IOError, OSError):
+        pass
+
+    return finished
+
+
+def process(dir_, argv):
+    """Queries or bumps a single repository
+
+    Args:
+        dir_ (str): The repository directory
+        argv (List[str]): The ongeza command line options
+
+    Returns:
+        dict: the result
+    """
+    start = timer()
+    result = {'dir': dir_, 'status': 'ok', 'version': None}
+
+    try:
+        if not p.isdir(dir_):
+            raise RuntimeError('No such directory: %s' % dir_)
+
+        args = main.get_parser().parse_args(list(argv) + [dir_])
+
+        if args.monorepo:
+            raise RuntimeError("`--monorepo` isn't supported by ongeza-fleet.")
+
+        project = main.make_project(args)
+
+        try:
+            result['version'] = project.version
+
+            if not main.prelim_check(project, args):
+                result['new_version'] = main.bump(project, args)
+            elif not (project.version or args.version):
+                result['status'] = 'error'
+                result['error'] = 'No valid versions found.'
+        finally:
+            project.close()
+    except SystemExit:
+        result.update(status='error', error='Invalid ongeza options.')
+    except Exception as err:
+        result.update(status='error', error=str(err))
+
+    result['elapsed'] = round(timer() - start, 4)
+    return result
+
+
+def _process(job):
+    return process(*job)
+
+
+def quiet():
+    # keep the JSON output clean
+    logger.disabled = True
+
+
+def run_fleet(dirs, argv, jobs=None, resume=None, out=None):
+    """Queries or bumps many repositories, writing one JSON line per
+    repository as soon as it finishes.
+
+    Args:
+        dirs (Iter[str]): The repository directories
+        argv (List[str]): The ongeza command line options
+        jobs (int): The number of worker processes (default: None, i.e.,
+            number of CPUs). A value of 1 processes repositories in the
+            current process.
+        resume (str): A JSON lines results file. Repositories that already
+            succeeded are skipped and new results are appended
+            (default: None).
+        out (obj): File-like object to write results to (default: stdout)
+
+    Returns:
+        int: the number of failed repositories
+    """
+    out = out or sys.stdout
+    finished = read_finished(resume) if resume else set()
+    dirs = [p.abspath(d) for d in dirs]
+    jobs_ = [(d, argv) for d in dirs if d not in finished]
+    failures = 0
+    results_file = open(resume, 'a', encoding='utf-8') if resume else None
+
+    if jobs == 1:
+        quiet()
+        pool, results = None, (_process(job) for job in jobs_)
+    else:
+        pool = Pool(jobs, initializer=quiet)
+        results = pool.imap_unordered(_process, jobs_)
+
+    try:
+        for result in results:
+            line = json.dumps(result, sort_keys=True)
+            failures += result['status'] != 'ok'
+            out.write('%s\n' % line)
+            out.flush()
+
+            if results_file:
+                results_file.write('%s\n' % line)
+                results_file.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+        if results_file:
+            results_file.close()
+
+        logger.disabled = False
+
+    return failures
+
+
+def run():
+    argv = sys.argv[1:]
+    pos = argv.index('--') if '--' in argv else len(argv)
+    parser = get_parser()
+    args = parser.parse_args(argv[:pos])
+    dirs = args.dirs + (read_manifest(args.manifest) if args.manifest else [])
+
+    if not dirs:
+        parser.error('no repositories given')
+
+    failures = run_fleet(dirs, argv[pos + 1:], args.jobs, args.resume)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -18,31 +18,670 @@ from __future__ import (
     absolute_import, division, print_function, with_statement,
     unicode_literals)
 
-from functools import partial, cmp_to_key
+import re
 
-import semver
-import pygogo as gogo
+from os import path as p
+from fnmatch import fnmatch
+from collections import deque
+from threading import Lock, RLock
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
 
 from builtins import *  # noqa pylint: disable=unused-import
-from .shell_utils import sh
+from .shell_utils import sh, stream
+from .trace_utils import trace_command
+from .ref_utils import RefReader
+from .version_utils import VersionIndex, tag_key
+
+TAG_REF_FMT = (
+    '%(objectname) %(*objectname) %(objecttype) %(creatordate:unix) '
+    '%(refname)')
+
+STATUS_ARGS = [
+    'git', 'status', '--porcelain', '-z', '--untracked-files=no',
+    '--no-renames']
+
+# a ref line of `git push --porcelain`: flag, refspec, summary (reason)
+PUSH_RE = re.compile(
+    r'(?P<flag>.)\t(?P<src>[^:]*):(?P<dst>[^\t]*)\t(?P<summary>[^(]*)'
+    r'(?: \((?P<reason>.*)\))?$')
+
+# each commit is logged as three NUL terminated records: id, subject, body
+LOG_ARGS = ['git', 'log', '-z', '--no-merges', '--format=%H%x00%s%x00%b']
+
+# the snapshot fields each kind of change affects
+WORKTREE_FIELDS = ('status',)
+HEAD_FIELDS = ('current_tag', 'files', 'status')
+TAG_FIELDS = ('tags', 'current_tag')
+
+
+class LazyLogger(object):
+    """
+    A stand-in for a pygogo logger. pygogo is only imported (and the logger
+    created) on first use, which keeps it out of the startup path of commands
+    that never log.
+
+    Examples:
+        >>> lazy_logger = LazyLogger('ongeza.example')
+        >>> lazy_logger._logger is None
+        True
+        >>> callable(lazy_logger.info), lazy_logger._logger is None
+        (True, False)
+    """
+    def __init__(self, name):
+        self.__dict__.update(_name=name, _logger=None, _lock=Lock())
+
+    def _get_logger(self):
+        with self._lock:
+            if self._logger is None:
+                import pygogo as gogo
+
+                gogo_logger = gogo.Gogo(self._name, monolog=True).logger
+                self.__dict__['_logger'] = gogo_logger
+
+        return self._logger
+
+    def __getattr__(self, name):
+        return getattr(self._get_logger(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_logger(), name, value)
+
+
+logger = LazyLogger(__name__)
+
+
+class Snapshot(object):
+    """
+    The state of a repository as seen by a `Git` instance. Each field is
+    filled in by the first query that needs it and reused until an operation
+    that changes it invalidates it.
+
+    Examples:
+        >>> snapshot = Snapshot()
+        >>> snapshot.get('tags', lambda: ['v1.0.0']) == ['v1.0.0']
+        True
+        >>> snapshot.get('tags', lambda: []) == ['v1.0.0']
+        True
+        >>> snapshot.invalidate('tags')
+        >>> snapshot.get('tags', lambda: []) == []
+        True
+    """
+    def __init__(self):
+        self.fields = {}
+        self.generation = 0
+        self.lock = Lock()
+
+    def get(self, field, func):
+        """Looks up a field, filling it in if necessary
+
+        Args:
+            field (str): The field name
+            func (func): Computes the field's value
+
+        Returns:
+            the field's value
+        """
+        found, value, generation = self.peek(field)
+
+        # computed without holding the lock (`func` may run git commands
+        # that wait on an operation which is about to invalidate a field)
+        if not found:
+            value = func()
+            self.put(field, value, generation)
+
+        return value
+
+    def peek(self, field):
+        """Looks up a field without filling it in
+
+        Args:
+            field (str): The field name
+
+        Returns:
+            Tuple[bool, obj, int]: whether the field is filled in, its value,
+                and the generation to pass to `put`
+
+        Examples:
+            >>> Snapshot().peek('tags')
+            (False, None, 0)
+        """
+        with self.lock:
+            found = field in self.fields
+            return found, self.fields.get(field), self.generation
+
+    def put(self, field, value, generation):
+        """Fills in a field unless it was invalidated since `peek`, in which
+        case the value may already be stale
+
+        Args:
+            field (str): The field name
+            value (obj): The field's value
+            generation (int): The generation returned by `peek`
+        """
+        with self.lock:
+            if generation == self.generation:
+                self.fields[field] = value
+
+    def invalidate(self, *fields):
+        """Forgets fields
+
+        Args:
+            fields (str): The field names (default: all fields)
+        """
+        with self.lock:
+            self.generation += 1
+
+            if fields:
+                for field in fields:
+                    self.fields.pop(field, None)
+            else:
+                self.fields = {}
+
+
+def sort_tags(tags):
+    """Sorts git tags by their version number. Tags without a valid version
+    sort first.
+
+    Args:
+        tags (Iter[str]): The tags to sort
+
+    Returns:
+        List[str]: The sorted tags
+
+    Examples:
+        >>> tags = sort_tags(['v1.10.0', 'v1.2.0', 'v1.9.1'])
+        >>> tags == ['v1.2.0', 'v1.9.1', 'v1.10.0']
+        True
+    """
+    return sorted(tags, key=tag_key)
+
+
+def parse_tree(data, sha_size=20):
+    """Parses a raw git tree object
+
+    Args:
+        data (bytes): The tree object contents
+        sha_size (int): The size of an object id in bytes (default: 20)
+
+    Yields:
+        Tuple[bytes, str, str]: mode, name, and hex object id of each entry
+
+    Examples:
+        >>> data = b'100644 setup.py\\0' + b'\\x01' * 20
+        >>> mode, name, sha = next(parse_tree(data))
+        >>> mode == b'100644', name == 'setup.py', sha == '01' * 20
+        (True, True, True)
+    """
+    pos, length = 0, len(data)
+
+    while pos < length:
+        space = data.index(b' ', pos)
+        nul = data.index(b'\0', space)
+        end = nul + 1 + sha_size
+        sha = data[nul + 1:end]
+        name = data[space + 1:nul].decode('utf-8')
+        yield data[pos:space], name, ''.join('%02x' % c for c in bytearray(sha))
+        pos = end
+
+
+def parse_entries(output, sha_pos=2):
+    """Parses the `-z` output of `git ls-tree` or `git ls-files -s`
+
+    Args:
+        output (str): The command output
+        sha_pos (int): The position of the object id in each entry (2 for
+            `ls-tree`, 1 for `ls-files -s`)
+
+    Returns:
+        dict: (mode, object id) tuples keyed by file name
+
+    Examples:
+        >>> output = '100644 blob 0123abcd\\tsetup.py\\0'
+        >>> parse_entries(output) == {'setup.py': ('100644', '0123abcd')}
+        True
+        >>> output = '100644 0123abcd 0\\tsetup.py\\0'
+        >>> parse_entries(output, 1) == {'setup.py': ('100644', '0123abcd')}
+        True
+    """
+    entries = {}
+
+    for entry in output.split('\0'):
+        if entry:
+            info, name = entry.split('\t', 1)
+            fields = info.split()
+            entries[name] = (fields[0], fields[sha_pos])
+
+    return entries
+
+
+def parse_status(records):
+    """Parses the records of `git status --porcelain -z --no-renames`
+
+    Args:
+        records (Iter[str]): The status records
+
+    Returns:
+        dict: two letter status codes (staged, unstaged) keyed by file name
+
+    Examples:
+        >>> parse_status([' M setup.py', 'A  new.py']) == {
+        ...     'setup.py': ' M', 'new.py': 'A '}
+        True
+    """
+    return dict((record[3:], record[:2]) for record in records if record)
+
+
+def parse_log(records):
+    """Incrementally parses the records of `git log -z` (see `LOG_ARGS`)
+
+    Args:
+        records (Iter[str]): The log records
+
+    Yields:
+        Tuple[str, str, str]: the id, subject, and body of each commit
+
+    Examples:
+        >>> records = ['a1', 'feat: x', 'body\\n', 'b2', 'fix: y', '']
+        >>> [commit[:2] for commit in parse_log(records)] == [
+        ...     ('a1', 'feat: x'), ('b2', 'fix: y')]
+        True
+    """
+    records = iter(records)
+
+    for commit in records:
+        subject, body = next(records, ''), next(records, '')
+        yield commit.strip(), subject, body.rstrip('\n')
+
+
+def parse_push(lines):
+    """Parses the output of `git push --porcelain`
+
+    Args:
+        lines (Iter[str]): The output lines
+
+    Returns:
+        List[dict]: the `flag` ('!' if rejected, see `git help push`), `src`,
+            `dst`, `summary`, and `reason` (or None) of each ref
+
+    Examples:
+        >>> lines = [
+        ...     'To ../remote.git',
+        ...     '*\\tHEAD:refs/heads/master\\t[new branch]',
+        ...     '!\\trefs/tags/v1:refs/tags/v1\\t[rejected] (already exists)',
+        ...     'Done']
+        >>> results = parse_push(lines)
+        >>> [(r['flag'], r['dst']) for r in results] == [
+        ...     ('*', 'refs/heads/master'), ('!', 'refs/tags/v1')]
+        True
+        >>> results[1]['reason'] == 'already exists'
+        True
+    """
+    matches = (PUSH_RE.match(line) for line in lines)
+    return [match.groupdict() for match in matches if match]
+
+
+def update_index_cmd(entries):
+    """The `git update-index` command which sets index entries
+
+    Args:
+        entries (dict): (mode, object id) tuples keyed by file name
+
+    Returns:
+        str: the command
+
+    Examples:
+        >>> cmd = update_index_cmd({'setup.py': ('100644', '0123abcd')})
+        >>> cmd == 'git update-index --cacheinfo 100644,0123abcd,setup.py'
+        True
+    """
+    info = (
+        '%s,%s,%s' % (mode, sha, name)
+        for name, (mode, sha) in sorted(entries.items()))
+
+    return 'git update-index' + ''.join(
+        ' --cacheinfo %s' % quote(i) for i in info)
+
+
+class GitSession(object):
+    """
+    A long-lived git backend that answers ref, object, and tree queries from
+    persistent `git cat-file --batch` and `--batch-check` pipes.
+
+    Attributes:
+        forks (int): The number of git processes spawned so far
+
+    Args:
+        dir_ (str): The git project directory (default: None).
+
+    Examples:
+        >>> with GitSession() as session:
+        ...     session.check('HEAD')[1] == 'commit'
+        True
+    """
+    def __init__(self, dir_=None):
+        self.dir = dir_
+        self.forks = 0
+        self.lock = Lock()
+        self.pipes = {}
+        self.refs = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def spawn(self, *args, **kwargs):
+        # a stream set to True is connected to a pipe
+        from subprocess import Popen, PIPE
+
+        self.forks += 1
+        cmd = ('git',) + args
+        kwargs.setdefault('stdout', True)
+        kwargs = dict((k, PIPE if v is True else v) for k, v in kwargs.items())
+        return Popen(cmd, cwd=self.dir, **kwargs)
+
+    def call(self, *args):
+        """Runs a one-off git command and returns its output
+
+        Args:
+            args (str): The git arguments
+
+        Returns:
+            str: The command output ('' on failure)
+
+        Examples:
+            >>> GitSession().call('rev-parse', '--is-inside-work-tree')
+            'true'
+        """
+        with trace_command(' '.join(('git',) + args), self.dir) as info:
+            process = self.spawn(*args, stderr=True)
+            output = process.communicate()[0]
+            info.update(status=process.returncode, size=len(output))
+
+        return '' if process.returncode else output.decode('utf-8').strip()
+
+    def pipe(self, option):
+        if option not in self.pipes:
+            args = ('cat-file', option)
+            self.pipes[option] = self.spawn(*args, stdin=True)
+
+        return self.pipes[option]
+
+    def query(self, option, name):
+        process = self.pipe(option)
+        cmd = 'git cat-file %s %s' % (option, name)
+
+        with trace_command(cmd, self.dir) as info:
+            process.stdin.write(name.encode('utf-8') + b'\n')
+            process.stdin.flush()
+            header = process.stdout.readline().decode('utf-8').split()
+            info['status'] = 0 if len(header) == 3 else 1
+
+            if info['status']:
+                # `<name> missing` or `<name> ambiguous`
+                return None
+
+            sha, type_, size = header
+
+            if option == '--batch':
+                data = process.stdout.read(int(size))
+                process.stdout.read(1)
+                result = (sha, type_, data)
+                info['size'] = len(data)
+            else:
+                result = (sha, type_, int(size))
+
+        return result
+
+    def check(self, name):
+        """Looks up an object's id, type, and size
+
+        Args:
+            name (str): The object name, e.g., `HEAD` or `v1.0.0^{commit}`
+
+        Returns:
+            Tuple[str, str, int]: the object id, type, and size (or None)
+
+        Examples:
+            >>> GitSession().check('nonexistent') is None
+            True
+        """
+        with self.lock:
+            return self.query('--batch-check', name)
+
+    def read(self, name):
+        """Reads an object
+
+        Args:
+            name (str): The object name
+
+        Returns:
+            Tuple[str, str, bytes]: the object id, type, and contents (or None)
+
+        Examples:
+            >>> GitSession().read('HEAD')[2].startswith(b'tree ')
+            True
+        """
+        with self.lock:
+            return self.query('--batch', name)
+
+    def ls_tree(self, treeish='HEAD'):
+        """Recursively lists the files of a tree
+
+        Args:
+            treeish (str): The tree to list (default: HEAD)
+
+        Yields:
+            str: file name
+
+        Examples:
+            >>> 'setup.py' in GitSession().ls_tree()
+            True
+        """
+        tree = self.read('%s^{tree}' % treeish)
+
+        if tree:
+            for path in self.walk(tree[2], len(tree[0]) // 2):
+                yield path
+
+    def walk(self, data, sha_size, prefix=''):
+        for mode, name, sha in parse_tree(data, sha_size):
+            if mode == b'40000':
+                sub_data = self.read(sha)[2]
+
+                for path in self.walk(sub_data, sha_size, prefix + name + '/'):
+                    yield path
+            else:
+                yield prefix + name
+
+    def tag_refs(self):
+        """Lists the tags along with the commit they point to. The result is
+        cached until `invalidate` is called.
+
+        Returns:
+            List[Tuple[str, str, bool, int]]: the tag name, commit id,
+                whether the tag is annotated, and the tag creation date
+
+        Examples:
+            >>> tag_refs = GitSession().tag_refs()
+            >>> all(len(ref) == 4 for ref in tag_refs)
+            True
+        """
+        if self.refs is not None:
+            return self.refs
+
+        args = ('for-each-ref', '--format=%s' % TAG_REF_FMT, 'refs/tags')
+        refs = []
+
+        for line in self.call(*args).splitlines():
+            sha, peeled, type_, date, refname = line.split(' ', 4)
+            name = refname[len('refs/tags/'):]
+            annotated = type_ == 'tag'
+            refs.append((name, peeled or sha, annotated, int(date or 0)))
+
+        self.refs = refs
+        return refs
+
+    def invalidate(self):
+        """Clears the cached tag refs"""
+        self.refs = None
+
+    def tags(self):
+        """Lists the tags
+
+        Returns:
+            List[str]: tag names
+
+        Examples:
+            >>> isinstance(GitSession().tags(), list)
+            True
+        """
+        return [ref[0] for ref in self.tag_refs()]
+
+    def parents(self, commit):
+        data = self.read(commit)[2].decode('utf-8', 'replace')
+        header = data.split('\n\n', 1)[0]
+        lines = header.splitlines()
+        return [line[7:] for line in lines if line.startswith('parent ')]
+
+    def describe(self, ref='HEAD', match=None):
+        """Finds the tag nearest to a commit, i.e., the tag on the closest
+        ancestor (breadth-first). Annotated and newer tags are preferred when
+        several tags point to the same commit.
+
+        Args:
+            ref (str): The commit to describe (default: HEAD)
+            match (str): Only consider tags matching this glob pattern
+                (default: None)
+
+        Returns:
+            str: the tag name ('' if not found)
+
+        Examples:
+            >>> isinstance(GitSession().describe(), str)
+            True
+        """
+        by_commit = {}
 
-logger = gogo.Gogo(__name__, monolog=True).logger
+        for name, commit, annotated, date in self.tag_refs():
+            if match and not fnmatch(name, match):
+                continue
+
+            by_commit.setdefault(commit, []).append((annotated, date, name))
+
+        head = self.check('%s^{commit}' % ref) if by_commit else None
+        queue = deque([head[0]] if head else [])
+        seen = set(queue)
+
+        while queue:
+            commit = queue.popleft()
+
+            if commit in by_commit:
+                return max(by_commit[commit])[2]
+
+            for parent in self.parents(commit):
+                if parent not in seen:
+                    seen.add(parent)
+                    queue.append(parent)
+
+        return ''
+
+    def close(self):
+        """Closes the persistent pipes"""
+        with self.lock:
+            for process in self.pipes.values():
+                process.stdin.close()
+                process.wait()
+                process.stdout.close()
+
+            self.pipes = {}
 
 
 class Git(object):
     """
     class representing Git commands.
+
+    Every command runs with the project directory as its working directory;
+    the working directory of the current process is never changed. So
+    instances (and instances for different directories) can be used from
+    concurrent threads. Commands that modify the repository are serialized
+    per instance.
+
+    Query results (the tags, current tag, files, and working tree status)
+    are kept in a `Snapshot` and only rerun after an `add`, `commit`, `tag`,
+    `stash`, or `unstash` that changes them. Other changes, e.g., rewriting
+    a versioned file, are reported with `refresh`.
     """
-    def __init__(self, dir_=None, verbose=False):
+    def __init__(self, dir_=None, verbose=False, persistent=False):
         """
         Parameters
         ----------
         dir: directory containing the git project
+        persistent: answer ref, object, and tree queries from a long-lived
+            `GitSession` instead of spawning a process per query
         """
         self.dir = dir_
         self.stash_count = 0
         self.logger = logger
-        self.sh = partial(sh, path=self.dir)
+        self.sh_count = 0
+        self.session = GitSession(dir_) if persistent else None
+        self.state = Snapshot()
+        self._refs = None
+        self._index = None
+        self.tag_prefix = 'v'
+        self.tag_match = None
+        self.lock = RLock()
+
+    def sh(self, cmd, output=False):
+        with self.lock:
+            self.sh_count += 1
+
+        return sh(cmd, output, path=self.dir)
+
+    @property
+    def forks(self):
+        """
+        Returns
+        -------
+        the number of external processes spawned so far.
+        """
+        session_forks = self.session.forks if self.session else 0
+        return self.sh_count + session_forks
+
+    def close(self):
+        """
+        closes the persistent git session (if any).
+        """
+        if self.session:
+            self.session.close()
+
+    def refresh(self, *fields):
+        """
+        forgets the given snapshot fields (default: all fields), e.g., after
+        changing the repository outside of this instance.
+        """
+        self.state.invalidate(*fields)
+
+        if self.session and (not fields or 'tags' in fields):
+            self.session.invalidate()
+
+    @property
+    def refs(self):
+        """
+        Returns
+        -------
+        a `RefReader` for the project (or None if its refs can't be read
+        natively).
+        """
+        if self._refs is None:
+            self._refs = RefReader.from_path(self.dir) or False
+
+        return self._refs or None
 
     @property
     def current_tag(self):
@@ -50,24 +689,53 @@ class Git(object):
             :returns: string of the current git tag on the git index, not the
             latest tag version created.
         """
+        return self.state.get('current_tag', self.find_current_tag)
+
+    def find_current_tag(self):
+        match = self.tag_match
+        tag = self.refs.current_tag(match) if self.refs else None
+
+        if tag:
+            return tag
+        elif self.session:
+            return self.session.describe(match=match)
+
         cmd = 'git describe --tags --abbrev=0'
+        cmd += ' --match %s' % quote(match) if match else ''
         return self.sh(cmd, True)
 
+    @property
+    def status(self):
+        """
+        Returns
+        -------
+        dict of the two letter status codes (staged, unstaged) of the
+        changed tracked files keyed by file name, from a single streamed
+        `git status` (which uses fsmonitor when it's configured).
+        """
+        return self.state.get('status', self.find_status)
+
+    def find_status(self):
+        with self.lock:
+            self.sh_count += 1
+
+        return parse_status(stream(STATUS_ARGS, self.dir, b'\0'))
+
     @property
     def is_clean(self):
         """
         Returns
         -------
-        boolean if there is a dirty index.
+        boolean if there are no unstaged changes.
         """
-        return self.sh("git diff --quiet")
+        return not self.dirty_files
 
     @property
     def is_dirty(self):
         """
         Returns
         -------
-        boolean if there is a dirty index.
+        boolean if there are unstaged changes.
         """
         return not self.is_clean
 
@@ -76,10 +744,90 @@ class Git(object):
         """
         Returns
         -------
-        list of string names of the dirty files.
+        list of string names of the files with unstaged changes.
         """
-        files = self.sh("git diff --minimal --numstat", True)
-        return [x.split("\t")[-1] for x in files.splitlines()]
+        status = self.status
+        return [f for f in sorted(status) if status[f][1] != ' ']
+
+    @property
+    def changed_files(self):
+        """
+        Returns
+        -------
+        set of string names of the files which differ from HEAD (whether or
+        not the changes are staged).
+        """
+        return set(self.status)
+
+    def gen_files(self):
+        """
+        Yields
+        ------
+        string names of all files, streamed from `git ls-tree`.
+        """
+        if self.session:
+            for name in self.session.ls_tree():
+                yield name
+        else:
+            with self.lock:
+                self.sh_count += 1
+
+            args = ['git', 'ls-tree', '--full-tree', '--name-only', '-r', '-z']
+            args.append('HEAD')
+
+            for name in stream(args, self.dir, b'\0'):
+                yield name
+
+    def gen_added_files(self, start, end='HEAD'):
+        """
+        Yields
+        ------
+        string names of the files added between the `start` and `end`
+        commits, streamed from `git diff-tree` (which skips the subtrees
+        they share).
+        """
+        with self.lock:
+            self.sh_count += 1
+
+        args = ['git', 'diff-tree', '-r', '-z', '--name-only']
+        args += ['--no-renames', '--diff-filter=A', start, end, '--']
+
+        for name in stream(args, self.dir, b'\0'):
+            yield name
+
+    def find_head(self):
+        """
+        Returns
+        -------
+        the object id of HEAD (or an empty string if there are no commits).
+        """
+        head = self.refs.head() if self.refs else None
+        return head or self.sh('git rev-parse --verify HEAD', True)
+
+    def gen_log(self, start=None, end='HEAD'):
+        """
+        Yields
+        ------
+        the id, subject, and body of each (non merge) commit reachable from
+        `end` but not `start` (default: the whole history), newest first,
+        parsed as `git log` streams them.
+        """
+        with self.lock:
+            self.sh_count += 1
+
+        args = LOG_ARGS + ['%s..%s' % (start, end) if start else end, '--']
+
+        for commit in parse_log(stream(args, self.dir, b'\0')):
+            yield commit
+
+    def is_ancestor(self, ancestor, commit='HEAD'):
+        """
+        Returns
+        -------
+        boolean if `ancestor` is an ancestor of (or the same as) `commit`.
+        """
+        args = (quote(ancestor), quote(commit))
+        return self.sh('git merge-base --is-ancestor %s %s' % args)
 
     @property
     def files(self):
@@ -88,54 +836,305 @@ class Git(object):
         -------
         list of string names of all files.
         """
-        cmd = "git ls-tree --full-tree --name-only -r HEAD"
-        return self.sh(cmd, True).splitlines()
+        return self.state.get('files', lambda: list(self.gen_files()))
 
     @property
     def tags(self):
         """
             :returns: list of git tags, sorted by the version number.
         """
-        cmd = 'git tag'
-        tags = self.sh(cmd, True).split('\n')
-        compare = lambda x, y: semver.compare(x.lstrip('v'), y.lstrip('v'))
-        return sorted(tags, key=cmp_to_key(compare))
+        return self.state.get('tags', self.find_tags)
+
+    def gen_tags(self):
+        """
+        Yields
+        ------
+        string names of all tags, in no particular order. They're read
+        incrementally (natively, or streamed from `git for-each-ref`), so
+        the full list is never held in memory.
+        """
+        if self.refs:
+            for tag in self.refs.gen_tags():
+                yield tag
+        else:
+            with self.lock:
+                self.sh_count += 1
+
+            args = ['git', 'for-each-ref', '--format=%(refname:strip=2)']
+            args.append('refs/tags')
+
+            for tag in stream(args, self.dir):
+                if tag:
+                    yield tag
+
+    def has_tag(self, *names):
+        """
+        Returns
+        -------
+        boolean if any of the given tags exists (without reading the other
+        tags).
+        """
+        if self.refs:
+            return any(self.refs.has_tag(name) for name in names)
+
+        refs = ' '.join(quote('refs/tags/%s' % name) for name in names)
+        cmd = "git for-each-ref --count=1 --format='%%(refname)' %s" % refs
+        return bool(names and self.sh(cmd, True))
+
+    def find_tags(self):
+        if self.refs:
+            tags = self.refs.tags()
+        elif self.session:
+            tags = self.session.tags()
+        else:
+            tags = self.sh('git tag', True).split('\n')
+
+        # `git tag` prints nothing (a single empty line) if there are no tags
+        return sort_tags(tag for tag in tags if tag)
+
+    def cache_path(self, kind):
+        """
+        Returns
+        -------
+        the path of a cache file for the tag prefix under the (common) git
+        directory (or None if the git directory can't be found).
+        """
+        if not self.refs:
+            return None
+
+        name = re.sub(r'[^\w.-]', '_', self.tag_prefix)
+        filename = '%s-%s.json' % (kind, name)
+        return p.join(self.refs.common_dir, 'ongeza', filename)
+
+    @property
+    def version_index(self):
+        """
+        Returns
+        -------
+        a `VersionIndex` of the tag versions. The index is cached in memory
+        and on disk (under the git directory), and rebuilt whenever the tag
+        refs change.
+        """
+        fingerprint = self.refs.fingerprint() if self.refs else None
+        cached = self._index
+
+        if cached and fingerprint and cached[0] == fingerprint:
+            return cached[1]
+        elif cached and fingerprint:
+            # the tags changed since they were last read
+            self.refresh(*TAG_FIELDS)
+
+        if fingerprint:
+            cache_path = self.cache_path('version-index')
+            index = VersionIndex.load(cache_path, fingerprint)
+        else:
+            index = None
+
+        if index is None:
+            index = VersionIndex.from_tags(self.tags, self.tag_prefix)
+
+            if fingerprint:
+                index.save(cache_path, fingerprint)
+
+        self._index = (fingerprint, index)
+        return index
+
+    def tree_entries(self, files, treeish='HEAD'):
+        """
+        Returns
+        -------
+        dict of (mode, object id) tuples of files in a tree keyed by file
+        name.
+        """
+        paths = ' '.join(map(quote, files))
+        cmd = 'git ls-tree -z --full-tree %s -- %s' % (quote(treeish), paths)
+        return parse_entries(self.sh(cmd, True))
+
+    def index_entries(self, files):
+        """
+        Returns
+        -------
+        dict of (mode, object id) tuples of files in the index keyed by file
+        name.
+        """
+        paths = ' '.join(map(quote, files))
+        cmd = 'git ls-files -s -z -- %s' % paths
+        return parse_entries(self.sh(cmd, True), 1)
+
+    def read_blob(self, file_, filepath, treeish='HEAD'):
+        """
+        writes the contents of a file in a tree (default: HEAD) to filepath.
+        """
+        name = quote('%s:%s' % (treeish, file_))
+        return self.sh('git cat-file blob %s > %s' % (name, quote(filepath)))
+
+    def write_blob(self, filepath):
+        """
+        Returns
+        -------
+        the object id of a blob written from the contents of filepath.
+        """
+        return self.sh('git hash-object -w %s' % quote(filepath), True)
+
+    def commit_blobs(self, blobs, message):
+        """
+        commits new contents of files (given as a dict of blob object ids
+        keyed by file name) without touching the working tree. The files are
+        staged in a temporary index and committed with plumbing commands, and
+        the entries of the index which are unchanged from HEAD are updated to
+        match the new commit. Files which aren't in HEAD are added as regular
+        files. Unlike `commit`, no hooks are run.
+
+        Returns
+        -------
+        the commit object id ('' on failure).
+        """
+        from shutil import rmtree
+        from tempfile import mkdtemp
+
+        self.logger.info('making git commit: "%s"', message)
+        temp_dir = mkdtemp()
+        env = 'GIT_INDEX_FILE=%s ' % quote(p.join(temp_dir, 'index'))
+        commit = ''
+
+        with self.lock:
+            head = self.sh('git rev-parse --verify HEAD', True)
+            old = self.tree_entries(blobs, head) if head else {}
+            new = dict(
+                (f, (old[f][0] if f in old else '100644', sha))
+                for f, sha in blobs.items())
+
+            try:
+                tree = all([
+                    self.sh(env + 'git read-tree %s' % head),
+                    self.sh(env + update_index_cmd(new))])
+
+                tree = tree and self.sh(env + 'git write-tree', True)
+            finally:
+                rmtree(temp_dir)
+
+            if tree:
+                args = (tree, head, quote(message))
+                commit = self.sh('git commit-tree %s -p %s -m %s' % args, True)
+
+            reflog = quote('commit: %s' % message)
+            cmd = 'git update-ref -m %s HEAD %s %s' % (reflog, commit, head)
+
+            if commit and self.sh(cmd):
+                staged = self.index_entries(blobs)
+                unchanged = dict(
+                    (f, entry) for f, entry in new.items()
+                    if staged.get(f) == old.get(f))
+
+                if unchanged:
+                    self.sh(update_index_cmd(unchanged))
+            else:
+                commit = ''
+
+        self.refresh(*(HEAD_FIELDS + WORKTREE_FIELDS))
+        return commit
 
     def add(self, files):
         files = ' '.join(files)
         self.logger.info('add files: "%s"', files)
-        return self.sh('git add %s' % files)
+
+        with self.lock:
+            result = self.sh('git add %s' % files)
+
+        self.refresh(*WORKTREE_FIELDS)
+        return result
 
     def commit(self, message):
         self.logger.info('making git commit: "%s"', message)
-        return self.sh('git commit -m "%s"' % message)
+
+        with self.lock:
+            result = self.sh('git commit -m "%s"' % message)
+
+        self.refresh(*HEAD_FIELDS)
+        return result
 
     def tag(self, message, tag_text, sign=False):
         self.logger.info('making git tag: "%s"', message)
         opts = 'sm' if sign else 'm'
         cmd = 'git tag -%s "%s" %s' % (opts, message, tag_text)
-        return self.sh(cmd)
 
-    def push(self):
+        with self.lock:
+            result = self.sh(cmd)
+
+        self.refresh(*TAG_FIELDS)
+        return result
+
+    @property
+    def branch(self):
+        """
+        Returns
+        -------
+        the full name of the current branch, e.g., 'refs/heads/master' (or
+        '' if HEAD is detached).
+        """
+        return self.sh('git symbolic-ref -q HEAD', True)
+
+    def push_remote(self, branch=None):
+        """
+        Returns
+        -------
+        the remote a branch is pushed to, i.e., its `pushRemote`, the
+        `remote.pushDefault`, or its `remote` (default: 'origin').
         """
-        pushes current branch and tags to remote.
+        name = quote(branch[len('refs/heads/'):]) if branch else None
+        keys = ['branch.%s.pushRemote' % name] if name else []
+        keys += ['remote.pushDefault']
+        keys += ['branch.%s.remote' % name] if name else []
+        cmd = ' || '.join('git config --get %s' % key for key in keys)
+        return self.sh(cmd, True) or 'origin'
+
+    def push(self, tags=None):
+        """
+        pushes the current branch and the given tags to its remote in a
+        single atomic push, i.e., either every ref is updated or none are.
+
+        Returns
+        -------
+        list of the result of each ref (see `parse_push`). It's empty if the
+        remote couldn't be reached.
         """
-        return self.sh("git push && git push --tags")
+        branch = self.branch
+        refs = ['HEAD'] if branch else []
+        refs += ['refs/tags/%s' % tag for tag in tags or []]
+
+        if not refs:
+            return []
+
+        with self.lock:
+            self.sh_count += 1
+
+        self.logger.info('pushing %s', ', '.join(refs))
+        args = ['git', 'push', '--atomic', '--porcelain']
+        args += [self.push_remote(branch)] + refs
+        return parse_push(stream(args, self.dir))
 
     def stash(self):
         """
         stashes current changes in git.
         """
-        if self.sh("git stash"):
-            self.stash_count += 1
+        with self.lock:
+            if self.sh("git stash"):
+                self.stash_count += 1
 
-        return self.stash_count
+            stash_count = self.stash_count
+
+        self.refresh(*WORKTREE_FIELDS)
+        return stash_count
 
     def unstash(self):
         """
         pops previous stash from git.
         """
-        if self.stash_count and self.sh("git stash pop"):
-            self.stash_count -= 1
+        with self.lock:
+            if self.stash_count and self.sh("git stash pop"):
+                self.stash_count -= 1
+
+            stash_count = self.stash_count
 
-        return self.stash_count
+        self.refresh(*WORKTREE_FIELDS)
+        return stash_count
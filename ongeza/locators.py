@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.locators
+~~~~~~~~~~~~~~~
+
+Format specific version locators. A locator jumps straight to the version
+field of the files whose names match its glob patterns with a single
+precompiled regex, rather than searching every line containing the word
+'version'. Files no locator claims are searched by `GENERIC`.
+
+Third party locators are registered under the `ongeza.locators` entry point
+group. The name of an entry point is the glob pattern of the files it
+locates, and its object is a `Locator` (with `processes`, it must be
+picklable), e.g.,
+
+    [ongeza.locators]
+    build.gradle = ongeza_gradle:GRADLE
+
+The plugins are discovered on first use, and each of them is only imported
+once a file matching its pattern is found.
+
+Examples:
+    basic usage::
+
+        >>> data = b'{\\n  "name": "x",\\n  "version": "1.0.1"\\n}\\n'
+        >>> find_locator('package.json').scan(data)
+        [(17, 37)]
+
+Attributes:
+    ENTRY_POINT_GROUP (str): The entry point group of third party locators
+    VALUE (str): The regex matching the version number of a version field
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import re
+
+from posixpath import basename
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from .file_utils import (
+    scan_version, find_edits, FileMatcher, ENCODING, MAX_SCAN_SIZE)
+
+ENTRY_POINT_GROUP = 'ongeza.locators'
+VALUE = r'(?P<version>[0-9]+\.[0-9]+\.[0-9]+)'
+
+
+class Locator(object):
+    """
+    Finds the version field of a file format.
+
+    Args:
+        name (str): The format name
+
+        patterns (List[str]): Glob patterns of the file names (without
+            directories) of the format
+
+        pattern (str): A (byte string) regex matching the version field. Its
+            `version` group must hold the version number, and the match must
+            be on the field's line. It is compiled in multiline mode.
+
+    Examples:
+        >>> locator = Locator('ini', ['*.ini'], r'^version=' + VALUE)
+        >>> data = b'release=1.0.0\\nversion=1.0.1\\n'
+        >>> locator.scan(data), locator.scan(data, '1.0.0')
+        ([(14, 27)], [])
+    """
+    def __init__(self, name, patterns, pattern):
+        self.name = name
+        self.patterns = patterns
+        self.regex = re.compile(pattern.encode('ascii'), re.MULTILINE)
+
+    def scan(self, data, version=None, max_size=MAX_SCAN_SIZE):
+        """Finds the line of the version field in a buffer (see
+        `file_utils.scan_version`)
+
+        Args:
+            data (bytes): The buffer to search
+            version (str): The current version number (default: None). If
+                given, every field holding it is found. Otherwise, only the
+                first field is.
+            max_size (int): The maximum number of bytes to search (default:
+                MAX_SCAN_SIZE)
+
+        Returns:
+            List[Tuple[int, int]]: the (start, end) byte offsets of the lines
+                (or an empty list)
+
+        Examples:
+            >>> locator = Locator('cfg', ['*.cfg'], r'^\\w*version=' + VALUE)
+            >>> data = b'current_version=1.0.0\\nversion=1.0.0\\n'
+            >>> locator.scan(data), locator.scan(data, '1.0.0')
+            ([(0, 21)], [(0, 21), (22, 35)])
+        """
+        size = len(data)
+        limit = min(size, max_size) if max_size else size
+        value = version.encode(ENCODING) if version else None
+        lines = []
+
+        for match in self.regex.finditer(data, 0, limit):
+            if value and match.group('version') != value:
+                continue
+
+            start = data.rfind(b'\n', 0, match.start()) + 1
+            end = data.find(b'\n', match.end())
+            lines.append((start, size if end == -1 else end))
+
+            if not value:
+                break
+
+        return lines
+
+
+class GenericLocator(Locator):
+    """Finds the lines containing the word 'version' and a version number
+    (see `file_utils.scan_version`)"""
+    def __init__(self):
+        self.name = 'generic'
+        self.patterns = []
+
+    def scan(self, data, version=None, max_size=MAX_SCAN_SIZE):
+        return scan_version(data, version, max_size)
+
+
+class PluginLocator(object):
+    """
+    A third party locator which is imported on first use.
+
+    Args:
+        entry_point (obj): The locator's entry point. Its name is the glob
+            pattern of the files it locates.
+
+    Examples:
+        >>> class EntryPoint(object):
+        ...     name = '*.ini'
+        ...     load = lambda self: Locator('ini', [self.name], r'v=' + VALUE)
+        >>> plugin = PluginLocator(EntryPoint())
+        >>> plugin.patterns, plugin.loaded
+        (['*.ini'], None)
+        >>> plugin.locator.scan(b'v=1.0.1')
+        [(0, 7)]
+    """
+    def __init__(self, entry_point):
+        self.entry_point = entry_point
+        self.name = entry_point.name
+        self.patterns = [entry_point.name]
+        self.loaded = None
+
+    @property
+    def locator(self):
+        """The locator (imported on first use)"""
+        if self.loaded is None:
+            self.loaded = self.entry_point.load()
+
+        return self.loaded
+
+
+def iter_entry_points(group):
+    """The entry points of a group (or none if they can't be listed)
+
+    Args:
+        group (str): The entry point group
+
+    Returns:
+        Iter[obj]: the entry points
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from pkg_resources import iter_entry_points as entry_points
+        except ImportError:
+            return iter([])
+        else:
+            return entry_points(group)
+
+    found = entry_points()
+
+    if hasattr(found, 'select'):
+        return iter(found.select(group=group))
+    else:
+        return iter(found.get(group, []))
+
+
+class Registry(object):
+    """
+    The locators, along with the third party locators of an entry point
+    group (which are discovered on first use, and take precedence).
+
+    Args:
+        locators (List[Locator]): The built in locators
+
+        group (str): The entry point group (default: None, i.e., no third
+            party locators)
+
+    Examples:
+        >>> registry = Registry(LOCATORS)
+        >>> registry.find('pkg/Cargo.toml').name
+        'toml'
+        >>> registry.find('README').name
+        'generic'
+    """
+    def __init__(self, locators, group=None):
+        self.locators = list(locators)
+        self.group = group
+        self._plugins = None
+        self._matcher = None
+
+    @property
+    def plugins(self):
+        """The third party locators (discovered on first use)"""
+        if self._plugins is None:
+            entry_points = iter_entry_points(self.group) if self.group else []
+            self._plugins = [PluginLocator(ep) for ep in entry_points]
+
+        return self._plugins
+
+    @property
+    def matcher(self):
+        """Matches file names against the patterns of each locator (built on
+        first use)"""
+        if self._matcher is None:
+            locators = self.plugins + self.locators
+            patterns = dict(
+                (num, locator.patterns)
+                for num, locator in enumerate(locators))
+
+            self._matcher = FileMatcher(patterns)
+
+        return self._matcher
+
+    @property
+    def patterns(self):
+        """The glob patterns of every locator"""
+        locators = self.plugins + self.locators
+        return [pattern for loc in locators for pattern in loc.patterns]
+
+    def register(self, locator):
+        """Adds a locator, which takes precedence over the built in ones
+
+        Args:
+            locator (Locator): The locator
+        """
+        self.locators.insert(0, locator)
+        self._matcher = None
+
+    def find(self, file_):
+        """The locator of a file
+
+        Args:
+            file_ (str): The file name
+
+        Returns:
+            Locator: the first locator whose patterns match the file's base
+                name (or GENERIC)
+        """
+        matches = self.matcher.match(basename(file_))
+        locators = self.plugins + self.locators
+
+        if not matches:
+            return GENERIC
+
+        locator = locators[matches[0]]
+
+        if isinstance(locator, PluginLocator):
+            locator = locator.locator
+
+        return locator
+
+
+def locate_edits(item, new_version, **kwargs):
+    """Finds the edits that rewrite the version number of a file with its
+    locator (see `file_utils.find_edits`)
+
+    Args:
+        item (Tuple[str, Locator]): The file path and its locator
+        new_version (str): The new version number
+        kwargs (dict): Keyword arguments passed to `find_edits`
+
+    Returns:
+        List[Tuple[int, int, bytes]]: the edits
+    """
+    filepath, locator = item
+    return find_edits(filepath, new_version, locate=locator.scan, **kwargs)
+
+
+GENERIC = GenericLocator()
+
+LOCATORS = [
+    Locator(
+        'json', [
+            'package.json', 'bower.json', 'component.json', 'composer.json'],
+        r'"version"[ \t]*:[ \t]*"' + VALUE),
+    Locator(
+        'toml', ['pyproject.toml', 'Cargo.toml'],
+        r'^[ \t]*version[ \t]*=[ \t]*["\']' + VALUE),
+    Locator(
+        'cfg', ['setup.cfg'],
+        r'^[ \t]*[\w.-]*version[ \t]*[=:][ \t]*' + VALUE)]
+
+REGISTRY = Registry(LOCATORS, ENTRY_POINT_GROUP)
+
+
+def find_locator(file_):
+    """The locator of a file (see `Registry.find`)
+
+    Args:
+        file_ (str): The file name
+
+    Returns:
+        Locator: the locator
+    """
+    return REGISTRY.find(file_)
@@ -8,90 +8,229 @@ from __future__ import (
     absolute_import, division, print_function, with_statement,
     unicode_literals)
 
+import sys
 import ongeza
 
-from sys import exit
 from os import getcwd, path as p
-from argparse import RawTextHelpFormatter, ArgumentParser
 
 from builtins import *  # noqa pylint: disable=unused-import
-from . import Project, version_is_valid, TRAVIS
+from . import TRAVIS
+from .trace_utils import span, enable, disable
 
 CURDIR = None if TRAVIS else p.abspath(getcwd())
+VERSION_ARGS = (['-v'], ['--version'])
 
-parser = ArgumentParser(
-    description=(
-        "description: ongeza makes following the Semantic Versioning "
-        "Specification a breeze.\nIf called with no options, ongeza will "
-        "print the current git repository's tag version.\nIf <dir> is not "
-        "specified, the current dir is used."),
-    prog='ongeza', usage='%(prog)s [options] <dir>',
-    formatter_class=RawTextHelpFormatter)
+_parser = None
 
-group = parser.add_mutually_exclusive_group()
 
-group.add_argument(
-    '-t', '--type', dest='ongeza_type', action='store', metavar='TYPE',
-    choices=['m', 'n', 'p', 'major', 'minor', 'patch'],
-    help=(
-        "version bump type, must be one of:\n"
-        "  m or major: [x].0.0\n"
-        "  n or minor: x.[y].0\n"
-        "  p or patch: x.y.[z]"))
+class StreamLog(object):
+    """
+    A stand-in for the logger which writes messages to a text stream, e.g.,
+    to capture the output of an in-process `run`.
 
-group.add_argument(
-    '-s', '--set', dest='new_version', action='store', metavar='VERSION',
-    help='set arbitrary version number')
+    Args:
+        out (obj): The text stream
 
-parser.add_argument(
-    dest='dir', nargs='?', default=CURDIR,
-    help='the project directory (default: %s).\n\n' % CURDIR)
+        verbose (bool): Write debug messages (default: False)
 
-parser.add_argument(
-    '-S', '--skip-commit', action='store_true', help='skip committing version'
-    ' bumped files')
+    Examples:
+        >>> from io import StringIO
+        >>> out = StringIO()
+        >>> StreamLog(out).info('Current version: %s', '1.0.0')
+        >>> out.getvalue() == 'Current version: 1.0.0\\n'
+        True
+    """
+    def __init__(self, out, verbose=False):
+        self.out = out
+        self.verbose = verbose
 
-parser.add_argument(
-    '-T', '--tag', action='store_true', help='create git tag at HEAD with the'
-    ' bumped version number')
+    def log(self, message, *args):
+        message = '%s' % message
+        self.out.write('%s\n' % (message % args if args else message))
 
-parser.add_argument(
-    '-p', '--push', action='store_true', help='push to the remote origin')
+    def debug(self, message, *args):
+        if self.verbose:
+            self.log(message, *args)
 
-parser.add_argument(
-    '-a', '--stash', action='store_true', help='stash uncommitted changes')
+    def info(self, message, *args):
+        self.log(message, *args)
 
-parser.add_argument(
-    '-f', '--tag-format', action='store', metavar='FORMAT',
-    default=ongeza.DEFAULT_TAG_FMT, help='git tag format')
+    def warning(self, message, *args):
+        self.log(message, *args)
+
+    def error(self, message, *args):
+        self.log(message, *args)
+
+
+def get_parser():
+    """The command line parser. It is built on first use (and then reused)
+    rather than at import time.
+
+    Returns:
+        obj: the parser
+    """
+    global _parser
+
+    if not _parser:
+        _parser = make_parser()
+
+    return _parser
 
-parser.add_argument(
-    '-F', '--tag-msg-format', action='store', metavar='FORMAT',
-    default=ongeza.DEFAULT_TAG_MSG_FMT, help='git tag message format')
 
-parser.add_argument(
-    '-c', '--commit-msg-format', action='store', metavar='FORMAT',
-    default=ongeza.DEFAULT_COMMIT_MSG_FMT, help='git commit message format')
-
-parser.add_argument(
-    '-g', '--sign', action='store_true',
-    help='make a GPG-signed tag (implies `--tag`)')
-
-parser.add_argument(
-    '-i', '--file', action='store', help='the versioned file')
-
-parser.add_argument(
-    '-v', '--version', help="Show version and exit.", action='store_true',
-    default=False)
-
-parser.add_argument(
-    '-V', '--verbose', action='store_true',
-    help='increase output verbosity')
-
-args = parser.parse_args()
-
-
-def prelim_check(project):
+def make_parser(out=None):
+    """Builds a command line parser
+
+    Args:
+        out (obj): A text stream to write help, usage, and error messages to
+            (default: None, i.e., stdout or stderr)
+
+    Returns:
+        obj: the parser
+    """
+    from argparse import RawTextHelpFormatter, ArgumentParser
+    from .monorepo import PACKAGE_TAG_FMT
+
+    class Parser(ArgumentParser):
+        def _print_message(self, message, file=None):
+            super(Parser, self)._print_message(message, out or file)
+
+    parser = Parser(
+        description=(
+            "description: ongeza makes following the Semantic Versioning "
+            "Specification a breeze.\nIf called with no options, ongeza will "
+            "print the current git repository's tag version.\nIf <dir> is "
+            "not specified, the current dir is used."),
+        prog='ongeza', usage='%(prog)s [options] <dir>',
+        formatter_class=RawTextHelpFormatter)
+
+    group = parser.add_mutually_exclusive_group()
+
+    group.add_argument(
+        '-t', '--type', dest='ongeza_type', action='store', metavar='TYPE',
+        choices=['m', 'n', 'p', 'a', 'major', 'minor', 'patch', 'auto'],
+        help=(
+            "version bump type, must be one of:\n"
+            "  m or major: [x].0.0\n"
+            "  n or minor: x.[y].0\n"
+            "  p or patch: x.y.[z]\n"
+            "  a or auto: inferred from the conventional commit messages\n"
+            "    since the last tag"))
+
+    group.add_argument(
+        '-A', '--auto', dest='ongeza_type', action='store_const',
+        const='auto', help='same as `--type=auto`')
+
+    group.add_argument(
+        '-s', '--set', dest='new_version', action='store', metavar='VERSION',
+        help='set arbitrary version number')
+
+    parser.add_argument(
+        dest='dir', nargs='?', default=CURDIR,
+        help='the project directory (default: %s).\n\n' % CURDIR)
+
+    parser.add_argument(
+        '-S', '--skip-commit', action='store_true',
+        help='skip committing version bumped files')
+
+    parser.add_argument(
+        '-T', '--tag', action='store_true',
+        help='create git tag at HEAD with the bumped version number')
+
+    parser.add_argument(
+        '-p', '--push', action='store_true',
+        help='push the branch and the new tag to the remote (atomically)')
+
+    parser.add_argument(
+        '-a', '--stash', action='store_true', help='stash uncommitted changes')
+
+    parser.add_argument(
+        '-I', '--index', action='store_true',
+        help=(
+            'bump and commit HEAD\'s copies of the versioned files, leaving\n'
+            'uncommitted changes untouched (instead of stashing them)'))
+
+    parser.add_argument(
+        '-C', '--changelog', action='store', metavar='FILE',
+        help=(
+            "prepend the commits since the last tag to a changelog file (or "
+            "print them with '-')"))
+
+    parser.add_argument(
+        '-f', '--tag-format', action='store', metavar='FORMAT',
+        help=(
+            'git tag format (default: %s, or %s with `--monorepo`)' % (
+                ongeza.DEFAULT_TAG_FMT, PACKAGE_TAG_FMT)))
+
+    parser.add_argument(
+        '-F', '--tag-msg-format', action='store', metavar='FORMAT',
+        default=ongeza.DEFAULT_TAG_MSG_FMT, help='git tag message format')
+
+    parser.add_argument(
+        '-c', '--commit-msg-format', action='store', metavar='FORMAT',
+        default=ongeza.DEFAULT_COMMIT_MSG_FMT,
+        help='git commit message format')
+
+    parser.add_argument(
+        '-g', '--sign', action='store_true',
+        help='make a GPG-signed tag (implies `--tag`)')
+
+    parser.add_argument(
+        '-i', '--file', action='store', help='the versioned file')
+
+    parser.add_argument(
+        '-x', '--max-scan-size', action='store', type=int, metavar='BYTES',
+        default=ongeza.MAX_SCAN_SIZE,
+        help=(
+            'the maximum number of bytes of each file to search for the '
+            'version'))
+
+    parser.add_argument(
+        '-j', '--scan-workers', action='store', type=int, metavar='NUM',
+        help=(
+            'the number of processes searching for the version when every '
+            'file is searched'))
+
+    parser.add_argument(
+        '-k', '--persistent', action='store_true',
+        help='answer git queries from a persistent git process')
+
+    parser.add_argument(
+        '-m', '--monorepo', action='store_true',
+        help='version each package of the repo independently')
+
+    parser.add_argument(
+        '-P', '--package', action='append', metavar='NAME',
+        help='the monorepo package to bump (default: all packages)')
+
+    parser.add_argument(
+        '-w', '--workers', action='store', type=int, metavar='NUM',
+        help='the maximum number of packages to bump concurrently')
+
+    parser.add_argument(
+        '-r', '--trace', action='store_true',
+        help='print the timing of each external command and phase')
+
+    parser.add_argument(
+        '-R', '--trace-file', action='store', metavar='FILE',
+        help='save the timing of each external command and phase as a '
+        'Chrome trace')
+
+    parser.add_argument(
+        '-X', '--profile', action='store', metavar='FILE',
+        help='profile the run with cProfile and save the statistics')
+
+    parser.add_argument(
+        '-v', '--version', help="Show version and exit.", action='store_true',
+        default=False)
+
+    parser.add_argument(
+        '-V', '--verbose', action='store_true',
+        help='increase output verbosity')
+
+    return parser
+
+
+def prelim_check(project, args):
     result = True
 
     if args.version:
@@ -106,8 +245,11 @@ def prelim_check(project):
     return result
 
 
-def ongeza_project(project):
-    if project.is_dirty and not args.stash:
+def check_dirty(project, args):
+    if args.index:
+        # uncommitted changes are neither committed nor touched
+        return
+    elif project.is_dirty and not args.stash:
         error = (
             "Can't bump the version with uncommitted changes. Please "
             "commit your changes or stash the following files and try "
@@ -118,13 +260,28 @@ def ongeza_project(project):
         project.logger.info("Stashing changes...\n")
         project.stash()
 
-    if args.new_version and version_is_valid(args.new_version):
+
+def ongeza_project(project, args):
+    from .project import version_is_valid
+
+    if args.index and args.skip_commit:
+        raise RuntimeError("Can't skip the commit of an `--index` bump.")
+
+    check_dirty(project, args)
+
+    log = project.logger
+
+    if args.new_version and version_is_valid(args.new_version, log):
         new_version = args.new_version
     elif args.new_version:
-        msg = "Invalid version: '{0.version}'. Please use x.y.z format."
+        msg = "Invalid version: '{0.new_version}'. Please use x.y.z format."
         raise RuntimeError(msg.format(args))
     elif project.version and args.ongeza_type:
         new_version = project.ongeza(args.ongeza_type)
+
+        if not new_version:
+            # `Project.ongeza` logged why, e.g., no commits call for a release
+            raise RuntimeError('No new version to release.')
     else:
         error = "No git tags found, please run with '-s and -T' options"
         raise RuntimeError(error)
@@ -132,33 +289,55 @@ def ongeza_project(project):
     return new_version
 
 
-def cleanup(project, new_version):
+def cleanup(project, new_version, args):
     msg = "Couldn't find a version to bump."
     if project.bumped and not args.skip_commit:
         message = args.commit_msg_format.format(version=new_version)
-        project.add(project.dirty_files)
-        project.commit(message)
+
+        if args.index and not project.commit_index(message):
+            raise RuntimeError("Couldn't commit the bumped files.")
+        elif not args.index:
+            project.add(project.bumped_files)
+            project.commit(message)
 
     if args.stash and project.stash_count:
         project.unstash()
 
+    tags = []
+
     if project.bumped and (args.tag or args.sign):
         message = args.tag_msg_format.format(version=new_version)
-        tag_text = args.tag_format.format(version=new_version)
+        tag_format = args.tag_format or ongeza.DEFAULT_TAG_FMT
+        tag_text = tag_format.format(version=new_version)
         project.tag(message, tag_text, sign=args.sign)
+        tags.append(tag_text)
     elif args.tag:
         raise RuntimeError("%s Nothing to tag." % msg)
 
     if project.bumped and args.push:
-        project.push()
+        push(project, tags)
     elif args.push:
         raise RuntimeError("%s Nothing to push." % msg)
 
 
+def push(git, tags):
+    results = git.push(tags)
+    rejected = [
+        '%s (%s)' % (r['dst'], r['reason'] or r['summary'])
+        for r in results if r['flag'] == '!']
+
+    if rejected:
+        raise RuntimeError("Couldn't push %s." % ', '.join(rejected))
+    elif not results:
+        raise RuntimeError("Couldn't push to the remote.")
+
+
 def set_versions(project, new_version):
-    # in some cases, e.g., single file python modules, the versioned file
-    # can't be predetermined and we must do a 2nd search over all files
-    for wave in [1, 2]:
+    # the locations of the last bump (along with any versioned files added
+    # since then) are tried first. In some cases, e.g., single file python
+    # modules, the versioned file can't be predetermined and we must do a
+    # 2nd search over all files
+    for wave in [0, 1, 2]:
         project.set_versions(new_version, wave)
 
         if project.bumped:
@@ -170,26 +349,220 @@ def set_versions(project, new_version):
         raise RuntimeError(msg.format(project))
 
 
-def run():
-    project = Project(args.dir, args.file, verbose=args.verbose)
+def write_changelog(project, new_version, args, out=None):
+    from .changelog import write_changelog as write
+    from .git_utils import WORKTREE_FIELDS
+
+    if args.changelog == '-':
+        write(project, new_version, out=out)
+    elif args.changelog:
+        filepath = project.edit_path(args.changelog)
+        count = write(project, new_version, filepath)
+        project.bumped_files.append(args.changelog)
+        project.refresh(*WORKTREE_FIELDS)
+        msg = 'Added %i commits to %s.'
+        project.logger.info(msg, count, args.changelog)
+
+
+def finish(project, code, args, out=None):
+    project.close()
+
+    if args.verbose:
+        project.logger.debug('Spawned %i processes.', project.forks)
+
+    tracer = disable(args.profile)
+
+    if tracer and args.trace:
+        print(tracer.summary(), file=out or sys.stderr)
+
+    if tracer and args.trace_file:
+        tracer.save(args.trace_file)
+
+    return code
+
+
+def check_monorepo_args(args, log=None):
+    from .project import version_is_valid
+
+    if args.index:
+        raise RuntimeError("`--index` isn't supported with `--monorepo`.")
+    elif args.changelog:
+        msg = "`--changelog` isn't supported with `--monorepo`."
+        raise RuntimeError(msg)
+    elif args.ongeza_type in {'a', 'auto'}:
+        msg = "`--type=auto` isn't supported with `--monorepo`."
+        raise RuntimeError(msg)
+    elif args.new_version and not version_is_valid(args.new_version, log):
+        msg = "Invalid version: '{0.new_version}'. Please use x.y.z format."
+        raise RuntimeError(msg.format(args))
+
+
+def bump_monorepo(monorepo, packages, args):
+    check_monorepo_args(args, monorepo.logger)
+    check_dirty(monorepo, args)
+    bump_args = (args.ongeza_type, args.new_version, args.workers)
+    bumped = monorepo.bump(packages, *bump_args)
+
+    for package, new_version in bumped:
+        msg = 'Bumped %s from version %s to %s.'
+        monorepo.logger.info(msg, package.name, package.version, new_version)
+
+    if bumped and not args.skip_commit:
+        monorepo.commit_bumps(bumped)
+
+    if args.stash and monorepo.stash_count:
+        monorepo.unstash()
+
+    msg = "Couldn't find a version to bump."
+
+    tags = []
+
+    if bumped and (args.tag or args.sign):
+        tag_args = (bumped, args.tag_msg_format)
+        tags = monorepo.tag_bumps(*tag_args, sign=args.sign)
+    elif args.tag:
+        raise RuntimeError("%s Nothing to tag." % msg)
+
+    if bumped and args.push:
+        push(monorepo, tags)
+    elif args.push:
+        raise RuntimeError("%s Nothing to push." % msg)
+    elif not bumped:
+        raise RuntimeError(msg)
 
-    if prelim_check(project):
-        exit(0)
+
+def run_monorepo(args, log=None, out=None):
+    from .monorepo import Monorepo, PACKAGE_TAG_FMT
+
+    tag_fmt = args.tag_format or PACKAGE_TAG_FMT
+    kwargs = {'verbose': args.verbose, 'persistent': args.persistent}
+    kwargs.update(tag_fmt=tag_fmt, max_scan_size=args.max_scan_size)
+    monorepo = Monorepo(args.dir, **kwargs)
+    monorepo.logger = log or monorepo.logger
+    code = 0
 
     try:
-        new_version = ongeza_project(project)
-        set_versions(project, new_version)
+        packages = monorepo.select(args.package)
+
+        if args.ongeza_type or args.new_version:
+            with span('bump_monorepo'):
+                bump_monorepo(monorepo, packages, args)
+        else:
+            for package in packages:
+                version = package.version or 'No valid versions found.'
+                monorepo.logger.info('%s: %s', package.name, version)
     except RuntimeError as err:
-        project.logger.error(err)
-        exit(1)
+        monorepo.logger.error(err)
+        code = 1
+
+    return finish(monorepo, code, args, out)
+
+
+def bump(project, args, out=None):
+    """Bumps, commits, tags, and pushes a project according to the parsed
+    command line options
+
+    Args:
+        project (Project): The project to bump
+        args (obj): The parsed command line options
+        out (obj): The text stream to print a changelog to (default: None,
+            i.e., stdout)
+
+    Returns:
+        str: the new version
+    """
+    with span('ongeza_project'):
+        new_version = ongeza_project(project, args)
+
+    with span('set_versions'):
+        set_versions(project, new_version)
+
+    if args.changelog:
+        with span('changelog'):
+            write_changelog(project, new_version, args, out)
+
+    with span('cleanup'):
+        cleanup(project, new_version, args)
+
+    return new_version
+
+
+def make_project(args):
+    from .project import Project
+
+    tag_fmt = args.tag_format or ongeza.DEFAULT_TAG_FMT
+    kwargs = {'verbose': args.verbose, 'persistent': args.persistent}
+    kwargs.update(tag_fmt=tag_fmt, max_scan_size=args.max_scan_size)
+    kwargs.update(via_index=args.index, scan_workers=args.scan_workers)
+    return Project(args.dir, args.file, **kwargs)
+
+
+def run(argv=None, out=None):
+    """Runs ongeza. Each run is independent of the others, so several can be
+    made from the same process (even concurrently, as long as only one of
+    them traces or profiles).
+
+    Args:
+        argv (List[str]): The command line options (default: sys.argv[1:])
+        out (obj): A text stream to write all output to, e.g., a `StringIO`
+            (default: None, i.e., stdout and stderr)
+
+    Returns:
+        int: the exit code
+
+    Examples:
+        >>> from io import StringIO
+        >>> out = StringIO()
+        >>> run(['--version'], out)
+        0
+        >>> out.getvalue() == 'ongeza v%s\\n' % ongeza.__version__
+        True
+        >>> run(['--type', 'x'], out)
+        2
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    if argv in VERSION_ARGS:
+        # answered without building the parser or a project
+        print('ongeza v%s' % ongeza.__version__, file=out)
+        return 0
+    elif argv[:1] == ['serve']:
+        from .daemon import run as serve
+
+        return serve(argv[1:])
+
+    parser = make_parser(out) if out else get_parser()
 
     try:
-        cleanup(project, new_version)
+        args = parser.parse_args(argv)
+    except SystemExit as err:
+        # `--help` or invalid options
+        return err.code or 0
+
+    log = StreamLog(out, args.verbose) if out else None
+
+    if args.trace or args.trace_file or args.profile:
+        enable(profile=bool(args.profile))
+
+    if args.monorepo and not args.version:
+        return run_monorepo(args, log, out)
+
+    with span('make_project'):
+        project = make_project(args)
+        project.logger = log or project.logger
+
+    try:
+        with span('prelim_check'):
+            done = prelim_check(project, args)
+
+        if not done:
+            bump(project, args, out)
     except RuntimeError as err:
         project.logger.error(err)
-        exit(1)
+        return finish(project, 1, args, out)
+
+    return finish(project, 0, args, out)
 
-    exit(0)
 
 if __name__ == "__main__":
-    run()
+    sys.exit(run())
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.monorepo
+~~~~~~~~~~~~~~~
+
+Support for repositories containing several independently versioned
+packages. Each package gets its own tag namespace, e.g., `pkg-v1.2.3`.
+
+Examples:
+    basic usage::
+
+        >>> files = ['a/setup.py', 'a/a/__init__.py', 'b/package.json']
+        >>> find_package_roots(files) == ['a', 'b']
+        True
+
+Attributes:
+    PACKAGE_TAG_FMT (str): The default package tag format
+    PACKAGE_COMMIT_MSG_FMT (str): The default format of each package's part
+        of the combined commit message
+    MANIFESTS (List[str]): File names that mark a package root
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+from os import path as p
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from . import DEFAULT_TAG_MSG_FMT
+from .project import Project, versioned_matcher
+from .file_utils import MAX_SCAN_SIZE
+from .git_utils import Git, WORKTREE_FIELDS
+
+PACKAGE_TAG_FMT = '{package}-v{version}'
+PACKAGE_COMMIT_MSG_FMT = '{package} to {version}'
+MANIFESTS = [
+    'setup.py', 'setup.cfg', 'package.json', 'bower.json', 'component.json',
+    'composer.json']
+
+
+def find_package_roots(files):
+    """Finds the package directories of a repository
+
+    Args:
+        files (Iter[str]): The repository's file names
+
+    Returns:
+        List[str]: The sorted package directories ('' for the repo root)
+
+    Examples:
+        >>> find_package_roots(['setup.py', 'docs/index.rst']) == ['']
+        True
+    """
+    roots = set()
+
+    for file_ in files:
+        dirname, basename = p.split(file_)
+
+        if basename in MANIFESTS:
+            roots.add(dirname)
+
+    return sorted(roots)
+
+
+def group_files(files, roots):
+    """Assigns each file to its innermost package
+
+    Args:
+        files (Iter[str]): The repository's file names
+        roots (Iter[str]): The package directories
+
+    Returns:
+        dict: file names keyed by package directory
+
+    Examples:
+        >>> files = ['a/setup.py', 'a/b/setup.py', 'a/b/c.py', 'd.py']
+        >>> groups = group_files(files, ['a', 'a/b'])
+        >>> groups['a'] == ['a/setup.py']
+        True
+        >>> groups['a/b'] == ['a/b/setup.py', 'a/b/c.py']
+        True
+    """
+    roots = set(roots)
+    groups = dict((root, []) for root in roots)
+
+    for file_ in files:
+        dirname = p.dirname(file_)
+
+        while True:
+            if dirname in roots:
+                groups[dirname].append(file_)
+                break
+            elif not dirname:
+                break
+
+            dirname = p.dirname(dirname)
+
+    return groups
+
+
+class Package(Project):
+    """
+    Class representing a package inside a monorepo.
+
+    Attributes:
+        name (str): The package name.
+
+        root (str): The package directory relative to the repo root.
+
+    Args:
+        monorepo (Monorepo): The containing repository.
+
+        name (str): The package name.
+
+        root (str): The package directory relative to the repo root.
+
+        files (List[str]): The package's files (relative to the repo root).
+
+        tag_fmt (str): The package tag format (default: PACKAGE_TAG_FMT).
+
+        max_scan_size (int): The maximum number of bytes of each file to
+            search for the version (default: MAX_SCAN_SIZE).
+
+    Examples:
+        >>> monorepo = Monorepo()
+        >>> package = Package(monorepo, 'ongeza', '', ['setup.py'])
+        >>> package.tag_prefix == 'ongeza-v'
+        True
+    """
+    def __init__(
+            self, monorepo, name, root, files, tag_fmt=PACKAGE_TAG_FMT,
+            max_scan_size=MAX_SCAN_SIZE):
+        self.monorepo = monorepo
+        self.name = name
+        self.root = root
+        self.package_files = files
+        self.tag_fmt = tag_fmt.replace('{package}', name)
+        kwargs = {'tag_fmt': self.tag_fmt, 'max_scan_size': max_scan_size}
+        super(Package, self).__init__(monorepo.dir, **kwargs)
+
+    @property
+    def tags(self):
+        return self.monorepo.tags
+
+    @property
+    def current_version(self):
+        """The package's highest tagged version"""
+        return self.latest_version
+
+    @property
+    def versioned_files(self):
+        """The package's files which may contain a version string, keyed by
+        wave. File names are matched relative to the package directory. See
+        `Project.versioned_files` for details.
+
+        Examples:
+            >>> package = Package(Monorepo(), 'pkg', 'pkg', ['pkg/setup.py'])
+            >>> package.versioned_files[1] == ['pkg/setup.py']
+            True
+        """
+        if self._versioned_files is None:
+            self._versioned_files = self.bucket_files(self.package_files)
+
+        return self._versioned_files
+
+    def bucket_files(self, files):
+        """Groups the package's file names by wave, ignoring the other
+        packages' files. See `Project.bucket_files` for details."""
+        offset = len(self.root) + 1 if self.root else 0
+        package_files = set(self.package_files)
+
+        def key(name):
+            return name[offset:]
+
+        files = (f for f in files if f in package_files)
+        return versioned_matcher().bucket(files, key)
+
+
+class Monorepo(Git):
+    """
+    Class representing a repository of independently versioned packages.
+
+    Args:
+        dir_ (str): The repository directory (default: None).
+
+        verbose (bool): Enable verbose logging (default: False).
+
+        persistent (bool): Answer git queries from a long-lived
+            `GitSession` (default: False).
+
+        tag_fmt (str): The package tag format (default: PACKAGE_TAG_FMT).
+
+        max_scan_size (int): The maximum number of bytes of each file to
+            search for a version (default: MAX_SCAN_SIZE).
+
+    Examples:
+        >>> [pkg.root for pkg in Monorepo().packages.values()] == ['']
+        True
+    """
+    def __init__(
+            self, dir_=None, verbose=False, persistent=False,
+            tag_fmt=PACKAGE_TAG_FMT, max_scan_size=MAX_SCAN_SIZE):
+        super(Monorepo, self).__init__(dir_, verbose, persistent)
+        self.tag_fmt = tag_fmt
+        self.max_scan_size = max_scan_size
+        self._packages = None
+
+    @property
+    def packages(self):
+        """The repository's packages keyed by name. A package's name is the
+        name of its directory (or its path if several package directories
+        share a name). Discovery happens once per instance.
+        """
+        if self._packages is None:
+            files = self.files
+            roots = find_package_roots(files)
+            groups = group_files(files, roots)
+            top = p.basename(p.abspath(self.dir or p.curdir))
+            names = [p.basename(root) or top for root in roots]
+            kwargs = {'tag_fmt': self.tag_fmt}
+            kwargs['max_scan_size'] = self.max_scan_size
+            self._packages = {}
+
+            for root, name in zip(roots, names):
+                name = root if names.count(name) > 1 else name
+                args = (self, name, root, groups[root])
+                self._packages[name] = Package(*args, **kwargs)
+
+        return self._packages
+
+    def select(self, names=None):
+        """Selects packages by name
+
+        Args:
+            names (Iter[str]): The package names (default: None, i.e., all
+                packages)
+
+        Returns:
+            List[Package]: the packages
+
+        Examples:
+            >>> Monorepo().select(['nonexistent'])
+            Traceback (most recent call last):
+            RuntimeError: Unknown package(s): nonexistent
+        """
+        packages = self.packages
+
+        if not names:
+            return [packages[name] for name in sorted(packages)]
+
+        missing = [name for name in names if name not in packages]
+
+        if missing:
+            raise RuntimeError('Unknown package(s): %s' % ', '.join(missing))
+
+        return [packages[name] for name in names]
+
+    def bump(self, packages, type_=None, new_version=None, workers=None):
+        """Bumps several packages concurrently
+
+        Args:
+            packages (Iter[Package]): The packages to bump
+            type_ (str): The bump type (see `Project.ongeza`)
+            new_version (str): An explicit version to set instead
+            workers (int): The maximum number of threads (default: None,
+                i.e., chosen by the executor)
+
+        Returns:
+            List[Tuple[Package, str]]: the bumped packages and their new
+                versions
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                lambda pkg: bump_package(pkg, type_, new_version), packages)
+            bumped = [r for r in results if r[0].bumped]
+
+        if bumped:
+            self.refresh(*WORKTREE_FIELDS)
+
+        return bumped
+
+    def commit_bumps(self, bumped, msg_fmt=PACKAGE_COMMIT_MSG_FMT):
+        """Makes a single commit of all bumped packages
+
+        Args:
+            bumped (List[Tuple[Package, str]]): The result of `bump`
+            msg_fmt (str): The format of each package's part of the commit
+                message (default: PACKAGE_COMMIT_MSG_FMT)
+        """
+        parts = [
+            msg_fmt.format(package=pkg.name, version=version)
+            for pkg, version in bumped]
+
+        files = [f for pkg, _ in bumped for f in pkg.bumped_files]
+        self.add(files)
+        self.commit('Bump %s' % ', '.join(parts))
+
+    def tag_bumps(self, bumped, msg_fmt=DEFAULT_TAG_MSG_FMT, sign=False):
+        """Tags each bumped package
+
+        Args:
+            bumped (List[Tuple[Package, str]]): The result of `bump`
+            msg_fmt (str): The tag message format (default:
+                DEFAULT_TAG_MSG_FMT)
+            sign (bool): Make GPG-signed tags (default: False)
+
+        Returns:
+            List[str]: the tags
+        """
+        tags = []
+
+        for pkg, version in bumped:
+            message = '%s %s' % (pkg.name, msg_fmt.format(version=version))
+            tags.append(pkg.tag_fmt.format(version=version))
+            self.tag(message, tags[-1], sign=sign)
+
+        return tags
+
+
+def bump_package(package, type_=None, new_version=None):
+    """Bumps a single package's versioned files
+
+    Args:
+        package (Package): The package to bump
+        type_ (str): The bump type (see `Project.ongeza`)
+        new_version (str): An explicit version to set instead
+
+    Returns:
+        Tuple[Package, str]: the package and its new version
+    """
+    if not new_version and package.version:
+        new_version = package.ongeza(type_)
+
+    for wave in [0, 1, 2]:
+        package.set_versions(new_version, wave)
+
+        if package.bumped:
+            break
+
+    return package, new_version
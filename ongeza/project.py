@@ -0,0 +1,664 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.project
+~~~~~~~~~~~~~~
+
+Provides the Project class, i.e., a versioned git repository
+
+Examples:
+    basic usage::
+
+        >>> project = Project()
+        >>> project.version == project.current_version
+        True
+
+Attributes:
+    VERSIONED_FILES (dict): File name patterns of the files which may
+        contain a version string, keyed by wave
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+
+from os import path as p
+from functools import partial
+from contextlib import closing
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+from . import DEFAULT_TAG_FMT
+from .git_utils import Git, logger, WORKTREE_FIELDS
+from .file_utils import (
+    find_edits, apply_edits, load_locations, save_locations, bounded_map,
+    FileMatcher, MAX_SCAN_SIZE)
+from .locators import find_locator, locate_edits, REGISTRY
+from .commit_utils import infer_type, load_analysis, save_analysis
+from .version_utils import strip_prefix, top_versions
+
+VERSIONED_FILES = {
+    1: [
+        'setup.cfg', 'setup.py', '*/__init__.py', 'bower.json',
+        'package.json', 'component.json', 'composer.json', 'pyproject.toml',
+        'Cargo.toml'],
+    2: ['*.spec', '*.php', '*.py', '*.xml', '*.json']}
+
+_matcher = None
+
+
+def versioned_matcher():
+    """Matches file names against `VERSIONED_FILES`, along with the patterns
+    of third party locators (in wave 1). It's built on first use.
+
+    Returns:
+        FileMatcher: the matcher
+
+    Examples:
+        >>> versioned_matcher().match('Cargo.toml')
+        [1]
+    """
+    global _matcher
+
+    if _matcher is None:
+        plugins = [pattern for plugin in REGISTRY.plugins
+                   for pattern in plugin.patterns]
+
+        waves = dict(VERSIONED_FILES)
+        waves[1] = VERSIONED_FILES[1] + plugins
+        _matcher = FileMatcher(waves)
+
+    return _matcher
+
+
+class Project(Git):
+    """
+    Class representing a project.
+
+    Like :class:`ongeza.git_utils.Git`, a project never changes the working
+    directory of the current process, so projects for different directories
+    can be queried and bumped from concurrent threads.
+
+    Attributes:
+        bumped (bool): Has the project's version been bumped?
+
+        bumped_files (List[str]): The files whose version has been bumped.
+
+        file (str): The file to search for a version.
+
+        version (str): The project's version (the current version unless
+            given). It is looked up on first use.
+
+        tag_prefix (str): The part of the tag format preceding the version.
+
+        max_scan_size (int): The maximum number of bytes of each file to
+            search for the version.
+
+        via_index (bool): Bump HEAD's copies of the versioned files (and
+            commit them with `commit_index`) rather than the working tree's.
+
+        scan_workers (int): The number of processes searching the wave 2
+            files for the version (1 or None searches them in the current
+            process).
+
+    Args:
+        dir_ (str): The project directory (default: None).
+
+        file_ (str): The file to search for a version (default: None).
+
+        version (str): The project's initial version (default: None).
+
+        verbose (bool): Enable verbose logging (default: False).
+
+        persistent (bool): Answer git queries from a long-lived
+            `GitSession` (default: False).
+
+        tag_fmt (str): The git tag format (default: DEFAULT_TAG_FMT).
+
+        max_scan_size (int): The maximum number of bytes of each file to
+            search for the version (default: MAX_SCAN_SIZE).
+
+        via_index (bool): Bump HEAD's copies of the versioned files, leaving
+            uncommitted changes untouched (default: False).
+
+        scan_workers (int): The number of processes searching the wave 2
+            files for the version (default: None).
+
+    Returns:
+        New instance of :class:`pygogo.Gogo`
+
+    Examples:
+        >>> import semver
+        >>> 'major' in semver.parse(Project().current_version)
+        True
+    """
+
+    def __init__(
+            self, dir_=None, file_=None, version=None, verbose=False,
+            persistent=False, tag_fmt=DEFAULT_TAG_FMT,
+            max_scan_size=MAX_SCAN_SIZE, via_index=False, scan_workers=None):
+        """Initialization method.
+
+        Examples:
+            >>> Project()  # doctest: +ELLIPSIS
+            <ongeza.project.Project object at 0x...>
+        """
+        super(Project, self).__init__(dir_, verbose, persistent)
+        self.bumped = False
+        self.bumped_files = []
+        self.file = file_
+        self.max_scan_size = max_scan_size
+        self.via_index = via_index
+        self.scan_workers = scan_workers
+        self.edit_paths = {}
+        self.copy_dir = None
+        self._versioned_files = None
+        self.tag_prefix = tag_fmt.split('{version}')[0]
+        base = self.tag_prefix.rstrip('v')
+        self.tag_match = '%s*' % base if base else None
+        self._version = version or None
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = self.current_version or ''
+
+        return self._version or None
+
+    @version.setter
+    def version(self, value):
+        self._version = value
+
+    @property
+    def current_version(self):
+        """The current version parsed from most recent git tag
+
+        Returns:
+            str: current version
+
+        Examples:
+            >>> import semver
+            >>> semver.parse(Project().current_version)['major'] >= 1
+            True
+        """
+        current_tag = self.current_tag
+
+        if current_tag:
+            version = strip_prefix(current_tag, self.tag_prefix)
+        else:
+            version = None
+
+        if version and not version_is_valid(version):
+            version = None
+
+        return version
+
+    @property
+    def versions(self):
+        """All valid versions parsed from the git tags
+
+        Returns:
+            iterator: valid versions
+
+        Examples:
+            >>> len(list(Project().versions)) > 1
+            True
+        """
+        return iter(self.version_index)
+
+    def gen_versions(self):
+        """Generates the versions parsed from the git tags (see `versions`)
+        in no particular order. The tags are read incrementally, so memory
+        use doesn't depend on the number of tags.
+
+        Yields:
+            str: version
+        """
+        for tag in self.gen_tags():
+            version = strip_prefix(tag, self.tag_prefix)
+
+            if version:
+                yield version
+
+    def top_versions(self, count=1):
+        """The highest valid versions parsed from the git tags, found in a
+        single pass over the tags (see `version_utils.top_versions`)
+
+        Args:
+            count (int): The number of versions (default: 1)
+
+        Returns:
+            List[str]: the versions, highest first
+
+        Examples:
+            >>> from ongeza.version_utils import version_key
+            >>> versions = Project().top_versions(2)
+            >>> len(versions) == 2 and versions == sorted(
+            ...     versions, key=version_key, reverse=True)
+            True
+        """
+        return top_versions(self.gen_versions(), count)
+
+    @property
+    def latest_version(self):
+        """The highest valid version parsed from the git tags (or None)
+
+        Examples:
+            >>> latest = Project().latest_version
+            >>> latest == list(Project().versions)[-1]
+            True
+        """
+        versions = self.top_versions()
+        return versions[0] if versions else None
+
+    def has_version(self, version):
+        """Checks whether a version is tagged (without reading the other
+        tags)
+
+        Args:
+            version (str): The version
+
+        Returns:
+            bool: True if a tag holds the version
+
+        Examples:
+            >>> project = Project()
+            >>> project.has_version(project.latest_version)
+            True
+            >>> project.has_version('0.0.0-nope')
+            False
+        """
+        base = self.tag_prefix.rstrip('v')
+        return self.has_tag(*sorted({base + version, base + 'v' + version}))
+
+    @property
+    def versioned_files(self):
+        """Files which may contain a version string, keyed by wave. All waves
+        are found in a single streaming pass over the project's files, which
+        happens at most once per instance.
+
+        Returns:
+            dict: file names keyed by wave
+
+        Examples:
+            >>> 'ongeza/__init__.py' in Project().versioned_files[1]
+            True
+        """
+        if self._versioned_files is None:
+            # reuses the file list if it has already been read
+            found, files, _ = self.state.peek('files')
+            files = files if found else self.gen_files()
+            self._versioned_files = self.bucket_files(files)
+
+        return self._versioned_files
+
+    def bucket_files(self, files):
+        """Groups the project's file names by wave (see
+        `FileMatcher.bucket`)
+
+        Args:
+            files (Iter[str]): The file names
+
+        Returns:
+            dict: file names keyed by wave
+        """
+        return versioned_matcher().bucket(files)
+
+    def gen_versioned_files(self, wave=1):
+        """Generates file names which may contain a version string
+
+        Args:
+            wave (int): The set of files to search. Wave 1 includes specific
+                files, e.g., 'setup.py', 'bower.json', etc. Wave 2 includes
+                general files, e.g., '*.spec', '*.php', '*.py', etc. The best
+                practice is to only use wave 2 when wave 1 fails to return a
+                versioned file.
+
+        Yields:
+            str: file name
+
+        Examples:
+            >>> next(Project().gen_versioned_files()) == 'ongeza/__init__.py'
+            True
+        """
+        if self.file:
+            yield self.file
+        else:
+            for git_file in self.versioned_files[wave]:
+                yield git_file
+
+    @property
+    def locations_path(self):
+        """The path of the cache of the version's locations (or None if an
+        explicit file is given)"""
+        return None if self.file else self.cache_path('locations')
+
+    @property
+    def locations(self):
+        """Where the version was found by the last bump, i.e., the byte
+        offsets of the rewritten lines keyed by file name
+
+        Returns:
+            dict: lists of line offsets keyed by file name
+        """
+        return self.load_locations().get('locations', {})
+
+    def load_locations(self):
+        """The cache of the last bump's locations (see
+        `file_utils.load_locations`)"""
+        filepath = self.locations_path
+        return load_locations(filepath) if filepath else {}
+
+    def gen_edits(self, new_version, wave=1):
+        """Generates the edits which bump each versioned file
+
+        Args:
+            new_version (str): The new version number
+            wave (int): The set of files to search (default: 1). Wave 0
+                includes the `locations` of the last bump, along with any
+                wave 1 files added since then (found by comparing the
+                commit they were read from with HEAD, rather than by listing
+                the tree). See `gen_versioned_files` for the other waves.
+
+        Yields:
+            Tuple[str, List[tuple]]: the file name and its edits (see
+                `file_utils.find_edits`). Each file is searched by its
+                format's locator (see `locators.find_locator`). In wave 0,
+                the remembered files come first, and the search stops at the
+                first one whose remembered location no longer holds the
+                version (its edits are empty).
+
+        Examples:
+            >>> project = Project(scan_workers=2)
+            >>> edits = list(project.gen_edits('9.9.9', 2))
+            >>> edits == list(Project().gen_edits('9.9.9', 2))
+            True
+            >>> 'ongeza/__init__.py' in dict(edits)
+            True
+        """
+        args = (new_version, self.version)
+
+        if wave:
+            files = list(self.gen_versioned_files(wave))
+        else:
+            cached = self.load_locations()
+            locations, since = cached.get('locations'), cached.get('head')
+
+            if not locations:
+                return
+
+            for file_, offsets in sorted(locations.items()):
+                path = self.edit_path(file_)
+                edits = find_edits(path, *args, offsets=offsets)
+                yield file_, edits
+
+                if not edits:
+                    # stale, so the other waves are searched instead
+                    return
+
+            if since and self.is_ancestor(since):
+                added = self.bucket_files(self.gen_added_files(since))[1]
+            else:
+                # the files added since then are unknown
+                added = self.gen_versioned_files()
+
+            files = [f for f in added if f not in locations]
+
+        items = ((self.edit_path(f), find_locator(f)) for f in files)
+        kwargs = {'version': self.version, 'max_size': self.max_scan_size}
+        find = partial(locate_edits, new_version=new_version, **kwargs)
+
+        # wave 2 may hold many files, so it's searched by a pool (the results
+        # keep the order of the files)
+        workers = self.scan_workers if wave > 1 else None
+        results = bounded_map(find, items, workers, True)
+
+        with closing(results):
+            for file_, edits in zip(files, results):
+                if edits:
+                    yield file_, edits
+
+    def set_versions(self, new_version, wave=1):
+        """Rewrites the version number in all versioned files, and remembers
+        where it was found
+
+        Args:
+            new_version (str): The new version number
+            wave (int): The set of files to search (default: 1). See
+                `gen_edits` for details.
+        """
+        if not new_version:
+            return
+
+        edits = []
+        locations = {}
+
+        with closing(self.gen_edits(new_version, wave)) as results:
+            for file_, file_edits in results:
+                if not file_edits:
+                    # stale remembered locations are ignored rather than
+                    # partly applied (and the rest needn't be searched)
+                    edits = []
+                    break
+
+                edits.append((file_, file_edits))
+
+        for file_, file_edits in edits:
+            path = self.edit_path(file_)
+            locations[file_] = apply_edits(path, file_edits)
+            self.bumped_files.append(file_)
+
+        if locations:
+            self.refresh(*WORKTREE_FIELDS)
+
+        if locations and self.locations_path:
+            save_locations(self.locations_path, locations, self.find_head())
+
+        self.bumped = bool(self.bumped_files)
+
+    def refresh(self, *fields):
+        """Forgets the given snapshot fields (default: all fields), along
+        with the versioned files if the file list is forgotten
+
+        Args:
+            fields (str): The field names
+        """
+        super(Project, self).refresh(*fields)
+
+        if not fields or 'files' in fields:
+            self._versioned_files = None
+
+    def get_path(self, file_):
+        """The path of a project file
+
+        Args:
+            file_ (str): The file name (relative to the project directory)
+
+        Returns:
+            str: the path
+        """
+        return p.join(self.dir, file_) if self.dir else file_
+
+    def edit_path(self, file_):
+        """The path of the copy of a project file to search and rewrite. It
+        is the file itself unless bumping `via_index` and the file has
+        uncommitted changes, in which case it is a temporary copy of the
+        file's HEAD version.
+
+        Args:
+            file_ (str): The file name (relative to the project directory)
+
+        Returns:
+            str: the path
+        """
+        if not self.via_index:
+            return self.get_path(file_)
+
+        # decided once, since rewriting a file changes its status
+        if file_ in self.edit_paths:
+            return self.edit_paths[file_]
+
+        if file_ in self.changed_files:
+            if not self.copy_dir:
+                from tempfile import mkdtemp
+
+                self.copy_dir = mkdtemp()
+
+            filepath = p.join(self.copy_dir, *file_.split('/'))
+
+            if not p.isdir(p.dirname(filepath)):
+                os.makedirs(p.dirname(filepath))
+
+            self.read_blob(file_, filepath)
+        else:
+            filepath = self.get_path(file_)
+
+        self.edit_paths[file_] = filepath
+        return filepath
+
+    def commit_index(self, message):
+        """Commits the bumped files without touching the index or the other
+        files of the working tree (see `Git.commit_blobs`). Bumped files
+        without uncommitted changes are left matching the new commit; those
+        with uncommitted changes are left as is.
+
+        Args:
+            message (str): The commit message
+
+        Returns:
+            str: the commit object id ('' on failure)
+        """
+        blobs = dict(
+            (file_, self.write_blob(self.edit_path(file_)))
+            for file_ in self.bumped_files)
+
+        return self.commit_blobs(blobs, message) if all(blobs.values()) else ''
+
+    def close(self):
+        """Closes the persistent git session (if any) and removes the
+        temporary copies of versioned files"""
+        super(Project, self).close()
+
+        if self.copy_dir:
+            from shutil import rmtree
+
+            rmtree(self.copy_dir, ignore_errors=True)
+            self.copy_dir = None
+
+        self.edit_paths = {}
+
+    def infer_type(self):
+        """The bump type called for by the conventional commit messages since
+        the current tag (see `commit_utils.infer_type`). The last analyzed
+        commit and the verdict are cached, so later calls only read the
+        commits made since then.
+
+        Returns:
+            str: 'm', 'n', or 'p' (or None if no commit calls for a release)
+        """
+        tag = self.current_tag or None
+        head = self.find_head()
+        filepath = self.cache_path('analysis')
+        cached = load_analysis(filepath) if filepath else {}
+        start, verdict = tag, None
+
+        if not head:
+            return None
+        elif cached.get('tag') == tag and cached['head'] == head:
+            return cached['verdict']
+        elif cached.get('tag') == tag:
+            # the cached analysis is only extended if the branch still
+            # contains the last analyzed commit
+            if self.is_ancestor(cached['head'], head):
+                start, verdict = cached['head'], cached['verdict']
+
+        with closing(self.gen_log(start, head)) as commits:
+            verdict = infer_type(commits, verdict)
+
+        if filepath:
+            save_analysis(filepath, tag, head, verdict)
+
+        return verdict
+
+    def ongeza(self, type_):
+        """Bumps a project to a new version
+
+        Args:
+            type_ (str): bump type. one of:
+                m or major: [x].0.0
+                n or minor: x.[y].0
+                p or patch: x.y.[z]
+                a or auto: inferred from the commit messages since the
+                    current tag (see `infer_type`)
+
+        Returns:
+            str: new version
+
+        Examples:
+            >>> import semver
+            >>> project = Project()
+            >>> old_version = semver.parse(project.version)
+            >>> new_version = semver.parse(project.ongeza('m'))
+            >>> new_version['major'] == old_version['major'] + 1
+            True
+            >>> new_version = semver.parse(project.ongeza('minor'))
+            >>> new_version['minor'] == old_version['minor'] + 1
+            True
+        """
+        import semver
+
+        if type_ in {'a', 'auto'}:
+            type_ = self.infer_type()
+
+        if not type_:
+            tag = self.current_tag or 'the first commit'
+            self.logger.error('no commits since %s call for a release', tag)
+            return None
+
+        switch = {
+            'm': semver.bump_major,
+            'n': semver.bump_minor,
+            'p': semver.bump_patch,
+            'major': semver.bump_major,
+            'minor': semver.bump_minor,
+            'patch': semver.bump_patch}
+
+        new_version = switch.get(type_)(self.version)
+
+        if self.has_version(new_version):
+            self.logger.error('version `%s` already present', new_version)
+            new_version = None
+
+        return new_version
+
+
+def version_is_valid(version, log=None):
+    """Determines whether a given version meets the semver spec, and if so
+    returns the parsed result.
+
+    Args:
+        version (str): The version to test
+        log (obj): The logger to report an invalid version to (default:
+            None, i.e., the module logger)
+
+    Returns:
+        dict: The parsed version (or an empty dict).
+
+    Examples:
+        >>> bool(version_is_valid('1.0.1'))
+        True
+        >>> bool(version_is_valid('1.0.1')['major'])
+        True
+        >>> bool(version_is_valid('1.0'))
+        False
+    """
+    import semver
+
+    try:
+        return semver.parse(version)
+    except (ValueError, TypeError):
+        (log or logger).debug('%s is not a valid version', version)
+        return {}
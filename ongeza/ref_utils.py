@@ -0,0 +1,638 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.ref_utils
+~~~~~~~~~~~~~~~~
+
+helpers for reading git refs straight from the repository directory, i.e.,
+without spawning a git process.
+
+Examples:
+    basic usage::
+
+        >>> reader = RefReader.from_path()
+        >>> 'v0.8.0' in reader.tags()
+        True
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import zlib
+
+from io import open
+from fnmatch import fnmatch
+from struct import unpack
+from os import path as p
+from builtins import *  # noqa pylint: disable=unused-import
+
+TAGS_PREFIX = 'refs/tags/'
+PACK_TYPES = {1: 'commit', 2: 'tree', 3: 'blob', 4: 'tag'}
+
+
+def read_text(filepath):
+    try:
+        with open(filepath, encoding='utf-8') as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def find_git_dir(path=None):
+    """Finds the git directory of a repository (or worktree). Respects the
+    `GIT_DIR` environment variable.
+
+    Args:
+        path (str): A directory inside the repository (default: the current
+            directory)
+
+    Returns:
+        str: The git directory (or None if not in a repository)
+
+    Examples:
+        >>> p.basename(find_git_dir())
+        '.git'
+        >>> find_git_dir('/') is None
+        True
+    """
+    if os.environ.get('GIT_DIR'):
+        return p.abspath(os.environ['GIT_DIR'])
+
+    current = p.abspath(path or os.curdir)
+
+    while True:
+        dot_git = p.join(current, '.git')
+
+        if p.isdir(dot_git):
+            return dot_git
+        elif p.isfile(dot_git):
+            # worktrees and submodules contain a `gitdir: <path>` file
+            content = read_text(dot_git) or ''
+
+            if content.startswith('gitdir:'):
+                return p.normpath(p.join(current, content[7:].strip()))
+
+        parent = p.dirname(current)
+
+        if parent == current:
+            return None
+
+        current = parent
+
+
+def find_common_dir(git_dir):
+    """Finds the directory holding the shared refs and objects of a
+    repository. Respects the `GIT_COMMON_DIR` environment variable.
+
+    Args:
+        git_dir (str): The git directory
+
+    Returns:
+        str: The common directory
+
+    Examples:
+        >>> git_dir = find_git_dir()
+        >>> find_common_dir(git_dir) == git_dir
+        True
+    """
+    if os.environ.get('GIT_COMMON_DIR'):
+        return p.abspath(os.environ['GIT_COMMON_DIR'])
+
+    common_dir = read_text(p.join(git_dir, 'commondir'))
+    return p.normpath(p.join(git_dir, common_dir)) if common_dir else git_dir
+
+
+def gen_packed_refs(filepath, prefix=''):
+    """Incrementally parses a `packed-refs` file, one line at a time (see
+    `parse_packed_refs`)
+
+    Args:
+        filepath (str): The packed-refs file path
+        prefix (str): Only yield refs starting with this prefix (default: '')
+
+    Yields:
+        Tuple[str, Tuple[str, str]]: the ref name and its (object id, peeled
+            object id)
+    """
+    last = None
+    peeled = False
+
+    try:
+        with open(filepath, encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+
+                if line.startswith('# pack-refs with:'):
+                    traits = set(line.split(':', 1)[1].split())
+                    peeled = bool(traits & {'peeled', 'fully-peeled'})
+                elif not line or line.startswith('#'):
+                    continue
+                elif line.startswith('^') and last:
+                    # the peeled id follows its ref
+                    last = (last[0], (last[1][0], line[1:]))
+                else:
+                    if last and last[0].startswith(prefix):
+                        yield last
+
+                    sha, name = line.split(' ', 1)
+                    is_tag = name.startswith(TAGS_PREFIX)
+                    last = (name, (sha, sha if peeled and is_tag else None))
+    except (IOError, OSError):
+        pass
+
+    if last and last[0].startswith(prefix):
+        yield last
+
+
+def parse_packed_refs(filepath):
+    """Parses a `packed-refs` file
+
+    Args:
+        filepath (str): The packed-refs file path
+
+    Returns:
+        dict: ref name keyed to a tuple of (object id, peeled object id). If
+            the file was written with the `peeled` trait, the peeled id of a
+            tag that isn't annotated is its own object id. Otherwise, the
+            peeled id is None if unknown.
+
+    Examples:
+        >>> from tempfile import mkdtemp
+        >>> filepath = p.join(mkdtemp(), 'packed-refs')
+        >>> lines = ['# pack-refs with: peeled', 'a1 refs/tags/v1', '^c1']
+        >>> lines += ['b1 refs/tags/v2']
+        >>> _ = open(filepath, 'w').write('\\n'.join(lines))
+        >>> refs = parse_packed_refs(filepath)
+        >>> refs == {'refs/tags/v1': ('a1', 'c1'), 'refs/tags/v2': ('b1', 'b1')}
+        True
+    """
+    return dict(gen_packed_refs(filepath))
+
+
+class RefReader(object):
+    """
+    Reads tag refs from a repository's `refs/tags` directory and
+    `packed-refs` file.
+
+    Args:
+        git_dir (str): The git directory
+
+    Examples:
+        >>> reader = RefReader(find_git_dir())
+        >>> reader.head() == RefReader.from_path().head()
+        True
+    """
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self.common_dir = find_common_dir(git_dir)
+
+    @classmethod
+    def from_path(cls, path=None):
+        """Creates a reader for the repository containing a directory
+
+        Args:
+            path (str): A directory inside the repository (default: the
+                current directory)
+
+        Returns:
+            RefReader: the reader (or None if the repository isn't readable
+                natively, e.g., it uses the reftable backend)
+
+        Examples:
+            >>> RefReader.from_path('/') is None
+            True
+        """
+        git_dir = find_git_dir(path)
+
+        if not git_dir:
+            return None
+
+        reader = cls(git_dir)
+        return None if reader.is_reftable else reader
+
+    @property
+    def is_reftable(self):
+        return p.isdir(p.join(self.common_dir, 'reftable'))
+
+    def loose_refs(self, prefix):
+        refs = {}
+        root = p.join(self.common_dir, *prefix.split('/'))
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = p.relpath(dirpath, self.common_dir).replace(os.sep, '/')
+
+            for filename in filenames:
+                if filename.endswith('.lock'):
+                    continue
+
+                content = read_text(p.join(dirpath, filename))
+
+                if content:
+                    refs['%s/%s' % (rel_dir, filename)] = content
+
+        return refs
+
+    def ref_map(self, prefix):
+        packed_path = p.join(self.common_dir, 'packed-refs')
+        packed = parse_packed_refs(packed_path)
+        refs = dict(
+            (k, v) for k, v in packed.items() if k.startswith(prefix))
+
+        for name, content in self.loose_refs(prefix).items():
+            sha = self.resolve(content, packed)
+
+            if sha:
+                refs[name] = (sha, None)
+
+        return refs
+
+    def resolve(self, content, packed=None):
+        """Resolves the contents of a ref file to an object id"""
+        depth = 0
+
+        while content and content.startswith('ref:') and depth < 5:
+            name = content[4:].strip()
+            content = None
+            depth += 1
+
+            for dir_ in [self.git_dir, self.common_dir]:
+                content = read_text(p.join(dir_, *name.split('/')))
+
+                if content:
+                    break
+            else:
+                if packed is None:
+                    packed_path = p.join(self.common_dir, 'packed-refs')
+                    packed = parse_packed_refs(packed_path)
+
+                content = packed.get(name, (None,))[0]
+
+        return content
+
+    def head(self):
+        """The object id of HEAD
+
+        Returns:
+            str: the object id (or None)
+
+        Examples:
+            >>> len(RefReader.from_path().head()) in {40, 64}
+            True
+        """
+        return self.resolve(read_text(p.join(self.git_dir, 'HEAD')))
+
+    def fingerprint(self):
+        """The state of the tag refs, i.e., the modification time and size
+        of `packed-refs` and of each `refs/tags` directory. Any tag creation,
+        update, or deletion changes the fingerprint.
+
+        Returns:
+            List[Tuple[str, int, int]]: (path, mtime, size) triples
+
+        Examples:
+            >>> reader = RefReader.from_path()
+            >>> reader.fingerprint() == reader.fingerprint()
+            True
+        """
+        root = p.join(self.common_dir, 'refs', 'tags')
+        paths = [p.join(self.common_dir, 'packed-refs')]
+        paths.extend(dirpath for dirpath, _, _ in os.walk(root))
+        fingerprint = []
+
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            mtime = getattr(stat, 'st_mtime_ns', stat.st_mtime)
+            rel_path = p.relpath(path, self.common_dir)
+            fingerprint.append((rel_path, mtime, stat.st_size))
+
+        return fingerprint
+
+    def tag_map(self):
+        """Tags keyed to a tuple of (object id, peeled object id). The
+        peeled id is None if unknown.
+        """
+        refs = self.ref_map(TAGS_PREFIX)
+        length = len(TAGS_PREFIX)
+        return dict((name[length:], sha) for name, sha in refs.items())
+
+    def gen_tag_refs(self):
+        """Generates the tags along with their (object id, peeled object id)
+        (see `tag_map`) without holding more than the loose tags in memory.
+        Tags are generated in no particular order.
+
+        Yields:
+            Tuple[str, Tuple[str, str]]: the tag and its object ids
+        """
+        loose = self.loose_refs(TAGS_PREFIX)
+        length = len(TAGS_PREFIX)
+
+        for name, content in loose.items():
+            sha = self.resolve(content)
+
+            if sha:
+                yield name[length:], (sha, None)
+
+        packed_path = p.join(self.common_dir, 'packed-refs')
+
+        for name, shas in gen_packed_refs(packed_path, TAGS_PREFIX):
+            if name not in loose:
+                yield name[length:], shas
+
+    def gen_tags(self):
+        """Generates all tags in no particular order (see `gen_tag_refs`)
+
+        Yields:
+            str: tag name
+
+        Examples:
+            >>> 'v0.8.0' in RefReader.from_path().gen_tags()
+            True
+        """
+        for name, _ in self.gen_tag_refs():
+            yield name
+
+    def has_tag(self, name):
+        """Checks whether a tag exists, without reading the other tags into
+        memory
+
+        Args:
+            name (str): The tag name
+
+        Returns:
+            bool: True if the tag exists
+
+        Examples:
+            >>> reader = RefReader.from_path()
+            >>> reader.has_tag('v0.8.0'), reader.has_tag('v0.0.0-nope')
+            (True, False)
+        """
+        ref = TAGS_PREFIX + name
+        filepath = p.join(self.common_dir, *ref.split('/'))
+
+        if p.isfile(filepath):
+            return bool(read_text(filepath))
+
+        packed_path = p.join(self.common_dir, 'packed-refs')
+        return any(r == ref for r, _ in gen_packed_refs(packed_path, ref))
+
+    def tags(self):
+        """All tags, sorted by name (like `git tag`)
+
+        Returns:
+            List[str]: tag names
+
+        Examples:
+            >>> RefReader.from_path().tags()[0] == 'v0.8.0'
+            True
+        """
+        return sorted(self.tag_map())
+
+    def read_loose_object(self, sha):
+        objects_dir = p.join(self.common_dir, 'objects')
+        filepath = p.join(objects_dir, sha[:2], sha[2:])
+
+        try:
+            with open(filepath, 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except (IOError, OSError, zlib.error):
+            return None
+
+        header, data = raw.split(b'\0', 1)
+        return header.split(b' ')[0].decode('utf-8'), data
+
+    def read_packed_object(self, sha):
+        pack_dir = p.join(self.common_dir, 'objects', 'pack')
+
+        try:
+            idx_files = [f for f in os.listdir(pack_dir) if f.endswith('.idx')]
+        except OSError:
+            idx_files = []
+
+        for idx_file in idx_files:
+            idx_path = p.join(pack_dir, idx_file)
+            offset = find_pack_offset(idx_path, sha)
+
+            if offset is not None:
+                return read_pack_entry(idx_path[:-4] + '.pack', offset)
+
+    def read_object(self, sha):
+        """Reads an object from the loose object store or a pack
+
+        Args:
+            sha (str): The object id
+
+        Returns:
+            Tuple[str, bytes]: the object type and contents (or None if the
+                object can't be read natively, e.g., it is stored as a delta)
+
+        Examples:
+            >>> reader = RefReader.from_path()
+            >>> reader.read_object(reader.head())[0] == 'commit'
+            True
+        """
+        return self.read_loose_object(sha) or self.read_packed_object(sha)
+
+    def peel(self, sha):
+        """Peels a tag to the object it points to
+
+        Args:
+            sha (str): The object id the tag ref points to
+
+        Returns:
+            Tuple[str, bool, int]: the peeled object id, whether the tag is
+                annotated, and its tagger timestamp (or None if the object
+                can't be read natively)
+        """
+        obj = self.read_object(sha)
+
+        if not obj:
+            return None
+        elif obj[0] != 'tag':
+            return sha, False, 0
+
+        fields = obj[1].split(b'\n\n', 1)[0].decode('utf-8', 'replace')
+        headers = dict(line.split(' ', 1) for line in fields.splitlines())
+        tagger = headers.get('tagger', '').rsplit(' ', 2)
+        date = int(tagger[-2]) if len(tagger) == 3 else 0
+        target = headers['object']
+
+        if headers.get('type') == 'tag':
+            result = self.peel(target)
+            return (result[0], True, date) if result else None
+        else:
+            return target, True, date
+
+    def current_tag(self, match=None):
+        """The tag pointing at HEAD, chosen with the same preferences as
+        `git describe --tags`, i.e., annotated tags before lightweight ones,
+        newer annotated tags before older ones, and otherwise in name order.
+
+        Args:
+            match (str): Only consider tags matching this glob pattern
+                (default: None)
+
+        Returns:
+            str: the tag name ('' if HEAD isn't tagged, or None if the answer
+                requires an object that can't be read natively)
+
+        Examples:
+            >>> tag = RefReader.from_path().current_tag()
+            >>> tag is None or tag.startswith('v')
+            True
+        """
+        head = self.head()
+
+        if not head:
+            return None
+
+        best = None
+
+        # the tags are streamed, so the best is kept as they arrive
+        for name, (sha, peeled) in self.gen_tag_refs():
+            if match and not fnmatch(name, match):
+                continue
+
+            key = self.tag_key(name, sha, peeled, head)
+
+            if key is None:
+                return None
+            elif key and (not best or key < best):
+                best = key
+
+        return best[-1] if best else ''
+
+    def tag_key(self, name, sha, peeled, head):
+        """The sort key of a tag pointing at HEAD (see `current_tag`), i.e.,
+        its kind (annotated first), date (newest first), and name. The best
+        tag has the lowest key.
+
+        Args:
+            name (str): The tag name
+            sha (str): The tag's object id
+            peeled (str): The id of the commit the tag points at (if known)
+            head (str): HEAD's commit id
+
+        Returns:
+            Tuple[int, int, str]: the key (False if the tag doesn't point at
+                HEAD, or None if its object can't be read natively)
+
+        Examples:
+            >>> reader = RefReader('/nonexistent')
+            >>> reader.tag_key('v1.0.0', 'a1', None, 'a1')
+            (-1, 0, 'v1.0.0')
+            >>> reader.tag_key('v1.0.0', 'b2', 'c3', 'a1')
+            False
+        """
+        if sha == head:
+            return (-1, 0, name)
+        elif peeled and peeled != head:
+            return False
+
+        result = self.peel(sha)
+
+        if result is None:
+            return None
+        elif result[0] != head:
+            return False
+
+        return (-2 if result[1] else -1, -result[2], name)
+
+
+def find_pack_offset(idx_path, sha):
+    """Looks up an object's offset in a (version 2) pack index
+
+    Args:
+        idx_path (str): The pack index file path
+        sha (str): The object id
+
+    Returns:
+        int: the object's offset in the pack file (or None if not found)
+    """
+    key = bytearray.fromhex(sha)
+    size = len(key)
+
+    try:
+        f = open(idx_path, 'rb')
+    except (IOError, OSError):
+        return None
+
+    with f:
+        header = f.read(8)
+
+        if header[:4] != b'\xfftOc' or unpack('>I', header[4:])[0] != 2:
+            return None
+
+        fanout = unpack('>256I', f.read(1024))
+        count = fanout[255]
+        lo = fanout[key[0] - 1] if key[0] else 0
+        hi = fanout[key[0]]
+        names_start = 8 + 1024
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(names_start + mid * size)
+            name = bytearray(f.read(size))
+
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                offsets_start = names_start + count * (size + 4)
+                f.seek(offsets_start + mid * 4)
+                offset = unpack('>I', f.read(4))[0]
+
+                if offset & 0x80000000:
+                    large_start = offsets_start + count * 4
+                    f.seek(large_start + (offset & 0x7fffffff) * 8)
+                    offset = unpack('>Q', f.read(8))[0]
+
+                return offset
+
+
+def read_pack_entry(pack_path, offset):
+    """Reads a (non-delta) object from a pack file
+
+    Args:
+        pack_path (str): The pack file path
+        offset (int): The object's offset
+
+    Returns:
+        Tuple[str, bytes]: the object type and contents (or None if the
+            object is stored as a delta)
+    """
+    try:
+        f = open(pack_path, 'rb')
+    except (IOError, OSError):
+        return None
+
+    with f:
+        f.seek(offset)
+        byte = bytearray(f.read(1))[0]
+        type_ = PACK_TYPES.get((byte >> 4) & 7)
+        size, shift = byte & 15, 4
+
+        while byte & 0x80:
+            byte = bytearray(f.read(1))[0]
+            size |= (byte & 0x7f) << shift
+            shift += 7
+
+        if not type_:
+            return None
+
+        decompressor = zlib.decompressobj()
+        chunks, length = [], 0
+
+        while length < size and not decompressor.eof:
+            chunk = decompressor.decompress(f.read(8192))
+            chunks.append(chunk)
+            length += len(chunk)
+
+        return type_, b''.join(chunks)
@@ -25,21 +25,43 @@ from __future__ import (
 
 import os
 
-from subprocess import check_call, check_output, CalledProcessError
 from builtins import *  # noqa pylint: disable=unused-import
 
-try:
-    from subprocess import DEVNULL
-except ImportError:
-    DEVNULL = False
+from .trace_utils import trace_command
 
+# `subprocess` is imported on first use to keep it out of the startup path
 
-def quiet_call(cmd, devnull):
+
+def status_call(cmd, devnull, cwd=None):
+    """Calls an external command while suppressing stdout, and returns its
+    exit status rather than whether it succeeded (see `quiet_call`), so
+    that `sh` can record the status in the command's trace info.
+
+    Args:
+        cmd (str): The command to run
+        devnull (object): File-like object
+        cwd (str): The directory to run the command from (default: None)
+
+    Returns:
+        int: the command's exit status
+
+    Examples:
+        >>> with open(os.devnull, 'wb') as devnull:
+        ...     status_call('exit 3', devnull)
+        3
+    """
+    from subprocess import call
+
+    return call(cmd, shell=True, stdout=devnull, cwd=cwd)
+
+
+def quiet_call(cmd, devnull, cwd=None):
     """Calls an external command while suppressing stdout.
 
     Args:
         cmd (str): The command to run
         devnull (object): File-like object
+        cwd (str): The directory to run the command from (default: None)
 
     Returns:
         bool: True if the commabd return code was zero, else otherwise
@@ -49,17 +71,17 @@ def quiet_call(cmd, devnull):
         ...     quiet_call('ls', devnull)
         True
     """
-    try:
-        check_call(cmd, shell=True, stdout=devnull)
-    except CalledProcessError:
-        return False
-    else:
-        return True
+    return not status_call(cmd, devnull, cwd)
 
 
 def sh(cmd, output=False, path=None):
     """runs an external command.
 
+    The command runs with `path` as its working directory. The working
+    directory of the current process is never changed, so `sh` is safe to
+    call from concurrent threads. The command is recorded if tracing is
+    enabled (see `trace_utils`).
+
     Args:
         cmd (str): The command to run
         output (bool): return the command output (default: False)
@@ -72,34 +94,96 @@ def sh(cmd, output=False, path=None):
     Examples:
         >>> len(sh('ls', True)) > 0
         True
+        >>> sh('pwd', True, '/') == '/'
+        True
+        >>> sh('pwd', True, '/nonexistent') == ''
+        True
     """
-    good = True
+    from subprocess import check_output, CalledProcessError
 
-    if path:
-        try:
-            os.chdir(os.path.abspath(path))
-        except OSError:
-            good = False
-
-    if output and good:
-        try:
-            result = check_output(cmd, shell=True).strip().decode('utf-8')
-        except CalledProcessError:
-            result = ''
-    elif good:
-        if DEVNULL:
-            result = quiet_call(cmd, DEVNULL)
+    try:
+        from subprocess import DEVNULL
+    except ImportError:
+        DEVNULL = False
+
+    cwd = os.path.abspath(path) if path else None
+    good = os.path.isdir(cwd) if cwd else True
+
+    if not good:
+        return '' if output else False
+
+    with trace_command(cmd, cwd) as info:
+        if output:
+            try:
+                result = check_output(cmd, shell=True, cwd=cwd)
+                info['status'] = 0
+            except CalledProcessError as err:
+                result, info['status'] = err.output or b'', err.returncode
+
+            info['size'] = len(result)
+            result = '' if info['status'] else result.strip().decode('utf-8')
+        elif DEVNULL:
+            info['status'] = status_call(cmd, DEVNULL, cwd)
+            result = not info['status']
         else:
             with open(os.devnull, 'wb') as devnull:
-                result = quiet_call(cmd, devnull)
-    elif output:
-        result = ''
-    else:
-        result = False
+                info['status'] = status_call(cmd, devnull, cwd)
+                result = not info['status']
 
     return result
 
 
+def stream(args, path=None, sep=b'\n', chunk_size=65536):
+    """Runs an external command and incrementally yields its output records.
+    Only one chunk of output is held in memory at a time.
+
+    Args:
+        args (List[str]): The command and its arguments
+        path (str): The path to run the command from (default: None)
+        sep (bytes): The record separator (default: newline)
+        chunk_size (int): The number of bytes to read at a time
+
+    Yields:
+        str: output record
+
+    Examples:
+        >>> list(stream(['printf', r'a\\0b\\0'], sep=b'\\0')) == ['a', 'b']
+        True
+        >>> list(stream(['ls'], '/nonexistent'))
+        []
+    """
+    from subprocess import Popen, PIPE
+
+    cwd = os.path.abspath(path) if path else None
+
+    if cwd and not os.path.isdir(cwd):
+        return
+
+    with open(os.devnull, 'wb') as devnull:
+        process = Popen(args, cwd=cwd, stdout=PIPE, stderr=devnull)
+
+    remainder = b''
+
+    with trace_command(' '.join(args), cwd) as info:
+        try:
+            for chunk in iter(lambda: process.stdout.read(chunk_size), b''):
+                info['size'] += len(chunk)
+                records = (remainder + chunk).split(sep)
+                remainder = records.pop()
+
+                for record in records:
+                    yield record.decode('utf-8')
+
+            if remainder:
+                yield remainder.decode('utf-8')
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+            process.stdout.close()
+            info['status'] = process.wait()
+
+
 def choice(msg):
     """Prompts for a True/False input from the user command line.
 
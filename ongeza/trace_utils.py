@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.trace_utils
+~~~~~~~~~~~~~~~~~~
+
+opt-in timing of external commands and of the phases of a run. Tracing is
+off unless `enable` is called, in which case every command run through
+`shell_utils` or a `GitSession` is recorded along with its working
+directory, duration, exit status, and output size.
+
+Examples:
+    basic usage::
+
+        >>> tracer = enable()
+        >>> with span('phase'):
+        ...     pass
+        >>> [event['name'] for event in tracer.events] == ['phase']
+        True
+        >>> disable() is tracer
+        True
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import json
+
+from io import open
+from threading import Lock, current_thread
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+TRACER = None
+
+
+class Tracer(object):
+    """
+    Records timed events
+
+    Args:
+        profile (bool): Also run cProfile until `stop` is called
+            (default: False)
+
+    Examples:
+        >>> tracer = Tracer()
+        >>> tracer.add('command', 'git tag', 0, 1, status=0, size=12)
+        >>> tracer.events[0]['args']['size']
+        12
+    """
+    def __init__(self, profile=False):
+        self.start = timer()
+        self.events = []
+        self.lock = Lock()
+
+        if profile:
+            import cProfile
+
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = None
+
+    def add(self, category, name, start, end, **kwargs):
+        """Records an event
+
+        Args:
+            category (str): The event category, e.g., 'command' or 'phase'
+            name (str): The event name
+            start (float): The start time (from `timer`)
+            end (float): The end time (from `timer`)
+            kwargs (dict): Event details, e.g., the exit status
+        """
+        event = {
+            'cat': category, 'name': name, 'start': start,
+            'duration': end - start, 'tid': current_thread().ident,
+            'args': kwargs}
+
+        with self.lock:
+            self.events.append(event)
+
+    def stop(self, profile_path=None):
+        """Stops profiling
+
+        Args:
+            profile_path (str): The file to save the profile statistics to,
+                e.g., for `pstats` or `snakeviz` (default: None)
+        """
+        if self.profiler:
+            self.profiler.disable()
+
+            if profile_path:
+                self.profiler.dump_stats(profile_path)
+
+    def summary(self):
+        """A table of the recorded events (in order of start time)
+
+        Returns:
+            str: the table
+
+        Examples:
+            >>> tracer = Tracer()
+            >>> tracer.add('command', 'git tag', 0, 0.5, status=0, size=12)
+            >>> print(tracer.summary())  # doctest: +NORMALIZE_WHITESPACE
+            category  time (s)  status  bytes  name
+            command      0.500       0     12  git tag
+            total        0.500               1 event(s)
+        """
+        rows = ['category  time (s)  status  bytes  name']
+        row = '%-8s  %8.3f  %6s  %5s  %s'
+        events = sorted(self.events, key=lambda e: e['start'])
+
+        for event in events:
+            args = event['args']
+            status = args.get('status', '')
+            size = args.get('size', '')
+            name = event['name']
+
+            if args.get('cwd'):
+                name += ' (in %s)' % args['cwd']
+
+            values = (event['cat'], event['duration'], status, size, name)
+            rows.append(row % values)
+
+        total = sum(e['duration'] for e in events if e['cat'] != 'command')
+        total = total or sum(e['duration'] for e in events)
+        rows.append('%-8s  %8.3f  %6s  %5s  %i event(s)' % (
+            'total', total, '', '', len(events)))
+
+        return '\n'.join(rows)
+
+    def chrome_trace(self):
+        """The recorded events in the Chrome trace event format, e.g., for
+        `chrome://tracing` or Perfetto
+
+        Returns:
+            dict: the trace
+
+        Examples:
+            >>> tracer = Tracer()
+            >>> tracer.add('phase', 'bump', tracer.start, tracer.start + 1)
+            >>> event = tracer.chrome_trace()['traceEvents'][0]
+            >>> event['ph'], event['ts'], event['dur']
+            ('X', 0, 1000000)
+        """
+        pid = os.getpid()
+
+        def to_us(seconds):
+            return int(round(seconds * 1000000))
+
+        events = [
+            {
+                'name': e['name'], 'cat': e['cat'], 'ph': 'X', 'pid': pid,
+                'tid': e['tid'], 'ts': to_us(e['start'] - self.start),
+                'dur': to_us(e['duration']), 'args': e['args']}
+            for e in self.events]
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filepath):
+        """Saves the recorded events as a Chrome trace
+
+        Args:
+            filepath (str): The trace file path
+        """
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.chrome_trace()))
+
+
+def enable(profile=False):
+    """Starts tracing (in all threads)
+
+    Args:
+        profile (bool): Also run cProfile (default: False)
+
+    Returns:
+        Tracer: the tracer
+    """
+    global TRACER
+
+    TRACER = Tracer(profile)
+    return TRACER
+
+
+def disable(profile_path=None):
+    """Stops tracing
+
+    Args:
+        profile_path (str): The file to save the profile statistics to
+            (default: None)
+
+    Returns:
+        Tracer: the tracer (or None if tracing wasn't enabled)
+    """
+    global TRACER
+
+    tracer, TRACER = TRACER, None
+
+    if tracer:
+        tracer.stop(profile_path)
+
+    return tracer
+
+
+@contextmanager
+def span(name, category='phase', **kwargs):
+    """Records the wall time of a block (if tracing is enabled)
+
+    Args:
+        name (str): The span name
+        category (str): The span category (default: 'phase')
+        kwargs (dict): Span details
+    """
+    tracer = TRACER
+
+    if tracer:
+        start = timer()
+
+        try:
+            yield
+        finally:
+            tracer.add(category, name, start, timer(), **kwargs)
+    else:
+        yield
+
+
+@contextmanager
+def trace_command(cmd, cwd=None):
+    """Records an external command (if tracing is enabled). The caller fills
+    in the yielded dict with the command's `status` and output `size`.
+
+    Args:
+        cmd (str): The command
+        cwd (str): The command's working directory (default: None)
+
+    Yields:
+        dict: the command details
+
+    Examples:
+        >>> tracer = enable()
+        >>> with trace_command('ls', '/') as info:
+        ...     info.update(status=0, size=10)
+        >>> args = disable().events[0]['args']
+        >>> args == {'cwd': '/', 'status': 0, 'size': 10}
+        True
+    """
+    tracer = TRACER
+    info = {'cwd': cwd, 'status': None, 'size': 0}
+
+    if tracer:
+        start = timer()
+
+        try:
+            yield info
+        finally:
+            tracer.add('command', cmd, start, timer(), **info)
+    else:
+        yield info
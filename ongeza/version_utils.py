@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+ongeza.version_utils
+~~~~~~~~~~~~~~~~~~~~
+
+helpers for sorting and indexing version numbers.
+
+Examples:
+    basic usage::
+
+        >>> index = VersionIndex.from_tags(['v1.10.0', 'v1.2.0', 'junk'])
+        >>> '1.2.0' in index, index.latest == '1.10.0'
+        (True, True)
+
+Attributes:
+    SEMVER_RE (obj): Compiled regex matching a semantic version
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import re
+import json
+
+from io import open
+from heapq import heappush, heapreplace
+from bisect import bisect_left, bisect_right
+from builtins import *  # noqa pylint: disable=unused-import
+
+from .file_utils import write_atomic
+
+SEMVER_RE = re.compile(
+    r'^(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)'
+    r'(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)'
+    r'(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?'
+    r'(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$')
+
+
+def version_key(version):
+    """Creates a sort key implementing semver precedence
+
+    Args:
+        version (str): The version
+
+    Returns:
+        tuple: the sort key (or None if the version is invalid)
+
+    Examples:
+        >>> versions = ['1.0.0', '1.0.0-rc.1', '1.0.0-alpha', '0.9.10']
+        >>> sorted(versions, key=version_key) == [
+        ...     '0.9.10', '1.0.0-alpha', '1.0.0-rc.1', '1.0.0']
+        True
+        >>> version_key('1.0') is None
+        True
+    """
+    match = SEMVER_RE.match(version or '')
+
+    if not match:
+        return None
+
+    major, minor, patch, prerelease = match.groups()[:4]
+
+    if prerelease:
+        parts = prerelease.split('.')
+        identifiers = tuple(
+            (0, int(x), '') if x.isdigit() else (1, 0, x) for x in parts)
+        pre_key = (0, identifiers)
+    else:
+        pre_key = (1, ())
+
+    return (int(major), int(minor), int(patch), pre_key)
+
+
+def strip_prefix(tag, prefix='v'):
+    """Extracts the version from a tag. A `v` at the end of the prefix is
+    optional, e.g., both `v1.0.0` and `1.0.0` match the default prefix, and
+    both `pkg-v1.0.0` and `pkg-1.0.0` match the prefix `pkg-v`.
+
+    Args:
+        tag (str): The tag
+        prefix (str): The tag prefix (default: 'v')
+
+    Returns:
+        str: the version (or None if the tag doesn't match the prefix)
+
+    Examples:
+        >>> strip_prefix('v1.0.0') == strip_prefix('1.0.0') == '1.0.0'
+        True
+        >>> strip_prefix('pkg-v1.0.0', 'pkg-v') == '1.0.0'
+        True
+        >>> strip_prefix('other-v1.0.0', 'pkg-v') is None
+        True
+    """
+    base = prefix.rstrip('v')
+    return tag[len(base):].lstrip('v') if tag.startswith(base) else None
+
+
+def tag_key(tag):
+    """Creates a sort key ordering tags by their version number. Tags without
+    a valid version sort first (by name).
+
+    Args:
+        tag (str): The tag
+
+    Returns:
+        tuple: the sort key
+
+    Examples:
+        >>> tags = sorted(['v1.10.0', 'v1.9.0', 'latest'], key=tag_key)
+        >>> tags == ['latest', 'v1.9.0', 'v1.10.0']
+        True
+    """
+    key = version_key(tag.lstrip('v'))
+    return (1, key) if key else (0, tag)
+
+
+def top_versions(versions, count=1):
+    """Selects the highest versions in a single pass, holding no more than
+    `count` of them at a time. Invalid versions are skipped.
+
+    Args:
+        versions (Iter[str]): The versions, in any order
+        count (int): The number of versions to select (default: 1)
+
+    Returns:
+        List[str]: the highest distinct versions, highest first
+
+    Examples:
+        >>> versions = ['1.2.0', 'junk', '1.10.0', '1.9.0', '1.10.0']
+        >>> top_versions(versions, 2) == ['1.10.0', '1.9.0']
+        True
+        >>> top_versions([]) == []
+        True
+    """
+    heap = []
+    selected = set()
+
+    for version in versions:
+        key = version_key(version)
+
+        if not key or version in selected:
+            continue
+        elif len(heap) < count:
+            heappush(heap, (key, version))
+            selected.add(version)
+        elif key > heap[0][0]:
+            selected.discard(heapreplace(heap, (key, version))[1])
+            selected.add(version)
+
+    return [version for _, version in sorted(heap, reverse=True)]
+
+
+def tuplify(value):
+    """Recursively converts lists (e.g., from json) into tuples
+
+    Examples:
+        >>> tuplify([1, [2, [3]]])
+        (1, (2, (3,)))
+    """
+    if isinstance(value, list):
+        return tuple(tuplify(v) for v in value)
+    else:
+        return value
+
+
+class VersionIndex(object):
+    """
+    A sorted index of versions with precomputed sort keys. Supports O(1)
+    membership tests and O(log n) neighbor lookups.
+
+    Args:
+        entries (Iter[Tuple[tuple, str]]): (sort key, version) pairs
+
+    Examples:
+        >>> index = VersionIndex.from_versions(['1.0.1', '1.0.0', '2.0.0'])
+        >>> list(index) == ['1.0.0', '1.0.1', '2.0.0']
+        True
+        >>> index.after('1.0.0') == '1.0.1', index.before('1.0.0') is None
+        (True, True)
+    """
+    def __init__(self, entries=None):
+        entries = sorted(entries or [])
+        self.keys = [e[0] for e in entries]
+        self.versions = [e[1] for e in entries]
+        self.lookup = set(self.versions)
+
+    @classmethod
+    def from_versions(cls, versions):
+        """Creates an index from version strings, skipping invalid ones"""
+        entries = ((version_key(v), v) for v in set(versions))
+        return cls(e for e in entries if e[0])
+
+    @classmethod
+    def from_tags(cls, tags, prefix='v'):
+        """Creates an index from tag names, skipping invalid ones and those
+        not matching the tag prefix (see `strip_prefix`)"""
+        versions = (strip_prefix(t, prefix) for t in tags)
+        return cls.from_versions(v for v in versions if v)
+
+    def __contains__(self, version):
+        return version in self.lookup
+
+    def __iter__(self):
+        return iter(self.versions)
+
+    def __len__(self):
+        return len(self.versions)
+
+    @property
+    def latest(self):
+        """The highest version (or None)"""
+        return self.versions[-1] if self.versions else None
+
+    def after(self, version):
+        """The lowest indexed version higher than a given version
+
+        Args:
+            version (str): The version
+
+        Returns:
+            str: the version (or None)
+
+        Examples:
+            >>> index = VersionIndex.from_versions(['1.0.0', '1.2.0'])
+            >>> index.after('1.1.0') == '1.2.0'
+            True
+        """
+        pos = bisect_right(self.keys, version_key(version))
+        return self.versions[pos] if pos < len(self.keys) else None
+
+    def before(self, version):
+        """The highest indexed version lower than a given version
+
+        Args:
+            version (str): The version
+
+        Returns:
+            str: the version (or None)
+
+        Examples:
+            >>> index = VersionIndex.from_versions(['1.0.0', '1.2.0'])
+            >>> index.before('1.1.0') == '1.0.0'
+            True
+        """
+        pos = bisect_left(self.keys, version_key(version))
+        return self.versions[pos - 1] if pos else None
+
+    def save(self, filepath, fingerprint):
+        """Caches the index to disk
+
+        Args:
+            filepath (str): The cache file path
+            fingerprint (list): The state of the refs the index was built
+                from
+
+        Examples:
+            >>> from tempfile import mkdtemp
+            >>> filepath = os.path.join(mkdtemp(), 'ongeza', 'versions.json')
+            >>> VersionIndex.from_versions(['1.0.0']).save(filepath, [1])
+            >>> list(VersionIndex.load(filepath, [1])) == ['1.0.0']
+            True
+            >>> VersionIndex.load(filepath, [2]) is None
+            True
+        """
+        dirname = os.path.dirname(filepath)
+        content = {
+            'fingerprint': fingerprint,
+            'keys': self.keys,
+            'versions': self.versions}
+
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            write_atomic(filepath, json.dumps(content))
+        except (IOError, OSError):
+            pass
+
+    @classmethod
+    def load(cls, filepath, fingerprint):
+        """Loads a cached index
+
+        Args:
+            filepath (str): The cache file path
+            fingerprint (list): The current state of the refs
+
+        Returns:
+            VersionIndex: the index (or None if the cache is missing or
+                stale)
+        """
+        try:
+            with open(filepath, encoding='utf-8') as f:
+                content = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if tuplify(content.get('fingerprint')) != tuplify(fingerprint):
+            return None
+
+        index = cls()
+        index.keys = [tuplify(key) for key in content['keys']]
+        index.versions = content['versions']
+        index.lookup = set(index.versions)
+        return index
@@ -78,5 +78,6 @@ setup(
     entry_points="""
         [console_scripts]
         ongeza=ongeza.main:run
+        ongeza-fleet=ongeza.fleet:run
     """
 )
@@ -10,8 +10,24 @@ from __future__ import (
     absolute_import, division, print_function, with_statement,
     unicode_literals)
 
+import os
+
+from io import open
+from os import path as p
+from shutil import rmtree
+from subprocess import check_call
+from tempfile import mkdtemp
+
 from builtins import *  # noqa pylint: disable=unused-import
 
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'ongeza', 'GIT_AUTHOR_EMAIL': 'ongeza@example.com',
+    'GIT_COMMITTER_NAME': 'ongeza',
+    'GIT_COMMITTER_EMAIL': 'ongeza@example.com'}
+
+# the throwaway dirs created by `make_dir` (see `remove_dirs`)
+TEMP_DIRS = []
+
 
 def setup_package():
     global initialized
@@ -23,3 +39,102 @@ def teardown_package():
     global initialized
     initialized = False
     print('Test Package Teardown\n')
+
+
+def git(dir_, *args):
+    """Runs a git command in a throwaway repo"""
+    env = dict(os.environ, **GIT_ENV)
+
+    with open(os.devnull, 'w') as devnull:
+        check_call(('git', '-C', dir_) + args, env=env, stdout=devnull)
+
+
+def make_dir():
+    """Creates a throwaway dir which `remove_dirs` removes
+
+    Returns:
+        str: the dir
+    """
+    dir_ = mkdtemp()
+    TEMP_DIRS.append(dir_)
+    return dir_
+
+
+def remove_dirs():
+    """Removes the throwaway dirs created so far"""
+    while TEMP_DIRS:
+        rmtree(TEMP_DIRS.pop(), ignore_errors=True)
+
+
+def make_repo(files=None, tags=None, dir_=None):
+    """Creates a throwaway git repo
+
+    Args:
+        files (dict): file contents keyed by file name (default: a single
+            `setup.py` with version 1.0.0)
+        tags (List[str]): tags to create at HEAD (default: ['v1.0.0'])
+        dir_ (str): the repo directory (default: a new throwaway dir)
+
+    Returns:
+        str: the repo directory
+    """
+    dir_ = dir_ or make_dir()
+    files = files or {'setup.py': "setup(version='1.0.0')\n"}
+    git(dir_, 'init', '-q')
+    git(dir_, 'config', 'user.name', GIT_ENV['GIT_AUTHOR_NAME'])
+    git(dir_, 'config', 'user.email', GIT_ENV['GIT_AUTHOR_EMAIL'])
+
+    for name, content in files.items():
+        filepath = p.join(dir_, name)
+
+        if not p.isdir(p.dirname(filepath)):
+            os.makedirs(p.dirname(filepath))
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    git(dir_, 'add', '-A')
+    git(dir_, 'commit', '-qm', 'Initial commit')
+
+    for tag in ['v1.0.0'] if tags is None else tags:
+        git(dir_, 'tag', tag)
+
+    return dir_
+
+
+def make_remote(dir_, refs=None):
+    """Creates a throwaway bare repo and adds it as a repo's `origin`, so
+    pushes (and their latency and ref counts) can be measured offline
+
+    Args:
+        dir_ (str): the repo directory
+        refs (List[str]): refs to push to the remote (default: ['HEAD'])
+
+    Returns:
+        str: the remote directory
+    """
+    remote = make_dir()
+    git(remote, 'init', '-q', '--bare')
+    git(dir_, 'remote', 'add', 'origin', remote)
+
+    for ref in ['HEAD'] if refs is None else refs:
+        git(dir_, 'push', '-q', 'origin', ref)
+
+    return remote
+
+
+def list_refs(dir_):
+    """Lists the refs of a repo
+
+    Args:
+        dir_ (str): the repo directory
+
+    Returns:
+        dict: object ids keyed by ref name
+    """
+    from subprocess import check_output
+
+    args = ['git', '-C', dir_, 'for-each-ref']
+    args.append('--format=%(refname) %(objectname)')
+    lines = check_output(args).decode('utf-8').splitlines()
+    return dict(line.split(' ') for line in lines)
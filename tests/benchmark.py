@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+
+"""
+tests.benchmark
+~~~~~~~~~~~~~~~
+
+Times each phase of a bump against generated repositories, and writes the
+results as JSON so they can be compared across releases, e.g.,
+
+    python tests/benchmark.py -s medium -o benchmark.json
+"""
+
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import os
+import sys
+import json
+import platform
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from datetime import datetime
+from os import path as p
+from shutil import rmtree
+from subprocess import Popen, PIPE, check_output
+from tempfile import mkdtemp
+from timeit import default_timer as timer
+
+from builtins import *  # noqa pylint: disable=unused-import
+
+sys.path.insert(0, p.dirname(p.dirname(p.abspath(__file__))))
+from ongeza import __version__ as version, Project
+from ongeza.git_utils import logger
+from ongeza.file_utils import find_edits
+from tests import GIT_ENV, git
+
+SCENARIOS = {
+    'small': [
+        {'tags': 10, 'files': 100, 'commits': 10, 'fixture_mb': 1}],
+    'medium': [
+        {'tags': 1000, 'files': 100, 'commits': 100, 'fixture_mb': 1},
+        {'tags': 10, 'files': 10000, 'commits': 100, 'fixture_mb': 1},
+        {'tags': 10, 'files': 100, 'commits': 10000, 'fixture_mb': 1},
+        {'tags': 10, 'files': 100, 'commits': 10, 'fixture_mb': 64}],
+    'large': [
+        {'tags': 100000, 'files': 100, 'commits': 1000, 'fixture_mb': 1},
+        {'tags': 10, 'files': 100000, 'commits': 100, 'fixture_mb': 1},
+        {'tags': 10, 'files': 100, 'commits': 100000, 'fixture_mb': 1},
+        {'tags': 10, 'files': 100, 'commits': 10, 'fixture_mb': 512}]}
+
+FIXTURE = 'fixtures/data.json'
+COMMITTER = 'ongeza <ongeza@example.com>'
+
+parser = ArgumentParser(
+    description='Time each phase of a bump against generated repositories.')
+
+parser.add_argument(
+    '-s', '--scale', action='store', choices=sorted(SCENARIOS),
+    default='small', help='the preset scenarios to run (default: small)')
+
+parser.add_argument(
+    '-t', '--tags', action='store', type=int, metavar='NUM',
+    help='run a single scenario with this many tags')
+
+parser.add_argument(
+    '-f', '--files', action='store', type=int, metavar='NUM',
+    help='run a single scenario with this many files')
+
+parser.add_argument(
+    '-c', '--commits', action='store', type=int, metavar='NUM',
+    help='run a single scenario with this many commits')
+
+parser.add_argument(
+    '-j', '--fixture-mb', action='store', type=int, metavar='MB',
+    help='run a single scenario with a JSON fixture of this size')
+
+parser.add_argument(
+    '-k', '--persistent', action='store_true',
+    help='answer git queries from a persistent git process')
+
+parser.add_argument(
+    '-o', '--output', action='store', metavar='FILE',
+    help='the results file (default: stdout)')
+
+parser.add_argument(
+    '-K', '--keep', action='store_true',
+    help="don't delete the generated repositories")
+
+
+def to_version(num):
+    """The num-th (0-based) version of a generated repository"""
+    return '%i.%i.%i' % (num // 10000, num // 100 % 100, num % 100)
+
+
+def gen_data(content):
+    yield ('data %i\n' % len(content)).encode('utf-8')
+    yield content
+    yield b'\n'
+
+
+def gen_fixture(size):
+    """Generates a JSON fixture of (about) `size` bytes without a version"""
+    record = '{"id": %i, "name": "item %i"}'
+    chunk, num, total = [], 0, 0
+
+    yield b'{"items": [\n'
+
+    while total < size:
+        line = record % (num, num)
+        chunk.append(line)
+        num += 1
+        total += len(line) + 2
+
+        if len(chunk) == 10000 or total >= size:
+            end = '\n]}\n' if total >= size else ',\n'
+            yield (',\n'.join(chunk) + end).encode('utf-8')
+            chunk = []
+
+
+def gen_commands(tags, files, commits, fixture_mb):
+    """Generates a `git fast-import` stream of a repository with versioned
+    files, filler files, a JSON fixture, a history of `commits` commits, and
+    `tags` lightweight version tags (the last of which is at HEAD)
+
+    Yields:
+        bytes: the stream
+    """
+    current = to_version(tags - 1)
+    contents = {
+        'setup.py': "setup(name='bench', version='%s')\n" % current,
+        'bench/__init__.py': "__version__ = '%s'\n" % current}
+
+    for num in range(files):
+        ext = 'py' if num % 10 else 'txt'
+        name = 'src/d%03i/f%06i.%s' % (num // 1000, num, ext)
+        contents[name] = 'value = %i\n' % num
+
+    for num in range(1, commits + 1):
+        date = 1500000000 + num
+        yield ('commit refs/heads/master\nmark :%i\n' % num).encode('utf-8')
+        yield ('committer %s %i +0000\n' % (COMMITTER, date)).encode('utf-8')
+
+        for chunk in gen_data(('Commit %i' % num).encode('utf-8')):
+            yield chunk
+
+        if num == 1:
+            for name, content in sorted(contents.items()):
+                yield ('M 100644 inline %s\n' % name).encode('utf-8')
+
+                for chunk in gen_data(content.encode('utf-8')):
+                    yield chunk
+
+            # the fixture is generated twice (first to get its size) rather
+            # than held in memory
+            size = fixture_mb * 1024 * 1024
+            length = sum(len(chunk) for chunk in gen_fixture(size))
+            yield ('M 100644 inline %s\n' % FIXTURE).encode('utf-8')
+            yield ('data %i\n' % length).encode('utf-8')
+
+            for chunk in gen_fixture(size):
+                yield chunk
+
+            yield b'\n'
+        else:
+            yield b'M 100644 inline history.txt\n'
+
+            for chunk in gen_data(('%i\n' % num).encode('utf-8')):
+                yield chunk
+
+        yield b'\n'
+
+    for num in range(tags):
+        mark = max(1, (num + 1) * commits // tags)
+        tag = 'v%s' % to_version(num)
+        command = 'reset refs/tags/%s\nfrom :%i\n\n' % (tag, mark)
+        yield command.encode('utf-8')
+
+
+def make_repo(tags=10, files=100, commits=10, fixture_mb=1):
+    """Generates a repository (and a bare remote it tracks)
+
+    Returns:
+        Tuple[str, str]: the repository and remote directories
+    """
+    dir_, remote = mkdtemp(), mkdtemp()
+    git(dir_, 'init', '-q')
+    git(dir_, 'config', 'user.name', GIT_ENV['GIT_AUTHOR_NAME'])
+    git(dir_, 'config', 'user.email', GIT_ENV['GIT_AUTHOR_EMAIL'])
+
+    env = dict(os.environ, **GIT_ENV)
+    cmd = ['git', '-C', dir_, 'fast-import', '--quiet']
+    process = Popen(cmd, stdin=PIPE, env=env)
+
+    for chunk in gen_commands(tags, files, commits, fixture_mb):
+        process.stdin.write(chunk)
+
+    process.stdin.close()
+
+    if process.wait():
+        raise RuntimeError('git fast-import failed')
+
+    git(dir_, 'symbolic-ref', 'HEAD', 'refs/heads/master')
+    git(dir_, 'reset', '-q', '--hard')
+    git(remote, 'init', '-q', '--bare')
+    git(dir_, 'remote', 'add', 'origin', remote)
+    git(dir_, 'push', '-q', '-u', 'origin', 'master', '--tags')
+    return dir_, remote
+
+
+def bump(project, new_version):
+    # same search order as `main.set_versions`
+    for wave in [0, 1, 2]:
+        project.set_versions(new_version, wave)
+
+        if project.bumped:
+            break
+
+
+def benchmark(dir_, persistent=False):
+    """Times each phase of two consecutive bumps
+
+    Returns:
+        dict: the elapsed time (in seconds) of each phase
+    """
+    phases = OrderedDict()
+    kwargs = {'persistent': persistent}
+
+    def timed(name, func, *args):
+        start = timer()
+        result = func(*args)
+        phases[name] = round(timer() - start, 6)
+        return result
+
+    project = Project(dir_, **kwargs)
+    timed('tags', lambda: project.tags)
+    project.close()
+
+    project = Project(dir_, **kwargs)
+    current = timed('current_version', lambda: project.version)
+    project.close()
+
+    for wave in [1, 2]:
+        project = Project(dir_, version=current, **kwargs)
+
+        def gen_files():
+            return list(project.gen_versioned_files(wave))
+
+        timed('gen_versioned_files_%i' % wave, gen_files)
+        project.close()
+
+    fixture = p.join(dir_, FIXTURE)
+    timed('scan_fixture', find_edits, fixture, '9.9.9', current)
+
+    project = Project(dir_, **kwargs)
+    new_version = project.ongeza('patch')
+    message = 'Bump to version %s' % new_version
+    timed('set_versions', bump, project, new_version)
+    timed('commit', lambda: (
+        project.add(project.bumped_files), project.commit(message)))
+
+    timed('tag', project.tag, message, 'v%s' % new_version)
+    timed('push', project.push)
+    project.close()
+
+    # the next bump goes straight to the locations found by this one
+    project = Project(dir_, **kwargs)
+    timed('set_versions_remembered', bump, project, project.ongeza('patch'))
+    project.close()
+    return phases
+
+
+def git_version():
+    return check_output(['git', '--version']).decode('utf-8').strip()
+
+
+def run():
+    args = parser.parse_args()
+    custom = [args.tags, args.files, args.commits, args.fixture_mb]
+
+    if any(custom):
+        default = SCENARIOS['small'][0]
+        keys = ['tags', 'files', 'commits', 'fixture_mb']
+        values = (v or default[k] for k, v in zip(keys, custom))
+        scenarios = [dict(zip(keys, values))]
+    else:
+        scenarios = SCENARIOS[args.scale]
+
+    results = []
+    logger.disabled = True
+
+    for scenario in scenarios:
+        start = timer()
+        dir_, remote = make_repo(**scenario)
+        setup_time = round(timer() - start, 6)
+
+        try:
+            phases = benchmark(dir_, args.persistent)
+        finally:
+            if not args.keep:
+                rmtree(dir_)
+                rmtree(remote)
+
+        result = {'scenario': scenario, 'setup': setup_time, 'phases': phases}
+        results.append(result)
+        print('%s: %0.3fs' % (scenario, sum(phases.values())), file=sys.stderr)
+
+    report = {
+        'ongeza': version,
+        'python': platform.python_version(),
+        'git': git_version(),
+        'persistent': args.persistent,
+        'date': datetime.utcnow().isoformat(),
+        'results': results}
+
+    content = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(content + '\n')
+    else:
+        print(content)
+
+
+if __name__ == '__main__':
+    run()
@@ -13,74 +13,99 @@ from __future__ import (
     absolute_import, division, print_function, with_statement,
     unicode_literals)
 
+import re
 import sys
 import pygogo as gogo
 
-sys.path.append('../ongeza')
-from ongeza import __version__ as version
-
 from difflib import unified_diff
 from os import path as p
-from io import StringIO
+from io import StringIO, open
 from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
 
 from builtins import *  # noqa pylint: disable=unused-import
-from scripttest import TestFileEnvironment
+
+sys.path.insert(0, p.dirname(p.dirname(p.abspath(__file__))))
+from ongeza import __version__ as version, main as ongeza_main
+from tests import make_repo, remove_dirs
+
+BUMP_OUTPUT = """Bumped from version 1.0.0 to 1.0.1.
+add files: "setup.py"
+making git commit: "Bump to version 1.0.1"
+making git tag: "Version 1.0.1 Release"
+"""
+
+
+def run_test(test):
+    """Runs a CLI test in-process
+
+    Args:
+        test (tuple): The test options, arguments (or None to run against a
+            throwaway repo), expected output, and expected exit code
+
+    Returns:
+        Tuple[int, str]: the exit code and output
+    """
+    opts, arguments = test[:2]
+    arguments = [make_repo()] if arguments is None else arguments
+    out = StringIO()
+    code = ongeza_main.run(opts + arguments, out)
+    return code, out.getvalue()
 
 
-def main(script, tests, dir_, verbose=False, stop=True):
+def main(tests, verbose=False, stop=True, jobs=None):
     """ Main method
     Returns 0 on success, 1 on failure
     """
     failures = 0
     logger = gogo.Gogo(__name__, verbose=verbose).logger
-    short_script = p.basename(script)
-    env = TestFileEnvironment('.scripttest')
-
     start = timer()
 
-    for pos, test in enumerate(tests):
-        num = pos + 1
-        opts, arguments, expected = test
-        joined_opts = ' '.join(opts) if opts else ''
-        joined_args = '"%s"' % '" "'.join(arguments) if arguments else ''
-        command = "%s %s %s" % (script, joined_opts, joined_args)
-        short_command = "%s %s %s" % (short_script, joined_opts, joined_args)
-        result = env.run(command, cwd=dir_)
-        output = result.stdout
-
-        if isinstance(expected, bool):
-            text = StringIO(output).read()
-            outlines = [str(bool(text))]
-            checklines = StringIO(str(expected)).readlines()
-        elif p.isfile(expected):
-            outlines = StringIO(output).readlines()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(run_test, tests)
 
-            with open(expected, encoding='utf-8') as f:
-                checklines = f.readlines()
-        else:
+        for pos, (test, (code, output)) in enumerate(zip(tests, results)):
+            num = pos + 1
+            opts, arguments, expected, expected_code = test
+            joined_opts = ' '.join(opts) if opts else ''
+            joined_args = '"%s"' % '" "'.join(arguments) if arguments else ''
+            short_command = "ongeza %s %s" % (joined_opts, joined_args)
             outlines = StringIO(output).readlines()
-            checklines = StringIO(expected).readlines()
-
-        args = [checklines, outlines]
-        kwargs = {'fromfile': 'expected', 'tofile': 'got'}
-        diffs = ''.join(unified_diff(*args, **kwargs))
-        passed = not diffs
-
-        if not passed:
-            failures += 1
-            msg = "ERROR! Output from test #%i:\n  %s\n" % (num, short_command)
-            msg += "doesn't match:\n  %s\n" % expected
-            msg += diffs if diffs else ''
-        else:
-            logger.debug(output)
-            msg = 'Scripttest #%i: %s ... ok' % (num, short_command)
-
-        logger.info(msg)
-
-        if stop and failures:
-            break
 
+            if hasattr(expected, 'match'):
+                # a regex matching the start of the output
+                pattern = '%s\n' % expected.pattern
+                matched = expected.match(output)
+                checklines = outlines[:] if matched else [pattern]
+            elif p.isfile(expected):
+                with open(expected, encoding='utf-8') as f:
+                    checklines = f.readlines()
+            else:
+                checklines = StringIO(expected).readlines()
+
+            outlines.append('[exit code %i]\n' % code)
+            checklines.append('[exit code %i]\n' % expected_code)
+            args = [checklines, outlines]
+            kwargs = {'fromfile': 'expected', 'tofile': 'got'}
+            diffs = ''.join(unified_diff(*args, **kwargs))
+            passed = not diffs
+
+            if not passed:
+                failures += 1
+                msg = "ERROR! Output from test #%i:\n  %s\n" % (
+                    num, short_command)
+                msg += "doesn't match:\n  %s\n" % expected
+                msg += diffs if diffs else ''
+            else:
+                logger.debug(output)
+                msg = 'Scripttest #%i: %s ... ok' % (num, short_command)
+
+            logger.info(msg)
+
+            if stop and failures:
+                break
+
+    remove_dirs()
     time = timer() - start
     logger.info('%s' % '-' * 70)
     end = 'FAILED (failures=%i)' % failures if failures else 'OK'
@@ -88,12 +113,24 @@ def main(script, tests, dir_, verbose=False, stop=True):
     sys.exit(failures)
 
 if __name__ == '__main__':
-    parent_dir = p.dirname(p.dirname(__file__))
-    script = p.join(parent_dir, 'bin', 'ongeza')
+    invalid_type = re.compile(
+        r"usage: ongeza \[options\] <dir>\n"
+        r"ongeza: error: argument -t/--type: invalid choice: '?x'?")
+
+    set_output = """Bumped from version 1.0.0 to 2.0.0.
+add files: "setup.py"
+making git commit: "Bump to version 2.0.0"
+"""
 
     tests = [
-        (['--help'], [], True),
-        (['--version'], [], 'ongeza v%s\n' % version),
+        (['--help'], [], ongeza_main.make_parser().format_help(), 0),
+        (['--version'], [], 'ongeza v%s\n' % version, 0),
+        (['--type', 'x'], [], invalid_type, 2),
+        ([], None, 'Current version: 1.0.0\n', 0),
+        (['-s', '2.0.0'], None, set_output, 0),
+        (['-tp', '-T'], None, BUMP_OUTPUT, 0),
+        (['-s', '1.0'], None,
+            "Invalid version: '1.0'. Please use x.y.z format.\n", 1),
     ]
 
-    main(script, tests, parent_dir)
+    main(tests)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+tests.test_aio
+~~~~~~~~~~~~~~
+
+Provides asyncio unit tests. `ongeza.aio` uses `async def`, so they are
+skipped before python 3.5.
+"""
+from __future__ import (
+    absolute_import, division, print_function, with_statement,
+    unicode_literals)
+
+import sys
+
+from unittest import SkipTest
+
+if sys.version_info < (3, 5):
+    raise SkipTest('ongeza.aio requires python 3.5 or later')
+
+import asyncio
+import threading
+import nose.tools as nt
+
+from io import open
+from os import path as p
+from builtins import *  # noqa pylint: disable=unused-import
+
+sys.path.append('../ongeza')
+from ongeza.aio import AsyncProject
+from tests import make_repo, remove_dirs
+
+
+def teardown_module():
+    """site cleanup"""
+    remove_dirs()
+
+
+class TestAsync:
+    """asyncio unit tests"""
+    def setUp(self):
+        setup = "setup(version='1.0.%i')\n"
+        self.dirs = [
+            make_repo({'setup.py': setup % i}, ['v1.0.%i' % i])
+            for i in range(3)]
+
+        # `gather` runs on the current loop
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_bump(self):
+        projects = [AsyncProject(dir_) for dir_ in self.dirs]
+        run = self.loop.run_until_complete
+
+        # each step runs concurrently for every project
+        bumps = asyncio.gather(*[project.ongeza('n') for project in projects])
+        new_versions = run(bumps)
+        pairs = zip(projects, new_versions)
+        run(asyncio.gather(*[prj.set_versions(ver) for prj, ver in pairs]))
+
+        for project in projects:
+            project.close()
+
+        nt.assert_equal([True] * 3, [project.bumped for project in projects])
+
+        for dir_ in self.dirs:
+            with open(p.join(dir_, 'setup.py'), encoding='utf-8') as f:
+                nt.assert_equal("setup(version='1.1.0')\n", f.read())
+
+    def test_queries(self):
+        project = AsyncProject(self.dirs[0])
+        run = self.loop.run_until_complete
+        nt.assert_equal('1.0.0', run(project.current_version()))
+        nt.assert_equal(['1.0.0'], list(run(project.versions())))
+        forks = project.forks
+
+        # answered from the snapshot
+        nt.assert_equal('1.0.0', project.sync.current_version)
+        nt.assert_equal(forks, project.forks)
+
+    def test_executor(self):
+        project = AsyncProject(self.dirs[0])
+        threads = []
+        ongeza = project.sync.ongeza
+
+        def record(type_):
+            threads.append(threading.current_thread())
+            return ongeza(type_)
+
+        # the synchronous work runs off the event loop's thread
+        project.sync.ongeza = record
+        new_version = self.loop.run_until_complete(project.ongeza('p'))
+        nt.assert_equal('1.0.1', new_version)
+        nt.assert_not_equal([threading.current_thread()], threads)
+        project.close()
@@ -11,18 +11,54 @@ from __future__ import (
     unicode_literals)
 
 import sys
+import json
+import subprocess
 import nose.tools as nt
 import pygogo as gogo
 
+from io import StringIO, open
+from datetime import date
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from os import path as p
 from builtins import *  # noqa pylint: disable=unused-import
 
 sys.path.append('../ongeza')
-from ongeza import __version__ as version, TRAVIS
+from ongeza import __version__ as version, TRAVIS, Project, main
 from ongeza.git_utils import Git
+from ongeza.file_utils import rewrite_version
+from ongeza.commit_utils import load_analysis, save_analysis
+from ongeza.locators import (
+    Locator, PluginLocator, Registry, LOCATORS, VALUE)
+from ongeza.ref_utils import RefReader
+from ongeza.monorepo import Monorepo
+from ongeza.daemon import make_server, request, forward
+from ongeza.fleet import run_fleet, process
+from ongeza.shell_utils import sh
+from ongeza.trace_utils import enable, disable, span
+from tests import (
+    git, make_dir, make_repo, make_remote, list_refs, remove_dirs)
 # from mock import patch
 
 module_logger = gogo.Gogo(__name__).logger
 
+# modules that `ongeza --version` must not import
+STARTUP_EXCLUDES = [
+    'argparse', 'concurrent.futures', 'logging', 'pygogo', 'semver',
+    'subprocess', 'tempfile', 'ongeza.git_utils']
+
+STARTUP_SCRIPT = """
+import sys
+from ongeza import main
+
+try:
+    main.run()
+except SystemExit:
+    pass
+
+print(' '.join(m for m in %r if m in sys.modules))
+"""
+
 
 def setup_module():
     """site initialization"""
@@ -31,6 +67,11 @@ def setup_module():
     print('Site Module Setup\n')
 
 
+def teardown_module():
+    """site cleanup"""
+    remove_dirs()
+
+
 class TestGit:
     """Git unit tests"""
     cls_initialized = False
@@ -56,6 +97,858 @@ class TestGit:
         nt.assert_greater_equal(len(tags), 7)
         nt.assert_equal('v0.8.0', tags[0])
 
+    def test_native_tags(self):
+        git = Git(make_repo(tags=['v1.0.0', 'v1.0.1', 'v1.1.0']))
+        tags = sh('git tag', True, git.dir).split('\n')
+        nt.assert_equal(tags, git.refs.tags())
+
+    def test_no_tags(self):
+        dir_ = make_repo(tags=[])
+        nt.assert_equal([], Git(dir_).tags)
+        nt.assert_equal([], Git(dir_, persistent=True).tags)
+
+
+class TestStartup:
+    """Startup import tests"""
+    def run_cli(self, *args):
+        cmd = [sys.executable, '-c', STARTUP_SCRIPT % STARTUP_EXCLUDES]
+        cmd += list(args)
+        root = p.dirname(p.dirname(p.abspath(__file__)))
+        output = subprocess.check_output(cmd, cwd=root)
+        lines = output.decode('utf-8').splitlines()
+        return lines[0], lines[-1].split()
+
+    def test_version(self):
+        for option in ['-v', '--version']:
+            line, modules = self.run_cli(option)
+            nt.assert_equal('ongeza v%s' % version, line)
+            nt.assert_equal([], modules)
+
+    def test_query(self):
+        line, modules = self.run_cli(make_repo())
+        nt.assert_equal('Current version: 1.0.0', line)
+        nt.assert_not_in('subprocess', modules)
+
+
+class TestCLI:
+    """In-process CLI unit tests"""
+    def run(self, *argv):
+        out = StringIO()
+        code = main.run(list(argv), out)
+        return code, out.getvalue()
+
+    def test_query(self):
+        nt.assert_equal((0, 'ongeza v%s\n' % version), self.run('-v'))
+        nt.assert_equal(2, self.run('-t', 'x')[0])
+
+        code, output = self.run(make_repo())
+        nt.assert_equal((0, 'Current version: 1.0.0\n'), (code, output))
+
+    def test_concurrent_bumps(self):
+        dirs = [make_repo() for _ in range(4)]
+
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(
+                lambda dir_: self.run('-t', 'p', '-T', dir_), dirs))
+
+        for (code, output), dir_ in zip(results, dirs):
+            nt.assert_equal(0, code)
+            nt.assert_true(output.startswith('Bumped from version 1.0.0'))
+            nt.assert_equal('v1.0.1', sh('git describe', True, dir_))
+
+        with open(p.join(dirs[1], 'setup.py'), 'a', encoding='utf-8') as f:
+            f.write('# dirty\n')
+
+        code, output = self.run('-t', 'p', dirs[1])
+        nt.assert_equal(1, code)
+        nt.assert_true(output.startswith("Can't bump the version"))
+
+
+class TestChangelog:
+    """Changelog generation unit tests"""
+    def setUp(self):
+        files = {
+            'setup.py': "setup(version='1.0.0')\n",
+            'CHANGES.rst': 'Version 1.0.0\n-------------\n'}
+
+        self.dir = make_repo(files)
+
+        for message in ['Add a parser', 'Fix the parser']:
+            git(self.dir, 'commit', '-q', '--allow-empty', '-m', message)
+
+    def run(self, *argv):
+        out = StringIO()
+        code = main.run(list(argv) + [self.dir], out)
+        return code, out.getvalue()
+
+    def read(self, name):
+        with open(p.join(self.dir, name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_print(self):
+        code, output = self.run('-t', 'p', '-S', '-C', '-')
+        nt.assert_equal(0, code)
+        nt.assert_in('Version 1.0.1\n', output)
+        entries = '    * Fix the parser\n    * Add a parser\n'
+        nt.assert_in(entries, output)
+        nt.assert_not_in('Initial commit', output)
+
+    def test_prepend(self):
+        code, output = self.run('-t', 'p', '-C', 'CHANGES.rst')
+        nt.assert_equal(0, code)
+        nt.assert_in('Added 2 commits to CHANGES.rst.', output)
+
+        content = self.read('CHANGES.rst')
+        released = date.today().isoformat()
+        section = (
+            'Version 1.0.1\n-------------\n\nReleased on %s\n\n'
+            '    * Fix the parser\n    * Add a parser\n\n\n' % released)
+
+        nt.assert_equal(section + 'Version 1.0.0\n-------------\n', content)
+        nt.assert_equal('', sh('git status --porcelain', True, self.dir))
+
+    def test_new_file(self):
+        code, output = self.run('-t', 'p', '-C', 'HISTORY.rst')
+        nt.assert_equal(0, code)
+
+        content = sh('git show HEAD:HISTORY.rst', True, self.dir)
+        nt.assert_true(content.startswith('Version 1.0.1\n'))
+        nt.assert_equal('', sh('git status --porcelain', True, self.dir))
+
+    def test_index(self):
+        with open(p.join(self.dir, 'CHANGES.rst'), 'a', encoding='utf-8') as f:
+            f.write('draft\n')
+
+        code, output = self.run('-t', 'p', '-I', '-C', 'CHANGES.rst')
+        nt.assert_equal(0, code)
+
+        content = sh('git show HEAD:CHANGES.rst', True, self.dir)
+        nt.assert_true(content.startswith('Version 1.0.1\n'))
+        nt.assert_not_in('draft', content)
+        nt.assert_true(self.read('CHANGES.rst').endswith('draft\n'))
+
+
+class TestAuto:
+    """Bump type inference unit tests"""
+    def setUp(self):
+        self.dir = make_repo()
+
+    def commit(self, *messages):
+        for message in messages:
+            git(self.dir, 'commit', '-q', '--allow-empty', '-m', message)
+
+    def test_infer(self):
+        project = Project(self.dir)
+        nt.assert_is_none(project.infer_type())
+
+        self.commit('docs: x', 'fix: y')
+        nt.assert_equal('p', project.infer_type())
+
+        self.commit('feat(cli): z')
+        nt.assert_equal('n', project.infer_type())
+
+        self.commit('refactor!: drop the parser', 'fix: w')
+        nt.assert_equal('m', project.infer_type())
+
+    def test_cache(self):
+        project = Project(self.dir)
+        self.commit('fix: y')
+        nt.assert_equal('p', project.infer_type())
+
+        filepath = project.cache_path('analysis')
+        analysis = load_analysis(filepath)
+        head = sh('git rev-parse HEAD', True, self.dir)
+        nt.assert_equal(('v1.0.0', head), (analysis['tag'], analysis['head']))
+
+        # only the new commits are read, so the cached verdict is kept
+        save_analysis(filepath, 'v1.0.0', head, 'n')
+        self.commit('fix: z')
+        nt.assert_equal('n', project.infer_type())
+
+        # a rewritten branch is analyzed from the tag again
+        git(self.dir, 'reset', '-q', '--hard', 'v1.0.0')
+        self.commit('fix: w')
+        nt.assert_equal('p', project.infer_type())
+
+    def test_cli(self):
+        out = StringIO()
+        nt.assert_equal(1, main.run(['-A', self.dir], out))
+        output = out.getvalue()
+        nt.assert_in('no commits since v1.0.0', output)
+        nt.assert_in('No new version to release.', output)
+        nt.assert_not_in("Couldn't find version", output)
+
+        self.commit('feat: x')
+        nt.assert_equal(0, main.run(['-t', 'auto', '-T', self.dir], out))
+        nt.assert_equal('v1.1.0', sh('git describe', True, self.dir))
+
+
+class TestPush:
+    """Atomic push unit tests (against a local bare remote)"""
+    def setUp(self):
+        # a stale tag the remote doesn't have
+        self.dir = make_repo(tags=['v0.9.0'])
+        git(self.dir, 'commit', '-q', '--allow-empty', '-m', 'Release')
+        git(self.dir, 'tag', 'v1.0.0')
+        self.remote = make_remote(self.dir)
+
+    def run(self, *argv):
+        out = StringIO()
+        code = main.run(list(argv) + [self.dir], out)
+        return code, out.getvalue()
+
+    def test_push(self):
+        project = Project(self.dir)
+        project.set_versions('1.0.1')
+        project.commit('Bump to version 1.0.1')
+        project.tag('Version 1.0.1 Release', 'v1.0.1')
+
+        forks = project.forks
+        results = project.push(['v1.0.1'])
+        head = sh('git rev-parse HEAD', True, self.dir)
+
+        # just the branch and new tag are sent (a single push, plus the
+        # local branch and remote lookups)
+        nt.assert_equal(3, project.forks - forks)
+        refs = ['refs/heads/master', 'refs/tags/v1.0.1']
+        nt.assert_equal(refs, sorted(r['dst'] for r in results))
+        nt.assert_equal(refs, sorted(list_refs(self.remote)))
+        nt.assert_equal(head, list_refs(self.remote)['refs/heads/master'])
+
+    def test_rejected(self):
+        git(self.dir, 'tag', 'v1.0.1')
+        git(self.dir, 'push', '-q', 'origin', 'v1.0.1')
+        git(self.dir, 'tag', '-d', 'v1.0.1')
+        refs = list_refs(self.remote)
+
+        code, output = self.run('-t', 'p', '-T', '-p')
+        nt.assert_equal(1, code)
+        nt.assert_in("Couldn't push", output)
+        nt.assert_in('refs/tags/v1.0.1 (already exists)', output)
+
+        # the branch isn't pushed either
+        nt.assert_equal(refs, list_refs(self.remote))
+
+    def test_unreachable(self):
+        git(self.dir, 'remote', 'set-url', 'origin', '/nonexistent')
+        code, output = self.run('-t', 'p', '-p')
+        nt.assert_equal(1, code)
+        nt.assert_in("Couldn't push to the remote.", output)
+
+
+class TestTrace:
+    """Tracing unit tests"""
+    def setUp(self):
+        self.dir = make_repo()
+        self.tracer = enable()
+
+    def tearDown(self):
+        disable()
+
+    def test_commands(self):
+        git_ = Git(self.dir)
+        nt.assert_true(git_.is_clean)
+        nt.assert_equal(['setup.py'], git_.files)
+
+        events = self.tracer.events
+        names = [event['name'] for event in events]
+        nt.assert_true(names[0].startswith('git status --porcelain -z'))
+        nt.assert_true(names[1].startswith('git ls-tree'))
+        nt.assert_equal(self.dir, events[0]['args']['cwd'])
+        nt.assert_equal(0, events[1]['args']['status'])
+        nt.assert_equal(len('setup.py') + 1, events[1]['args']['size'])
+
+    def test_chrome_trace(self):
+        with span('bump'):
+            Git(self.dir).is_clean
+
+        filepath = p.join(make_dir(), 'trace.json')
+        self.tracer.save(filepath)
+
+        with open(filepath, encoding='utf-8') as f:
+            events = json.load(f)['traceEvents']
+
+        nt.assert_equal(['command', 'phase'], [e['cat'] for e in events])
+        nt.assert_true(events[1]['dur'] >= events[0]['dur'])
+
+
+class TestSnapshot:
+    """Repository snapshot unit tests"""
+    def setUp(self):
+        self.project = Project(make_repo())
+
+    def test_queries(self):
+        project = self.project
+        nt.assert_true(project.is_clean)
+        nt.assert_false(project.is_dirty)
+        nt.assert_equal([], project.dirty_files)
+        nt.assert_equal(['v1.0.0'], project.tags)
+        nt.assert_equal(['v1.0.0'], project.tags)
+        forks = project.forks
+
+        nt.assert_equal('1.0.1', project.ongeza('p'))
+        nt.assert_equal('1.0.0', project.current_version)
+        nt.assert_equal(forks, project.forks)
+
+    def test_invalidation(self):
+        project = self.project
+        nt.assert_true(project.is_clean)
+
+        project.set_versions('1.0.1')
+        nt.assert_true(project.is_dirty)
+        nt.assert_equal(['setup.py'], project.dirty_files)
+
+        project.add(project.dirty_files)
+        nt.assert_equal([], project.dirty_files)
+        nt.assert_equal(set(['setup.py']), project.changed_files)
+
+        project.commit('Bump to version 1.0.1')
+        project.tag('Version 1.0.1 Release', 'v1.0.1')
+        nt.assert_equal(['v1.0.0', 'v1.0.1'], project.tags)
+        nt.assert_equal('v1.0.1', project.current_tag)
+        nt.assert_in('1.0.1', project.version_index)
+
+    def test_status(self):
+        project = self.project
+        filepath = p.join(project.dir, 'setup.py')
+
+        with open(filepath, 'a', encoding='utf-8') as f:
+            f.write('# comment\n')
+
+        nt.assert_true(project.is_dirty)
+        nt.assert_equal(['setup.py'], project.dirty_files)
+        nt.assert_equal({'setup.py': ' M'}, project.status)
+
+        # answered by a single `git status`
+        nt.assert_equal(1, project.forks)
+
+    def test_refresh(self):
+        project = self.project
+        nt.assert_equal(['v1.0.0'], project.tags)
+
+        git(project.dir, 'tag', 'v1.1.0')
+        nt.assert_equal(['v1.0.0'], project.tags)
+
+        project.refresh()
+        nt.assert_equal(['v1.0.0', 'v1.1.0'], project.tags)
+
+
+class TestIndexBump:
+    """Index (stash-free) bump unit tests"""
+    def setUp(self):
+        files = {
+            'setup.py': "setup(version='1.0.0')\n",
+            'pkg/__init__.py': "__version__ = '1.0.0'\n",
+            'README': 'readme\n'}
+
+        self.dir = make_repo(files)
+
+    def read(self, name):
+        with open(p.join(self.dir, name), encoding='utf-8') as f:
+            return f.read()
+
+    def write(self, name, content):
+        with open(p.join(self.dir, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def show(self, name):
+        return sh('git show HEAD:%s' % name, True, self.dir)
+
+    def test_dirty_tree(self):
+        self.write('README', 'changed\n')
+        self.write('setup.py', "setup(version='1.0.0', zip_safe=False)\n")
+        git(self.dir, 'add', 'setup.py')
+        status = sh('git status --porcelain', True, self.dir)
+
+        project = Project(self.dir, via_index=True)
+        project.set_versions('1.0.1')
+        nt.assert_true(project.commit_index('Bump to version 1.0.1'))
+        project.close()
+
+        nt.assert_equal("setup(version='1.0.1')", self.show('setup.py'))
+        nt.assert_equal("__version__ = '1.0.1'", self.show('pkg/__init__.py'))
+        nt.assert_equal('readme', self.show('README'))
+
+        # uncommitted changes are untouched, and the other bumped file is
+        # clean
+        setup = "setup(version='1.0.0', zip_safe=False)\n"
+        nt.assert_equal(setup, self.read('setup.py'))
+        nt.assert_equal('changed\n', self.read('README'))
+        init = "__version__ = '1.0.1'\n"
+        nt.assert_equal(init, self.read('pkg/__init__.py'))
+        nt.assert_equal(status, sh('git status --porcelain', True, self.dir))
+
+
+class TestThreads:
+    """Thread safety unit tests"""
+    def test_concurrent_projects(self):
+        versions = ['%i.0.0' % i for i in range(1, 5)]
+        dirs = [
+            make_repo({'setup.py': "setup(version='%s')" % v}, ['v' + v])
+            for v in versions]
+
+        def bump(dir_):
+            project = Project(dir_)
+            project.set_versions(project.ongeza('p'))
+            return project.bumped_files
+
+        def query(dir_):
+            return Project(dir_).current_version
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            bumped = list(executor.map(bump, dirs))
+            current_versions = list(executor.map(query, dirs * 5))
+
+        nt.assert_equal([['setup.py']] * 4, bumped)
+
+        nt.assert_equal(versions * 5, current_versions)
+
+
+class TestDaemon:
+    """Daemon unit tests"""
+    def setUp(self):
+        self.dir = make_repo()
+        self.socket_path = p.join(make_dir(), 'ongeza.sock')
+        self.server = make_server(self.socket_path)
+        kwargs = {'poll_interval': 0.05}
+        Thread(target=self.server.serve_forever, kwargs=kwargs).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send(self, *argv):
+        args = vars(main.get_parser().parse_args(list(argv) + [self.dir]))
+        return request(self.socket_path, {'args': args})
+
+    def test_query(self):
+        response = self.send()
+        nt.assert_equal(0, response['code'])
+        messages = response['messages']
+        nt.assert_equal([['info', 'Current version: 1.0.0']], messages)
+
+        # the refs are watched for changes
+        git(self.dir, 'commit', '-qm', 'Second commit', '--allow-empty')
+        git(self.dir, 'tag', 'v1.1.0')
+        messages = self.send()['messages']
+        nt.assert_equal([['info', 'Current version: 1.1.0']], messages)
+
+    def test_lock_per_dir(self):
+        self.send()
+        self.send('-x', '1024')
+
+        # each set of options has its own project, but they share a lock
+        repos = list(self.server.repos.values())
+        nt.assert_equal(2, len(repos))
+        nt.assert_equal([self.dir], list(self.server.locks))
+        nt.assert_is(repos[0].lock, repos[1].lock)
+
+    def test_bump(self):
+        response = self.send('-t', 'p', '-T')
+        nt.assert_equal(0, response['code'])
+        message = ['info', 'Bumped from version 1.0.0 to 1.0.1.']
+        nt.assert_in(message, response['messages'])
+        nt.assert_equal('v1.0.1', sh('git describe --tags', True, self.dir))
+
+        response = self.send('-t', 'p', '-S')
+        message = ['info', 'Bumped from version 1.0.1 to 1.0.2.']
+        nt.assert_in(message, response['messages'])
+
+        response = self.send('-t', 'p')
+        nt.assert_equal(1, response['code'])
+        nt.assert_equal('error', response['messages'][0][0])
+
+    def test_forward(self):
+        nt.assert_equal(0, forward(['-t', 'n', self.dir], self.socket_path))
+        nt.assert_is_none(forward(['-a', '-t', 'n'], self.socket_path))
+
+        with open(p.join(self.dir, 'setup.py'), encoding='utf-8') as f:
+            nt.assert_equal("setup(version='1.1.0')\n", f.read())
+
+
+class TestRefs:
+    """Native ref reader unit tests"""
+    def setUp(self):
+        self.dir = make_repo(tags=['v1.0.0', 'v1.0.1'])
+        git(self.dir, 'tag', '-am', 'Version 1.1.0', 'v1.1.0')
+        git(self.dir, 'commit', '-qm', 'Second commit', '--allow-empty')
+        git(self.dir, 'tag', 'v2.0.0')
+        git(self.dir, 'tag', '-am', 'Version 2.0.1', 'v2.0.1')
+
+    def check(self, dir_):
+        reader = RefReader.from_path(dir_)
+        tags = sh('git tag', True, dir_).split('\n')
+        current_tag = sh('git describe --tags --abbrev=0', True, dir_)
+        nt.assert_equal(tags, reader.tags())
+        nt.assert_equal(current_tag, reader.current_tag())
+
+    def test_loose_refs(self):
+        self.check(self.dir)
+
+    def test_packed_refs(self):
+        git(self.dir, 'pack-refs', '--all')
+        git(self.dir, 'gc', '-q')
+        self.check(self.dir)
+
+    def test_mixed_refs(self):
+        git(self.dir, 'pack-refs', '--all')
+        git(self.dir, 'tag', '-af', '-m', 'Version 2.0.1', 'v2.0.1')
+        self.check(self.dir)
+
+    def test_version_index(self):
+        index = Git(self.dir).version_index
+        nt.assert_equal('2.0.1', index.latest)
+        nt.assert_in('1.1.0', index)
+
+        git(self.dir, 'tag', 'v2.1.0')
+        index = Git(self.dir).version_index
+        nt.assert_equal('2.1.0', index.latest)
+
+        git(self.dir, 'pack-refs', '--all')
+        git(self.dir, 'tag', '-d', 'v2.1.0')
+        nt.assert_not_in('2.1.0', Git(self.dir).version_index)
+
+    def test_worktree(self):
+        worktree = p.join(self.dir, 'worktree')
+        git(self.dir, 'worktree', 'add', '-q', worktree, 'v1.1.0')
+        self.check(worktree)
+
+
+class TestLatest:
+    """Streaming version selection unit tests"""
+    def setUp(self):
+        self.dir = make_repo(tags=['v1.0.0', 'v1.0.1', 'v1.0.10-rc.1'])
+        head = sh('git rev-parse HEAD', True, self.dir)
+        versions = ['0.%i.%i' % (i // 30, i % 30) for i in range(3000)]
+        versions += ['3.0.0', '2.10.0', '2.9.0', 'junk']
+        lines = ['%s refs/tags/v%s' % (head, v) for v in versions]
+        filepath = p.join(self.dir, '.git', 'packed-refs')
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(['# pack-refs with: peeled'] + lines) + '\n')
+
+    def test_native(self):
+        project = Project(self.dir)
+        nt.assert_equal('3.0.0', project.latest_version)
+        top = ['3.0.0', '2.10.0', '2.9.0', '1.0.10-rc.1']
+        nt.assert_equal(top, project.top_versions(4))
+        nt.assert_equal(top[::-1], list(project.version_index)[-4:])
+
+        nt.assert_true(project.has_version('2.10.0'))
+        nt.assert_true(project.has_version('1.0.1'))
+        nt.assert_false(project.has_version('2.10.1'))
+        nt.assert_equal(0, project.forks)
+
+    def test_streamed(self):
+        project = Project(self.dir)
+        project._refs = False
+        nt.assert_equal('3.0.0', project.latest_version)
+        nt.assert_true(project.has_version('0.99.29'))
+        nt.assert_false(project.has_version('0.100.0'))
+        nt.assert_equal(3, project.forks)
+
+
+class TestFiles:
+    """Versioned file unit tests"""
+    def setUp(self):
+        self.filepath = p.join(make_dir(), 'fixture.json')
+        line = '{"version": "1.0.9"}\n'
+        padding = '{"data": "%s"}\n' % ('x' * 1000)
+
+        with open(self.filepath, 'w', encoding='utf-8') as f:
+            f.write(line + padding * 1000 + line)
+
+        self.size = p.getsize(self.filepath)
+
+    def read_lines(self):
+        with open(self.filepath, encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_rewrite_large_file(self):
+        nt.assert_true(rewrite_version(self.filepath, '1.0.10', '1.0.9'))
+        nt.assert_equal(p.getsize(self.filepath), self.size + 2)
+
+        lines = self.read_lines()
+        nt.assert_equal(lines[0], '{"version": "1.0.10"}')
+        nt.assert_equal(lines[-1], '{"version": "1.0.10"}')
+        nt.assert_equal(lines[500], '{"data": "%s"}' % ('x' * 1000))
+
+    def test_max_scan_size(self):
+        args = (self.filepath, '1.0.8', '1.0.9')
+        nt.assert_true(rewrite_version(*args, max_size=1024))
+        nt.assert_equal(p.getsize(self.filepath), self.size)
+
+        lines = self.read_lines()
+        nt.assert_equal(lines[0], '{"version": "1.0.8"}')
+        nt.assert_equal(lines[-1], '{"version": "1.0.9"}')
+
+    def test_atomic(self):
+        # even an edit which keeps the file's size replaces the file, so an
+        # open handle still reads the original
+        with open(self.filepath, 'rb') as f:
+            nt.assert_true(rewrite_version(self.filepath, '1.0.8', '1.0.9'))
+            nt.assert_equal(b'{"version": "1.0.9"}\n', f.readline())
+
+        nt.assert_equal(self.read_lines()[0], '{"version": "1.0.8"}')
+
+
+class TestLocations:
+    """Remembered version location unit tests"""
+    def setUp(self):
+        files = {
+            'setup.py': "setup(version='1.0.9')\n",
+            'pkg/__init__.py': "__version__ = '1.0.9'\n"}
+
+        self.dir = make_repo(files, ['v1.0.9'])
+
+    def bump(self, new_version, wave, listed=True):
+        project = Project(self.dir)
+
+        if not listed:
+            # fails if the tree is listed
+            project.gen_files = None
+
+        project.set_versions(new_version, wave)
+        return project
+
+    def test_remembered(self):
+        nt.assert_false(self.bump('1.0.10', 0).bumped)
+        nt.assert_true(self.bump('1.0.10', 1).bumped)
+
+        git(self.dir, 'commit', '-qam', 'Bump')
+        git(self.dir, 'tag', 'v1.0.10')
+        project = self.bump('1.1.0', 0, False)
+        files = ['pkg/__init__.py', 'setup.py']
+        nt.assert_equal(files, sorted(project.bumped_files))
+
+        with open(p.join(self.dir, 'setup.py'), encoding='utf-8') as f:
+            nt.assert_equal("setup(version='1.1.0')\n", f.read())
+
+    def test_stale(self):
+        self.bump('1.0.10', 1)
+        git(self.dir, 'commit', '-qam', 'Bump')
+        git(self.dir, 'tag', 'v1.0.10')
+
+        with open(p.join(self.dir, 'setup.py'), 'w', encoding='utf-8') as f:
+            f.write("# setup\nsetup(version='1.0.10')\n")
+
+        project = self.bump('1.1.0', 0)
+        nt.assert_false(project.bumped)
+
+        with open(p.join(self.dir, 'pkg/__init__.py'), encoding='utf-8') as f:
+            nt.assert_equal("__version__ = '1.0.10'\n", f.read())
+
+    def test_added_file(self):
+        self.bump('1.0.10', 1)
+        git(self.dir, 'commit', '-qam', 'Bump')
+        git(self.dir, 'tag', 'v1.0.10')
+        filepath = p.join(self.dir, 'package.json')
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write('{"version": "1.0.10"}\n')
+
+        git(self.dir, 'add', 'package.json')
+        git(self.dir, 'commit', '-qm', 'Add package.json')
+
+        # the files added since the last bump are found without listing the
+        # tree
+        project = self.bump('1.0.11', 0, False)
+        files = ['package.json', 'pkg/__init__.py', 'setup.py']
+        nt.assert_equal(files, sorted(project.bumped_files))
+
+        with open(filepath, encoding='utf-8') as f:
+            nt.assert_equal('{"version": "1.0.11"}\n', f.read())
+
+        nt.assert_equal(files, sorted(Project(self.dir).locations))
+
+
+class TestLocators:
+    """Format specific version locator unit tests"""
+    def setUp(self):
+        files = {
+            'package.json': (
+                '{\n  "description": "version 1.0.9 of x",\n'
+                '  "version": "1.0.9"\n}\n'),
+            'pyproject.toml': '[project]\nname = "x"\nversion = "1.0.9"\n',
+            'Cargo.toml': (
+                '[package]\nversion = "1.0.9"\n\n[dependencies]\n'
+                'serde = { version = "1.0.9" }\n')}
+
+        self.dir = make_repo(files, ['v1.0.9'])
+
+    def read(self, name):
+        with open(p.join(self.dir, name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_bump(self):
+        project = Project(self.dir)
+        project.set_versions('1.0.10')
+        files = ['Cargo.toml', 'package.json', 'pyproject.toml']
+        nt.assert_equal(files, sorted(project.bumped_files))
+
+        content = self.read('package.json')
+        nt.assert_in('"version": "1.0.10"', content)
+        nt.assert_in('"version 1.0.9 of x"', content)
+
+        content = self.read('Cargo.toml')
+        nt.assert_in('\nversion = "1.0.10"\n', content)
+        nt.assert_in('serde = { version = "1.0.9" }', content)
+
+    def test_several_fields(self):
+        content = (
+            '[bumpversion]\ncurrent_version = 1.0.9\n\n'
+            '[metadata]\nname = x\nversion = 1.0.9\n')
+
+        dir_ = make_repo({'setup.cfg': content}, ['v1.0.9'])
+        project = Project(dir_)
+        project.set_versions('1.0.10')
+        nt.assert_equal(['setup.cfg'], project.bumped_files)
+
+        with open(p.join(dir_, 'setup.cfg'), encoding='utf-8') as f:
+            nt.assert_equal(content.replace('1.0.9', '1.0.10'), f.read())
+
+    def test_plugins(self):
+        loaded = []
+
+        class EntryPoint(object):
+            name = '*.gradle'
+
+            def load(self):
+                loaded.append(self.name)
+                return Locator('gradle', [self.name], r"version '" + VALUE)
+
+        registry = Registry(LOCATORS)
+        registry._plugins = [PluginLocator(EntryPoint())]
+        nt.assert_equal('json', registry.find('package.json').name)
+        nt.assert_equal([], loaded)
+
+        nt.assert_equal('gradle', registry.find('build.gradle').name)
+        nt.assert_equal(['*.gradle'], loaded)
+
+
+class TestScan:
+    """Parallel wave 2 scanning unit tests"""
+    def setUp(self):
+        content = "__version__ = '%s'\n"
+        files = dict(
+            ('src/mod%02i.py' % i, content % ('1.0.9' if i % 3 else ''))
+            for i in range(20))
+
+        self.dir = make_repo(files, ['v1.0.9'])
+
+    def test_deterministic(self):
+        edits = list(Project(self.dir).gen_edits('1.0.10', 2))
+        nt.assert_equal(13, len(edits))
+
+        for workers in [2, 3, 8]:
+            project = Project(self.dir, scan_workers=workers)
+            nt.assert_equal(edits, list(project.gen_edits('1.0.10', 2)))
+
+    def test_bump(self):
+        project = Project(self.dir, scan_workers=4)
+        project.set_versions('1.0.10', 2)
+        files = sorted(project.bumped_files)
+        nt.assert_equal(files, project.bumped_files)
+        nt.assert_equal(13, len(files))
+
+        with open(p.join(self.dir, files[0]), encoding='utf-8') as f:
+            nt.assert_equal("__version__ = '1.0.10'\n", f.read())
+
+    def test_early_stop(self):
+        edits = Project(self.dir, scan_workers=2).gen_edits('1.0.10', 2)
+        nt.assert_equal('src/mod01.py', next(edits)[0])
+        edits.close()
+
+
+class TestMonorepo:
+    """Monorepo unit tests"""
+    def setUp(self):
+        files = {
+            'a/setup.py': "setup(version='1.0.0')\n",
+            'a/a/__init__.py': "__version__ = '1.0.0'\n",
+            'b/package.json': '{"version": "2.0.0"}\n',
+            'c/package.json': '{"version": "0.1.0"}\n'}
+
+        tags = ['a-v1.0.0', 'b-v2.0.0', 'c-v0.1.0']
+        self.dir = make_repo(files, tags)
+        self.monorepo = Monorepo(self.dir)
+
+    def test_packages(self):
+        packages = self.monorepo.packages
+        nt.assert_equal(['a', 'b', 'c'], sorted(packages))
+        nt.assert_equal('2.0.0', packages['b'].version)
+
+    def test_bump(self):
+        packages = self.monorepo.select(['a', 'b'])
+        bumped = self.monorepo.bump(packages, 'n')
+        versions = dict((pkg.name, v) for pkg, v in bumped)
+        nt.assert_equal({'a': '1.1.0', 'b': '2.1.0'}, versions)
+
+        self.monorepo.commit_bumps(bumped)
+        self.monorepo.tag_bumps(bumped)
+        nt.assert_true(self.monorepo.is_clean)
+
+        packages = Monorepo(self.dir).packages
+        nt.assert_equal('1.1.0', packages['a'].version)
+        nt.assert_equal('0.1.0', packages['c'].version)
+
+
+class TestFleet:
+    """Fleet batch mode unit tests"""
+    def setUp(self):
+        self.dirs = [make_repo(), make_repo(), make_repo(tags=[])]
+        self.results = p.join(self.dirs[0], 'results.jsonl')
+
+    def get_results(self, out):
+        lines = out.getvalue().splitlines()
+        results = [json.loads(line) for line in lines]
+        return dict((r['dir'], r) for r in results)
+
+    def test_query(self):
+        out = StringIO()
+        failures = run_fleet(self.dirs, [], jobs=2, out=out)
+        results = self.get_results(out)
+        nt.assert_equal(1, failures)
+        nt.assert_equal('1.0.0', results[self.dirs[0]]['version'])
+        nt.assert_equal('error', results[self.dirs[2]]['status'])
+
+    def test_bump_and_resume(self):
+        out = StringIO()
+        argv = ['-t', 'p', '-T']
+        run_fleet(self.dirs, argv, jobs=1, resume=self.results, out=out)
+        results = self.get_results(out)
+        nt.assert_equal('1.0.1', results[self.dirs[1]]['new_version'])
+        nt.assert_equal(3, len(results))
+
+        out = StringIO()
+        run_fleet(self.dirs, argv, jobs=1, resume=self.results, out=out)
+        nt.assert_equal([self.dirs[2]], list(self.get_results(out)))
+
+    def test_close_on_error(self):
+        closed = []
+        make_project = main.make_project
+
+        def record(args):
+            project = make_project(args)
+            close = project.close
+            project.close = lambda: closed.append(close())
+            return project
+
+        main.make_project = record
+
+        try:
+            result = process(self.dirs[0], ['-k', '-s', '1.0.0'])
+        finally:
+            main.make_project = make_project
+
+        nt.assert_equal('error', result['status'])
+        nt.assert_equal(1, len(closed))
+
+    def test_unsupported(self):
+        result = process(self.dirs[0], ['-m', '-t', 'p'])
+        nt.assert_equal('error', result['status'])
+        nt.assert_in('--monorepo', result['error'])
+
     # @patch('self.git.is_clean')
     # def test_normal(self, is_clean):
     #     """